@@ -0,0 +1,85 @@
+"""Compares the storage backends on the bots workload.
+
+Runs balance updates, message counts and flushes, deleted message history,
+baltop, bulk stock writes and a full scan against each backend that can be
+opened, printing the time each part took.
+
+Usage: python -m benchmarks.backends [members ...]
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+import orjson
+
+from cogs.utils.backends import lmdb
+from cogs.utils.database import Database
+
+
+async def balances(DB, member_ids):
+    for member_id in random.choices(member_ids, k=len(member_ids)):
+        await DB.add_bal(member_id, random.uniform(1, 1000))
+
+
+async def counts(DB, member_ids):
+    for member_id in random.choices(member_ids, k=len(member_ids) * 5):
+        DB.count(DB.message_count, b"740000000000000000-" + member_id)
+    await DB.flush_counts()
+
+
+async def history(DB, member_ids):
+    for member_id in random.choices(member_ids, k=len(member_ids) // 10):
+        await DB.add_history(DB.deleted, 740000000000000000, int(member_id), "hello")
+
+
+async def baltop(DB, member_ids):
+    for _ in range(100):
+        await DB.get_baltop(10)
+
+
+async def stocks(DB, member_ids):
+    data = {"price": "100.0", "name": "Stock", "change": "1.0", "cap": "1000"}
+    await DB.stocks.write(
+        [(f"STOCK{i}".encode(), orjson.dumps(data)) for i in range(5000)]
+    )
+
+
+async def scan(DB, member_ids):
+    await DB.stocks.items()
+    await DB.bal.items()
+
+
+WORKLOAD = (balances, counts, history, baltop, stocks, scan)
+
+
+async def bench(backend, members):
+    with tempfile.TemporaryDirectory() as directory:
+        DB = Database(directory, backend=backend, balance_cache_size=0)
+        member_ids = [str(m).encode() for m in range(10**17, 10**17 + members)]
+        times = []
+
+        random.seed(0)
+        for part in WORKLOAD:
+            start = time.perf_counter()
+            await part(DB, member_ids)
+            await DB.flush()
+            times.append(f"{part.__name__} {time.perf_counter() - start:6.2f}s")
+
+        print(f"{backend:>7} {members:>9,} members | " + " | ".join(times))
+        await DB.close()
+
+
+async def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1_000, 10_000]
+    backends = ["leveldb", "memory"] + (["lmdb"] if lmdb else [])
+
+    for members in sizes:
+        for backend in backends:
+            await bench(backend, members)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
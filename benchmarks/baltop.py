@@ -0,0 +1,70 @@
+"""Compares getting the baltop from the sorted index to sorting every balance.
+
+Usage: python -m benchmarks.baltop [members ...]
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+from cogs.utils.database import Database
+
+
+def full_scan(DB, amount):
+    """The old baltop, decodes and sorts every balance."""
+    balances = [(DB.bal.decode(b), int(m)) for m, b in DB.bal.db]
+    return sorted(balances, reverse=True)[:amount]
+
+
+def index_read(DB, amount):
+    """Reads the top balances from the baltop index."""
+    return [(b, int(m)) for m, b in DB.baltop._range(amount, None, True)]
+
+
+def timeit(func, *args, repeat=5):
+    """Returns the fastest time of running func in milliseconds."""
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    return min(times) * 1000
+
+
+async def bench(members):
+    with tempfile.TemporaryDirectory() as directory:
+        DB = Database(directory, balance_cache_size=0)
+        balances = {
+            str(member_id).encode(): round(random.uniform(-1e4, 1e9), 2)
+            for member_id in range(10**17, 10**17 + members)
+        }
+
+        start = time.perf_counter()
+        await DB.write_balances(balances)
+        write = time.perf_counter() - start
+
+        assert full_scan(DB, 10) == index_read(DB, 10)
+
+        scan = timeit(full_scan, DB, 10)
+        index = timeit(index_read, DB, 10)
+
+        print(
+            f"{members:>9,} members | write {write:6.2f}s | "
+            f"scan {scan:9.2f}ms | index {index:6.3f}ms | {scan / index:,.0f}x"
+        )
+        await DB.close()
+
+
+async def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    for members in sizes:
+        await bench(members)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
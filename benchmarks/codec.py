@@ -0,0 +1,124 @@
+"""Compares balances stored as text to balances packed with FloatCodec.
+
+Writes the same balances, karma and message counts as text then migrates
+them, measuring the parse cost of every value and the size on disk. Only
+balances are packed, counters stay text as int() parses them fastest.
+
+Usage: python -m benchmarks.codec [members ...]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from cogs.utils.database import CODECS, FLOAT, Database
+
+
+def parse_text(values):
+    """The old parsing, float() for balances and int() for counters."""
+    for name, data in values.items():
+        parse = float if name == "bal" else int
+        [parse(value) for value in data]
+
+
+def parse_codec(values):
+    """Decodes balances like NetWorths.load and counters with their codec."""
+    for name, data in values.items():
+        if name == "bal":
+            FLOAT.decode_packed(data)
+        else:
+            decode = CODECS[name].decode
+            [decode(value) for value in data]
+
+
+def parse_balances(values, parse):
+    """Times only the balances."""
+    parse({"bal": values["bal"]})
+
+
+def read_values(DB):
+    """Returns the values of every number by prefix."""
+    return {
+        name: list(getattr(DB, name).db.iterator(include_key=False)) for name in CODECS
+    }
+
+
+def disk_size(DB, directory):
+    """Compacts the database and returns the size of its files in bytes."""
+    # Without a range leveldb skips merging the level 0 tables
+    DB.db.compact_range(start=b"\x00", stop=b"\xff")
+
+    return sum(
+        os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+    )
+
+
+def timeit(func, *args, repeat=5):
+    """Returns the fastest time of running func in milliseconds."""
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    return min(times) * 1000
+
+
+async def bench(members):
+    with tempfile.TemporaryDirectory() as directory:
+        DB = Database(directory, balance_cache_size=0)
+        member_ids = [str(m).encode() for m in range(10**17, 10**17 + members)]
+
+        # Written as text like the bot did before the codecs
+        await DB.bal.write(
+            [(m, str(round(random.uniform(-1e4, 1e9), 2)).encode()) for m in member_ids]
+        )
+        await DB.karma.write(
+            [(m, str(random.randint(-50, 500)).encode()) for m in member_ids]
+        )
+        await DB.message_count.write(
+            [
+                (b"740000000000000000-" + m, str(random.randint(0, 10**5)).encode())
+                for m in member_ids
+            ]
+        )
+
+        text = read_values(DB)
+        text_bytes = sum(len(value) for data in text.values() for value in data)
+        text_disk = disk_size(DB, directory)
+        text_parse = timeit(parse_text, text)
+        text_bal = timeit(parse_balances, text, parse_text)
+
+        start = time.perf_counter()
+        await DB.run_migration(2)
+        migrate = time.perf_counter() - start
+
+        packed = read_values(DB)
+        packed_bytes = sum(len(value) for data in packed.values() for value in data)
+        packed_disk = disk_size(DB, directory)
+        packed_parse = timeit(parse_codec, packed)
+        packed_bal = timeit(parse_balances, packed, parse_codec)
+
+        print(
+            f"{members:>9,} members | migrate {migrate:6.2f}s | "
+            f"parse {text_parse:8.2f}ms -> {packed_parse:8.2f}ms "
+            f"(bal {text_bal:7.2f}ms -> {packed_bal:7.2f}ms) | "
+            f"values {text_bytes / 1024:9,.0f}KiB -> {packed_bytes / 1024:9,.0f}KiB | "
+            f"disk {text_disk / 1024:9,.0f}KiB -> {packed_disk / 1024:9,.0f}KiB"
+        )
+        await DB.close()
+
+
+async def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000]
+
+    for members in sizes:
+        await bench(members)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
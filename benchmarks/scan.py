@@ -0,0 +1,78 @@
+"""Compares reading a whole prefix with items to a chunked snapshot scan.
+
+Reads and decodes every balance like nettop, measuring the total time and
+the longest the event loop went without running a 1ms ticker.
+
+Usage: python -m benchmarks.scan [members ...]
+"""
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+from cogs.utils.database import Database
+
+
+async def items(DB):
+    return [(m, DB.bal.decode(b)) for m, b in await DB.bal.items()]
+
+
+async def scan(DB):
+    balances = []
+    async for chunk in DB.bal.scan(lambda m, b: (m, DB.bal.decode(b))):
+        balances.extend(chunk)
+    return balances
+
+
+async def ticker(stalls):
+    """Records the longest gap between ticks of a 1ms sleep."""
+    last = time.perf_counter()
+
+    while True:
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last)
+        last = now
+
+
+async def bench(members):
+    with tempfile.TemporaryDirectory() as directory:
+        DB = Database(directory, balance_cache_size=0)
+        await DB.bal.write(
+            [
+                (str(m).encode(), DB.bal.encode(random.uniform(0, 1e6)))
+                for m in range(10**17, 10**17 + members)
+            ]
+        )
+
+        for read in (items, scan):
+            stalls = []
+            task = asyncio.create_task(ticker(stalls))
+            await asyncio.sleep(0.01)
+
+            start = time.perf_counter()
+            await read(DB)
+            duration = time.perf_counter() - start
+
+            # Lets the ticker record the gap the read ended in
+            await asyncio.sleep(0.01)
+            task.cancel()
+            print(
+                f"{read.__name__:>5} {members:>9,} members | {duration * 1000:8.2f}ms"
+                f" | longest stall {max(stalls) * 1000:7.2f}ms"
+            )
+
+        await DB.close()
+
+
+async def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [100_000, 1_000_000]
+
+    for members in sizes:
+        await bench(members)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""Compares a burst of event handler writes put one at a time to the write queue.
+
+Each event reads a members nick history and writes it back like
+on_member_update, as happens during a raid or a mass edit.
+
+Usage: python -m benchmarks.write_queue [events ...]
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+
+import orjson
+
+from cogs.utils.database import Database
+
+
+async def direct(DB, member_id):
+    nicks = orjson.loads(await DB.nicks.get(member_id, b'{"nicks": {}}'))
+    nicks["nicks"][str(time.time())] = "nick"
+    await DB.nicks.put(member_id, orjson.dumps(nicks))
+
+
+async def queued(DB, member_id):
+    nicks = orjson.loads(await DB.nicks.get(member_id, b'{"nicks": {}}'))
+    nicks["nicks"][str(time.time())] = "nick"
+    DB.nicks.queue_put(member_id, orjson.dumps(nicks))
+
+
+async def bench(events):
+    for handler in (direct, queued):
+        with tempfile.TemporaryDirectory() as directory:
+            DB = Database(directory)
+            member_ids = [str(i % 1000).encode() for i in range(events)]
+
+            start = time.perf_counter()
+            await asyncio.gather(*[handler(DB, m) for m in member_ids])
+            await DB.flush()
+            duration = time.perf_counter() - start
+
+            print(
+                f"{handler.__name__:>6} {events:>7,} events | {duration:6.2f}s | "
+                f"{events / duration:9,.0f} events/s | "
+                f"{DB.executor.calls:>7,} executor calls"
+            )
+            await DB.close()
+
+
+async def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000]
+
+    for events in sizes:
+        await bench(events)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -26,13 +26,17 @@ log.addHandler(handler)
 
 
 class Bot(commands.Bot):
-    """A subclass of discord.ext.commands.Bot."""
+    """A subclass of discord.ext.commands.Bot.
 
-    def __init__(self, *args, **kwargs):
+    database: dict
+        Options for Database, defaults to the database dict in config.py.
+    """
+
+    def __init__(self, *args, database=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.client_session = None
-        self.DB = Database()
+        self.DB = Database(**(database or getattr(config, "database", {})))
 
     @classmethod
     def create(cls) -> commands.Bot:
@@ -80,7 +84,7 @@ class Bot(commands.Bot):
             return None
 
     async def close(self) -> None:
-        """Close the Discord connection and the aiohttp session."""
+        """Close the Discord connection, the aiohttp session and the database."""
         for ext in list(self.extensions):
             with suppress(Exception):
                 self.unload_extension(ext)
@@ -89,16 +93,21 @@ class Bot(commands.Bot):
             with suppress(Exception):
                 self.remove_cog(cog)
 
-        await super().close()
+        try:
+            await super().close()
 
-        if self.client_session:
-            await self.client_session.close()
+            if self.client_session:
+                await self.client_session.close()
+        finally:
+            # Drains the write queue and caches so nothing queued is lost
+            await self.DB.close()
 
     async def login(self, *args, **kwargs) -> None:
-        """Setup the client_session before logging in."""
+        """Setup the client_session and migrate the database before logging in."""
         self.client_session = aiohttp.ClientSession(
             timeout=aiohttp.ClientTimeout(total=6)
         )
+        await self.DB.migrate()
 
         await super().login(*args, **kwargs)
 
@@ -1,3 +1,5 @@
+import asyncio
+
 from discord.ext import commands
 import discord
 import orjson
@@ -44,13 +46,15 @@ class admin(commands.Cog):
     async def togglelog(self, ctx):
         """Toggles logging to the logs channel."""
         key = f"{ctx.guild.id}-logging".encode()
-        if self.DB.main.get(key):
-            self.DB.main.delete(key)
+        if await self.DB.main.get(key):
+            await self.DB.main.delete(key)
             tenary = "Enabled"
         else:
-            self.DB.main.put(key, b"1")
+            await self.DB.main.put(key, b"1")
             tenary = "Disabled"
 
+        self.DB.invalidate_guild_settings(ctx.guild.id)
+
         embed = discord.Embed(color=discord.Color.blurple())
         embed.description = f"```{tenary} logging```"
         await ctx.send(embed=embed)
@@ -63,7 +67,7 @@ class admin(commands.Cog):
             The number of the rule to delete starting from 1.
         """
         key = f"{ctx.guild.id}-rules".encode()
-        rules = self.DB.main.get(key)
+        rules = await self.DB.main.get(key)
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not rules:
@@ -77,7 +81,7 @@ class admin(commands.Cog):
             return await ctx.send(embed=embed)
 
         rule = rules.pop(number - 1)
-        self.DB.main.put(key, orjson.dumps(rules))
+        await self.DB.main.put(key, orjson.dumps(rules))
         embed.description = f"```Removed rule {rule}.```"
         await ctx.send(embed=embed)
 
@@ -89,7 +93,7 @@ class admin(commands.Cog):
             The rule to add.
         """
         key = f"{ctx.guild.id}-rules".encode()
-        rules = self.DB.main.get(key)
+        rules = await self.DB.main.get(key)
 
         if not rules:
             rules = []
@@ -103,7 +107,7 @@ class admin(commands.Cog):
                 description=f"```Added rule {len(rules)}\n{rule}```",
             )
         )
-        self.DB.main.put(key, orjson.dumps(rules))
+        await self.DB.main.put(key, orjson.dumps(rules))
 
     @commands.command(aliases=["disablech"])
     async def disable_channel(self, ctx, channel: discord.TextChannel = None):
@@ -115,7 +119,7 @@ class admin(commands.Cog):
         guild = str(ctx.guild.id)
         key = f"{guild}-disabled_channels".encode()
 
-        disabled = self.DB.main.get(key)
+        disabled = await self.DB.main.get(key)
 
         if not disabled:
             disabled = {}
@@ -136,7 +140,8 @@ class admin(commands.Cog):
         embed.description = f"```Commands {tenary} in {channel}```"
 
         await ctx.send(embed=embed)
-        self.DB.main.put(key, orjson.dumps(disabled))
+        await self.DB.main.put(key, orjson.dumps(disabled))
+        self.DB.invalidate_guild_settings(ctx.guild.id)
 
     @commands.command()
     @commands.cooldown(1, 86400, commands.BucketType.user)
@@ -171,7 +176,8 @@ class admin(commands.Cog):
 
         message = await ctx.send(msg)
 
-        self.DB.rrole.put(str(message.id).encode(), orjson.dumps(rrole))
+        await self.DB.rrole.put(str(message.id).encode(), orjson.dumps(rrole))
+        self.DB.reaction_messages.add(message.id)
         for name in roles:
             await message.add_reaction(roles[name][1])
 
@@ -189,20 +195,20 @@ class admin(commands.Cog):
             key = f"{ctx.guild.id}-{channel.id}-lock".encode()
 
             if perms.send_messages is False and state is False:
-                self.DB.main.put(key, b"1")
+                await self.DB.main.put(key, b"1")
             elif perms.send_messages is True and state is False:
-                self.DB.main.put(key, b"0")
+                await self.DB.main.put(key, b"0")
                 perms.send_messages = False
                 await channel.set_permissions(ctx.guild.default_role, overwrite=perms)
-            elif (data := self.DB.main.get(key)) == b"0":
+            elif (data := await self.DB.main.get(key)) == b"0":
                 perms.send_messages = True
                 await channel.set_permissions(ctx.guild.default_role, overwrite=perms)
-                self.DB.main.delete(key)
+                await self.DB.main.delete(key)
             elif not data:
                 perms.send_messages = state
                 await channel.set_permissions(ctx.guild.default_role, overwrite=perms)
             else:
-                self.DB.main.delete(key)
+                await self.DB.main.delete(key)
 
         embed = discord.Embed(color=discord.Color.blurple())
         if toggle:
@@ -236,21 +242,23 @@ class admin(commands.Cog):
             return await ctx.send(embed=embed)
 
         key = f"{ctx.guild.id}-{command}".encode()
-        state = self.DB.main.get(key)
+        state = await self.DB.main.get(key)
 
         if not state:
-            self.DB.main.put(key, b"1")
+            await self.DB.main.put(key, b"1")
+            self.DB.invalidate_guild_settings(ctx.guild.id)
             embed.description = f"```Disabled the {command} command```"
             return await ctx.send(embed=embed)
 
-        self.DB.main.delete(key)
+        await self.DB.main.delete(key)
+        self.DB.invalidate_guild_settings(ctx.guild.id)
         embed.description = f"```Enabled the {command} command```"
         return await ctx.send(embed=embed)
 
     @commands.command()
     async def emojis(self, ctx):
         """Shows a list of the current emojis being voted on."""
-        emojis = self.DB.main.get(b"emoji_submissions")
+        emojis = await self.DB.main.get(b"emoji_submissions")
 
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -279,7 +287,7 @@ class admin(commands.Cog):
         message_id: str
             Id of the message to remove from the db.
         """
-        emojis = self.DB.main.get(b"emoji_submissions")
+        emojis = await self.DB.main.get(b"emoji_submissions")
 
         if not emojis:
             emojis = {}
@@ -288,10 +296,11 @@ class admin(commands.Cog):
 
         try:
             emojis.pop(message_id)
+            self.DB.reaction_messages.discard(int(message_id))
         except KeyError:
             await ctx.send(f"Message {message_id} not found in emojis")
 
-        self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
+        await self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
 
     @commands.command(aliases=["aemoji"])
     async def add_emoji(self, ctx, message_id, name):
@@ -300,7 +309,7 @@ class admin(commands.Cog):
         message_id: int
             Id of the message you are adding the emoji of.
         """
-        emojis = self.DB.main.get(b"emoji_submissions")
+        emojis = await self.DB.main.get(b"emoji_submissions")
 
         if not emojis:
             emojis = {}
@@ -309,7 +318,8 @@ class admin(commands.Cog):
 
         emojis[message_id] = {"name": name, "users": []}
 
-        self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
+        await self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
+        self.DB.reaction_messages.add(int(message_id))
 
     @commands.command()
     async def edit(self, ctx, message: discord.Message, *, content):
@@ -386,14 +396,18 @@ class admin(commands.Cog):
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not member:
-            if list(self.DB.blacklist) == []:
+            keys = []
+            async for chunk in self.DB.blacklist.scan(
+                lambda key, value: key.decode().split("-")
+            ):
+                keys.extend(chunk)
+
+            if not keys:
                 embed.title = "No downvoted users"
                 return await ctx.send(embed=embed)
 
             embed.title = "Downvoted users"
-            for member_id in self.DB.blacklist.iterator(include_value=False):
-                member_id = member_id.decode().split("-")
-
+            for member_id in keys:
                 if len(member_id) > 1:
                     guild, member_id = member_id
                     guild = self.bot.get_guild(int(guild))
@@ -411,10 +425,8 @@ class admin(commands.Cog):
             embed.description = "Bots cannot be added to the downvote list"
             return await ctx.send(embed=embed)
 
-        member_id = f"{ctx.guild.id}-{str(member.id)}".encode()
-
-        if self.DB.blacklist.get(member_id):
-            self.DB.blacklist.delete(member_id)
+        if (ctx.guild.id, member.id) in self.DB.blacklisted:
+            await self.DB.set_blacklist(member.id, None, ctx.guild.id)
 
             embed.title = "User Undownvoted"
             embed.description = (
@@ -425,7 +437,7 @@ class admin(commands.Cog):
         await member.edit(voice_channel=None)
 
         if not duration:
-            self.DB.blacklist.put(member_id, b"1")
+            await self.DB.set_blacklist(member.id, b"1", ctx.guild.id)
             embed.title = "User Downvoted"
             embed.description = f"**{member}** has been added to the downvote list"
             return await ctx.send(embed=embed)
@@ -436,8 +448,12 @@ class admin(commands.Cog):
             embed.description = "```Invalid duration. Example: '3d 5h 10m'```"
             return await ctx.send(embed=embed)
 
-        self.DB.blacklist.put(member_id, b"1")
-        self.loop.call_later(seconds, self.DB.blacklist.delete, member_id)
+        await self.DB.set_blacklist(member.id, b"1", ctx.guild.id)
+        self.loop.call_later(
+            seconds,
+            asyncio.create_task,
+            self.DB.set_blacklist(member.id, None, ctx.guild.id),
+        )
 
         embed.title = "User Undownvoted"
         embed.description = f"***{member}*** has been added from the downvote list"
@@ -452,14 +468,18 @@ class admin(commands.Cog):
         """
         embed = discord.Embed(color=discord.Color.blurple())
         if not user:
-            if list(self.DB.blacklist) == []:
+            keys = []
+            async for chunk in self.DB.blacklist.scan(
+                lambda key, value: key.decode().split("-")
+            ):
+                keys.extend(chunk)
+
+            if not keys:
                 embed.title = "No blacklisted users"
                 return await ctx.send(embed=embed)
 
             embed.title = "Blacklisted users"
-            for member_id in self.DB.blacklist.iterator(include_value=False):
-                member_id = member_id.decode().split("-")
-
+            for member_id in keys:
                 if len(member_id) > 1:
                     guild, member_id = member_id
                     guild = self.bot.get_guild(int(guild))
@@ -473,15 +493,14 @@ class admin(commands.Cog):
 
             return await ctx.send(embed=embed)
 
-        user_id = f"{ctx.guild.id}-{str(user.id)}".encode()
-        if self.DB.blacklist.get(user_id):
-            self.DB.blacklist.delete(user_id)
+        if (ctx.guild.id, user.id) in self.DB.blacklisted:
+            await self.DB.set_blacklist(user.id, None, ctx.guild.id)
 
             embed.title = "User Unblacklisted"
             embed.description = f"***{user}*** has been unblacklisted"
             return await ctx.send(embed=embed)
 
-        self.DB.blacklist.put(user_id, b"2")
+        await self.DB.set_blacklist(user.id, b"2", ctx.guild.id)
         embed.title = "User Blacklisted"
         embed.description = f"**{user}** has been added to the blacklist"
 
@@ -1,3 +1,4 @@
+import asyncio
 import html
 import random
 import re
@@ -829,7 +830,7 @@ class apis(commands.Cog):
             The term to search for.
         """
         cache_search = f"urban-{search}"
-        cache = orjson.loads(self.DB.main.get(b"cache"))
+        cache = orjson.loads(await self.DB.main.get(b"cache"))
 
         embed = discord.Embed(colour=discord.Color.blurple())
 
@@ -869,8 +870,10 @@ class apis(commands.Cog):
             defin["thumbs_up"],
         )
 
-        self.DB.main.put(b"cache", orjson.dumps(cache))
-        self.loop.call_later(300, self.DB.delete_cache, cache_search, cache)
+        await self.DB.main.put(b"cache", orjson.dumps(cache))
+        self.loop.call_later(
+            300, asyncio.create_task, self.DB.delete_cache(cache_search, cache)
+        )
         await ctx.send(embed=embed)
 
     @commands.command()
@@ -1050,7 +1053,7 @@ class apis(commands.Cog):
             The gif search term.
         """
         cache_search = f"tenor-{search}"
-        cache = orjson.loads(self.DB.main.get(b"cache"))
+        cache = orjson.loads(await self.DB.main.get(b"cache"))
 
         if cache_search in cache:
             url = random.choice(cache[cache_search])
@@ -1059,7 +1062,7 @@ class apis(commands.Cog):
             if len(cache[cache_search]) == 0:
                 cache.pop(cache_search)
 
-            self.DB.main.put(b"cache", orjson.dumps(cache))
+            await self.DB.main.put(b"cache", orjson.dumps(cache))
 
             return await ctx.send(url)
 
@@ -1073,8 +1076,10 @@ class apis(commands.Cog):
         tenor.remove(image)
         cache[cache_search] = tenor
 
-        self.DB.main.put(b"cache", orjson.dumps(cache))
-        self.loop.call_later(300, self.DB.delete_cache, cache_search, cache)
+        await self.DB.main.put(b"cache", orjson.dumps(cache))
+        self.loop.call_later(
+            300, asyncio.create_task, self.DB.delete_cache(cache_search, cache)
+        )
         await ctx.send(image)
 
 
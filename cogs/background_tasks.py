@@ -1,12 +1,84 @@
+import asyncio
+import logging
 import os
+import time
 
 from discord.ext import commands, tasks
 import discord
 import orjson
 
+from cogs.utils.database import PriceTable, crypto_row, prune_backups, stock_row
 from cogs.utils.useful import run_process
 
 
+async def read_body(response, chunk_size=65536):
+    """Reads a response body as it streams in.
+
+    response: aiohttp.ClientResponse
+    chunk_size: int
+    """
+    body = bytearray()
+
+    async for chunk in response.content.iter_chunked(chunk_size):
+        body += chunk
+
+    return body
+
+
+def parse_stocks(body):
+    """Builds the stock puts and price table from the nasdaq screener.
+
+    Run off the event loop as there are around 50k rows.
+
+    body: bytearray
+    """
+    puts = []
+    rows = []
+
+    for stock in orjson.loads(body)["data"]["table"]["rows"]:
+        stock_data = {
+            "name": stock["name"],
+            "price": stock["lastsale"][1:],
+            "change": stock["netchange"],
+            "%change": stock["pctchange"][:-1] if stock["pctchange"] != "--" else 0,
+            "cap": stock["marketCap"],
+        }
+
+        puts.append((stock["symbol"].encode(), orjson.dumps(stock_data)))
+        rows.append(stock_row(stock["symbol"], stock_data))
+
+    return puts, PriceTable(rows)
+
+
+def parse_crypto(body):
+    """Builds the crypto puts and price table from the coinmarketcap listing.
+
+    body: bytearray
+    """
+    puts = []
+    rows = []
+
+    for coin in orjson.loads(body)["data"]["cryptoCurrencyList"]:
+        if "price" not in coin["quotes"][0]:
+            continue
+
+        coin_data = {
+            "name": coin["name"],
+            "id": coin["id"],
+            "price": coin["quotes"][0]["price"],
+            "circulating_supply": coin["circulatingSupply"],
+            "max_supply": coin.get("maxSupply", 0),
+            "market_cap": coin["quotes"][0].get("marketCap", 0),
+            "change_24h": coin["quotes"][0]["percentChange24h"],
+            "volume_24h": coin["quotes"][0].get("volume24h", 0),
+        }
+
+        puts.append((coin["symbol"].encode(), orjson.dumps(coin_data)))
+        rows.append(crypto_row(coin["symbol"], coin_data))
+
+    return puts, PriceTable(rows)
+
+
 class background_tasks(commands.Cog):
     """Commands related to the background tasks of the bot."""
 
@@ -180,6 +252,9 @@ class background_tasks(commands.Cog):
         backup              6h 0m 0s       True/False/5
         update_languages    0h 0m 0s       False/False/0
         update_crypto       0h 10m 0s      True/False/146
+        prune_history       24h 0m 0s      True/False/30
+        compact_db          1h 0m 0s       True/False/720
+        flush_db            0h 0m 5s       True/False/518400
         """
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -205,24 +280,16 @@ class background_tasks(commands.Cog):
             "accept-language": "en-US,en;q=0.9",
         }
         async with self.bot.client_session.get(url, headers=headers) as response:
-            stocks = await response.json()
-
-        with self.DB.stocks.write_batch() as wb:
-            for stock in stocks["data"]["table"]["rows"]:
-                stock_data = {
-                    "name": stock["name"],
-                    "price": stock["lastsale"][1:],
-                    "change": stock["netchange"],
-                    "%change": stock["pctchange"][:-1]
-                    if stock["pctchange"] != "--"
-                    else 0,
-                    "cap": stock["marketCap"],
-                }
-
-                wb.put(
-                    stock["symbol"].encode(),
-                    orjson.dumps(stock_data),
-                )
+            body = await read_body(response)
+
+        puts, prices = await self.bot.loop.run_in_executor(None, parse_stocks, body)
+
+        # Nothing was parsed so the last prices are kept
+        if await self.DB.write_market(self.DB.stocks, puts) is None:
+            return
+
+        await self.DB.record_prices(self.DB.stocks, prices)
+        await self.DB.publish_prices(self.DB.stocks, prices)
 
     @tasks.loop(minutes=5)
     async def update_bot(self):
@@ -251,39 +318,19 @@ class background_tasks(commands.Cog):
     @tasks.loop(hours=6)
     async def backup(self):
         """Makes a backup of the db every 6 hours."""
-        if self.DB.main.get(b"restart") == b"1":
-            return self.DB.main.delete(b"restart")
-
-        number = self.DB.main.get(b"backup_number")
-
-        if not number:
-            number = -1
-        else:
-            number = int(number.decode())
-
-        number = (number + 1) % 11
-
-        self.DB.main.put(b"backup_number", str(number).encode())
+        if await self.DB.main.get(b"restart") == b"1":
+            return await self.DB.main.delete(b"restart")
 
         os.makedirs("backup/", exist_ok=True)
-        with open(f"backup/{number}backup.json", "w", encoding="utf-8") as file:
-            database = {}
-
-            excluded = (
-                b"crypto",
-                b"stocks",
-                b"boot_times",
-            )
 
-            for key, value in self.DB.main:
-                if key.split(b"-")[0] not in excluded:
-                    if value[:1] in [b"{", b"["]:
-                        value = orjson.loads(value)
-                    else:
-                        value = value.decode()
-                    database[key.decode()] = value
+        # A full backup a day with incremental backups of the changes between
+        journal_start = self.DB.journal_start
+        full = journal_start is None or time.time() - journal_start >= 86400
 
-            file.write(str(database))
+        await self.DB.backup(
+            "backup", (b"crypto-", b"stocks-", b"boot_times"), full=full
+        )
+        prune_backups("backup", 3)
 
     @tasks.loop(count=1)
     async def update_languages(self):
@@ -299,13 +346,13 @@ class background_tasks(commands.Cog):
             aliases.add(language["language"])
             languages.append(language["language"])
 
-        self.DB.main.put(b"languages", orjson.dumps(languages))
-        self.DB.main.put(b"aliases", orjson.dumps(list(aliases)))
+        await self.DB.main.put(b"languages", orjson.dumps(languages))
+        await self.DB.main.put(b"aliases", orjson.dumps(list(aliases)))
 
         url = "https://tio.run/languages.json"
         data = await self.bot.get_json(url)
 
-        self.DB.main.put(b"tiolanguages", orjson.dumps([*data]))
+        await self.DB.main.put(b"tiolanguages", orjson.dumps([*data]))
 
         hello_worlds = {}
 
@@ -314,35 +361,54 @@ class background_tasks(commands.Cog):
                 if request["command"] == "F" and ".code.tio" in request["payload"]:
                     hello_worlds[language] = request["payload"][".code.tio"]
 
-        self.DB.main.put(b"helloworlds", orjson.dumps(hello_worlds))
+        await self.DB.main.put(b"helloworlds", orjson.dumps(hello_worlds))
 
     @tasks.loop(minutes=10)
     async def update_crypto(self):
         """Updates crypto currency data every 10 minutes."""
         url = "https://api.coinmarketcap.com/data-api/v3/cryptocurrency/listing?limit=50000&convert=NZD&cryptoType=coins"
         async with self.bot.client_session.get(url) as response:
-            crypto = await response.json()
-
-        with self.DB.crypto.write_batch() as wb:
-            for coin in crypto["data"]["cryptoCurrencyList"]:
-                if "price" not in coin["quotes"][0]:
-                    continue
-
-                wb.put(
-                    coin["symbol"].encode(),
-                    orjson.dumps(
-                        {
-                            "name": coin["name"],
-                            "id": coin["id"],
-                            "price": coin["quotes"][0]["price"],
-                            "circulating_supply": coin["circulatingSupply"],
-                            "max_supply": coin.get("maxSupply", 0),
-                            "market_cap": coin["quotes"][0].get("marketCap", 0),
-                            "change_24h": coin["quotes"][0]["percentChange24h"],
-                            "volume_24h": coin["quotes"][0].get("volume24h", 0),
-                        }
-                    ),
-                )
+            body = await read_body(response)
+
+        puts, prices = await self.bot.loop.run_in_executor(None, parse_crypto, body)
+
+        if await self.DB.write_market(self.DB.crypto, puts) is None:
+            return
+
+        await self.DB.record_prices(self.DB.crypto, prices)
+        await self.DB.publish_prices(self.DB.crypto, prices)
+
+    @tasks.loop(hours=24)
+    async def prune_history(self):
+        """Deletes old deleted and edited message history every day."""
+        await self.DB.prune_history()
+
+    @tasks.loop(hours=1)
+    async def compact_db(self):
+        """Compacts the stock and crypto keys twice a day when the db is quiet."""
+        last = await self.DB.main.get(b"last_compaction")
+
+        if last and time.time() - orjson.loads(last)["time"] < 43200:
+            return
+
+        calls = self.DB.executor.calls
+        await asyncio.sleep(60)
+
+        # Tried again next hour if there were more than 10 calls a second
+        if self.DB.executor.calls - calls > 600:
+            return
+
+        await self.DB.compact((b"stocks-", b"crypto-"))
+
+    @tasks.loop(seconds=5)
+    async def flush_db(self):
+        """Writes cached balances and counters to the db every 5 seconds."""
+        # An error would stop the loop for good, the failed writes are kept
+        # in memory so the next iteration retries them
+        try:
+            await self.DB.flush()
+        except Exception:
+            logging.getLogger("discord").exception("Flushing the db failed")
 
 
 def setup(bot):
@@ -2,7 +2,8 @@ import textwrap
 
 from discord.ext import commands, menus
 import discord
-import orjson
+
+from cogs.utils.useful import sparkline
 
 
 class CryptoMenu(menus.ListPageSource):
@@ -33,7 +34,7 @@ class crypto(commands.Cog):
         if not ctx.subcommand_passed:
             embed = discord.Embed(color=discord.Color.blurple())
             embed.description = (
-                f"```Usage: {ctx.prefix}coin [buy/sell/bal/profile/list/history]"
+                f"```Usage: {ctx.prefix}coin [buy/sell/bal/profile/list/history/chart]"
                 f" or {ctx.prefix}coin [token]```"
             )
             return await ctx.send(embed=embed)
@@ -71,9 +72,49 @@ class crypto(commands.Cog):
                 ```
             """
         )
-        embed.set_image(
-            url=f"https://s3.coinmarketcap.com/generated/sparklines/web/1d/usd/{crypto['id']}.png"
+
+        history = await self.DB.get_price_history(self.DB.crypto, symbol, 86400)
+
+        if len(history) > 1:
+            chart = sparkline([price for _, price in history])
+            embed.add_field(name="24h", value=f"```{chart}```")
+
+        await ctx.send(embed=embed)
+
+    @crypto.command()
+    async def chart(self, ctx, symbol, period="1d"):
+        """Shows a chart of the price of a crypto and how much it changed.
+
+        symbol: str
+            The symbol of the crypto.
+        period: str
+            How far back to go e.g 6h, 1d or 4w, up to a year.
+        """
+        embed = discord.Embed(color=discord.Color.blurple())
+        symbol = symbol.upper()
+        times = {"h": 3600, "d": 86400, "w": 604800}
+
+        try:
+            seconds = int(period[:-1]) * times[period[-1]]
+        except (ValueError, KeyError, IndexError):
+            embed.description = "```Invalid period. Example: 6h, 1d or 4w```"
+            return await ctx.send(embed=embed)
+
+        history = await self.DB.get_price_history(self.DB.crypto, symbol, seconds)
+
+        if len(history) < 2:
+            embed.description = f"```No price history for {symbol} yet```"
+            return await ctx.send(embed=embed)
+
+        prices = [price for _, price in history]
+        change = (prices[-1] / prices[0] - 1) * 100 if prices[0] else 0
+
+        embed.title = f"{symbol} over {period}"
+        embed.description = (
+            f"```diff\n{sparkline(prices)}\n\n"
+            f"{'+' if change >= 0 else ''}{change:.2f}%```"
         )
+        embed.set_footer(text=f"${prices[0]:,.2f} -> ${prices[-1]:,.2f}")
 
         await ctx.send(embed=embed)
 
@@ -93,43 +134,44 @@ class crypto(commands.Cog):
             return await ctx.send(embed=embed)
 
         symbol = symbol.upper()
-        data = await self.DB.get_crypto(symbol)
+        price = await self.DB.get_crypto_price(symbol)
 
-        if not data:
+        if price is None:
             embed.description = f"```Couldn't find crypto {symbol}```"
             return await ctx.send(embed=embed)
 
-        price = float(data["price"])
         member_id = str(ctx.author.id).encode()
-        bal = await self.DB.get_bal(member_id)
 
-        if bal < cash:
-            embed.description = "```You don't have enough cash```"
-            return await ctx.send(embed=embed)
+        async with self.DB.transaction(member_id) as txn:
+            bal = await txn.get_bal(member_id)
 
-        amount = cash / price
+            if bal < cash:
+                embed.description = "```You don't have enough cash```"
+                return await ctx.send(embed=embed)
 
-        cryptobal = await self.DB.get_cryptobal(member_id)
+            amount = cash / price
 
-        if symbol not in cryptobal:
-            cryptobal[symbol] = {"total": 0, "history": [(amount, cash)]}
-        else:
-            cryptobal[symbol]["history"].append((amount, cash))
+            cryptobal = await txn.get_cryptobal(member_id)
+
+            if symbol not in cryptobal:
+                cryptobal[symbol] = {"total": 0, "history": [(amount, cash)]}
+            else:
+                cryptobal[symbol]["history"].append((amount, cash))
+
+            cryptobal[symbol]["total"] += amount
+            bal -= cash
 
-        cryptobal[symbol]["total"] += amount
-        bal -= cash
+            txn.put_bal(member_id, bal)
+            txn.put_cryptobal(member_id, cryptobal)
 
         embed = discord.Embed(
-            title=f"You bought {amount:.2f} {data['name']}",
+            title=f"You bought {amount:.2f} {symbol}",
             color=discord.Color.blurple(),
         )
         embed.set_footer(text=f"Balance: ${bal}")
 
         await ctx.send(embed=embed)
 
-        await self.DB.put_bal(member_id, bal)
-        await self.DB.put_cryptobal(member_id, cryptobal)
-
     @crypto.command(aliases=["s"])
     async def sell(self, ctx, symbol, amount):
         """Sells crypto.
@@ -142,59 +184,60 @@ class crypto(commands.Cog):
         embed = discord.Embed(color=discord.Color.blurple())
 
         symbol = symbol.upper()
-        price = await self.DB.get_crypto(symbol)
+        price = await self.DB.get_crypto_price(symbol)
 
-        if not price:
+        if price is None:
             embed.description = f"```Couldn't find {symbol}```"
             return await ctx.send(embed=embed)
 
-        price = price["price"]
         member_id = str(ctx.author.id).encode()
-        cryptobal = await self.DB.get_cryptobal(member_id)
 
-        if not cryptobal:
-            embed.description = "```You haven't invested.```"
-            return await ctx.send(embed=embed)
+        async with self.DB.transaction(member_id) as txn:
+            cryptobal = await txn.get_cryptobal(member_id)
 
-        if symbol not in cryptobal:
-            embed.description = f"```You haven't invested in {symbol}.```"
-            return await ctx.send(embed=embed)
+            if not cryptobal:
+                embed.description = "```You haven't invested.```"
+                return await ctx.send(embed=embed)
 
-        if amount[-1] == "%":
-            amount = cryptobal[symbol]["total"] * ((float(amount[:-1])) / 100)
-        else:
-            amount = float(amount)
+            if symbol not in cryptobal:
+                embed.description = f"```You haven't invested in {symbol}.```"
+                return await ctx.send(embed=embed)
 
-        if amount < 0:
-            embed.description = "```You can't sell a negative amount of crypto```"
-            return await ctx.send(embed=embed)
+            if amount[-1] == "%":
+                amount = cryptobal[symbol]["total"] * ((float(amount[:-1])) / 100)
+            else:
+                amount = float(amount)
 
-        if cryptobal[symbol]["total"] < amount:
-            embed.description = (
-                f"```Not enough {symbol} you have: {cryptobal[symbol]['total']}```"
-            )
-            return await ctx.send(embed=embed)
+            if amount < 0:
+                embed.description = "```You can't sell a negative amount of crypto```"
+                return await ctx.send(embed=embed)
+
+            if cryptobal[symbol]["total"] < amount:
+                embed.description = (
+                    f"```Not enough {symbol} you have: {cryptobal[symbol]['total']}```"
+                )
+                return await ctx.send(embed=embed)
 
-        bal = await self.DB.get_bal(member_id)
-        cash = amount * float(price)
+            bal = await txn.get_bal(member_id)
+            cash = amount * price
 
-        cryptobal[symbol]["total"] -= amount
+            cryptobal[symbol]["total"] -= amount
 
-        if cryptobal[symbol]["total"] == 0:
-            cryptobal.pop(symbol, None)
-        else:
-            cryptobal[symbol]["history"].append((-amount, cash))
+            if cryptobal[symbol]["total"] == 0:
+                cryptobal.pop(symbol, None)
+            else:
+                cryptobal[symbol]["history"].append((-amount, cash))
+
+            bal += cash
 
-        bal += cash
+            txn.put_bal(member_id, bal)
+            txn.put_cryptobal(member_id, cryptobal)
 
         embed.title = f"Sold {amount:.2f} {symbol} for ${cash:.2f}"
         embed.set_footer(text=f"Balance: ${bal}")
 
         await ctx.send(embed=embed)
 
-        await self.DB.put_bal(member_id, bal)
-        await self.DB.put_cryptobal(member_id, cryptobal)
-
     @crypto.command(aliases=["p"])
     async def profile(self, ctx, member: discord.Member = None):
         """Gets someone's crypto profile.
@@ -218,21 +261,24 @@ class crypto(commands.Cog):
             " Name:                 Price:             Percent Gain:\n"
         )
 
+        prices = await self.DB.get_prices(self.DB.crypto)
+
         for crypto in cryptobal:
-            data = await self.DB.get_crypto(crypto)
+            # Delisted coins are worth nothing
+            price = prices.get(crypto, 0.0)
 
             trades = [
                 trade[1] / trade[0]
                 for trade in cryptobal[crypto]["history"]
                 if trade[0] > 0
             ]
-            change = ((data["price"] / (sum(trades) / len(trades))) - 1) * 100
+            change = ((price / (sum(trades) / len(trades))) - 1) * 100
             sign = "-" if str(change)[0] == "-" else "+"
 
             msg += f"{sign} {crypto:>4}: {cryptobal[crypto]['total']:<14.2f}"
-            msg += f" Price: ${data['price']:<10.2f} {change:.2f}%\n"
+            msg += f" Price: ${price:<10.2f} {change:.2f}%\n"
 
-            net_value += cryptobal[crypto]["total"] * float(data["price"])
+            net_value += cryptobal[crypto]["total"] * price
 
         embed.description = f"```diff\n{msg}\nNet Value: ${net_value:.2f}```"
         await ctx.send(embed=embed)
@@ -288,23 +334,27 @@ class crypto(commands.Cog):
                 ```
             """
         )
-        embed.set_image(
-            url=f"https://s3.coinmarketcap.com/generated/sparklines/web/1d/usd/{crypto['id']}.png"
-        )
+
+        history = await self.DB.get_price_history(self.DB.crypto, symbol, 86400)
+
+        if len(history) > 1:
+            chart = sparkline([price for _, price in history])
+            embed.add_field(name="24h", value=f"```{chart}```")
 
         await ctx.send(embed=embed)
 
     @crypto.command()
     async def list(self, ctx):
         """Shows the prices of crypto with pagination."""
-        data = []
-        for i, (stock, price) in enumerate(self.DB.crypto, start=1):
-            price = orjson.loads(price)["price"]
+        prices = await self.DB.get_prices(self.DB.crypto)
 
+        data = []
+        for i, symbol in enumerate(sorted(prices), start=1):
+            price = prices.get(symbol)
             if not i % 3:
-                data.append(f"{stock.decode()}: ${float(price):.2f}\n")
+                data.append(f"{symbol}: ${price:.2f}\n")
             else:
-                data.append(f"{stock.decode()}: ${float(price):.2f}\t".expandtabs())
+                data.append(f"{symbol}: ${price:.2f}\t".expandtabs())
 
         pages = menus.MenuPages(
             source=CryptoMenu(data),
@@ -113,12 +113,12 @@ class economy(commands.Cog):
 
         if deck.get_score(m_cards) == 21:
             await message.edit(embed=deck.get_embed(bet, False))
-            await self.DB.put_bal(member, bal + bet)
+            await self.DB.add_bal(member, bet)
             return await message.add_reaction("✅")
 
         if deck.get_score(d_cards) == 21:
             await message.edit(embed=deck.get_embed(bet, False))
-            await self.DB.put_bal(member, bal - bet)
+            await self.DB.withdraw_bal(member, bet)
             return await message.add_reaction("❎")
 
         reactions = ["🇭", "🇸"]
@@ -144,24 +144,25 @@ class economy(commands.Cog):
             await reaction.remove(user)
             await message.edit(embed=deck.get_embed(bet))
 
+        # The balance is only changed by the result so commands
+        # run during the game aren't overwritten by a stale balance
         if (m_score := deck.get_score(m_cards)) > 21:
-            bal -= bet
+            await self.DB.withdraw_bal(member, bet)
             await message.add_reaction("❎")
         else:
             while (score := deck.get_score(d_cards)) < 16 or score < m_score:
                 d_cards.append(deck.get_card())
 
             if score > 21 or m_score > score:
-                bal += bet
+                await self.DB.add_bal(member, bet)
                 await message.add_reaction("✅")
             elif score == m_score:
                 await message.add_reaction("➖")
             else:
-                bal -= bet
+                await self.DB.withdraw_bal(member, bet)
                 await message.add_reaction("❎")
 
         await message.edit(embed=deck.get_embed(bet, False))
-        await self.DB.put_bal(member, bal)
 
     @commands.command(aliases=["flip", "fcoin", "coinf"])
     async def coinflip(self, ctx, choice, bet: float):
@@ -181,33 +182,38 @@ class economy(commands.Cog):
             return await ctx.send(embed=embed)
 
         member = str(ctx.author.id).encode()
-        bal = await self.DB.get_bal(member)
 
-        if bal <= 1:
-            bal += 1
+        async with self.DB.transaction(member) as txn:
+            bal = await txn.get_bal(member)
 
-        if bal < bet:
-            embed.title = "You don't have enough cash"
-            return await ctx.send(embed=embed)
+            if bal <= 1:
+                bal += 1
+
+            if bal < bet:
+                embed.title = "You don't have enough cash"
+                return await ctx.send(embed=embed)
+
+            result = random.choice(["heads", "tails"])
+
+            if choice == result[0]:
+                bal += bet
+            else:
+                bal -= bet
+
+            txn.put_bal(member, bal)
 
         images = {
             "heads": "https://i.imgur.com/168G0Cr.jpg",
             "tails": "https://i.imgur.com/EdBBcsz.jpg",
         }
 
-        result = random.choice(["heads", "tails"])
-
         embed.set_author(name=result.capitalize(), icon_url=images[result])
 
         if choice == result[0]:
             embed.color = discord.Color.blurple()
             embed.description = f"You won ${bet}"
-            bal += bet
         else:
             embed.description = f"You lost ${bet}"
-            bal -= bet
-
-        await self.DB.put_bal(member, bal)
 
         embed.set_footer(text=f"Balance: ${bal:,}")
         await ctx.send(embed=embed)
@@ -245,27 +251,34 @@ class economy(commands.Cog):
             return await ctx.send(embed=embed)
 
         member = str(ctx.author.id).encode()
-        bal = await self.DB.get_bal(member)
 
-        if bal < bet:
-            embed.title = "You don't have enough cash"
-            return await ctx.send(embed=embed)
+        async with self.DB.transaction(member) as txn:
+            bal = await txn.get_bal(member)
 
-        if random.randint(1, 100) == 50:
-            bal += bet * 99
-            await self.DB.put_bal(member, bal)
+            if bal < bet:
+                embed.title = "You don't have enough cash"
+                return await ctx.send(embed=embed)
+
+            won = random.randint(1, 100) == 50
+            bal = txn.put_bal(member, bal + bet * 99 if won else bal - bet)
+
+        if won:
             embed.title = f"You won ${bet * 99}"
             embed.set_footer(text=f"Balance: ${bal:,}")
             return await ctx.send(embed=embed)
 
-        await self.DB.put_bal(member, bal - bet)
         embed.title = f"You lost ${bet}"
-        embed.set_footer(text=f"Balance: ${bal - bet:,}")
+        embed.set_footer(text=f"Balance: ${bal:,}")
         embed.color = discord.Color.red()
         await ctx.send(embed=embed)
 
     async def streak_update(self, member, result):
-        data = self.DB.wins.get(member)
+        """Records a win or loss, queued so a spin stays in the balance cache.
+
+        member: bytes
+        result: str
+        """
+        data = await self.DB.wins.get(member)
 
         if not data:
             data = {
@@ -289,7 +302,7 @@ class economy(commands.Cog):
             data["totallose"] += 1
             data["currentlose"] += 1
             data["currentwin"] = 0
-        self.DB.wins.put(member, orjson.dumps(data))
+        self.DB.wins.queue_put(member, orjson.dumps(data))
 
     @commands.command(aliases=["slots"])
     async def slot(self, ctx, bet, silent: bool = False):
@@ -303,28 +316,48 @@ class economy(commands.Cog):
         embed = discord.Embed(color=discord.Color.red())
 
         member = str(ctx.author.id).encode()
-        bal = await self.DB.get_bal(member)
 
-        if bet[-1] == "%":
-            bet = bal * ((float(bet[:-1])) / 100)
-        else:
-            try:
-                bet = float(bet.replace(",", ""))
-            except ValueError:
-                embed.description = f"```Invalid bet. e.g {ctx.prefix}slot 1000```"
+        async with self.DB.transaction(member) as txn:
+            bal = await txn.get_bal(member)
+
+            if bet[-1] == "%":
+                bet = bal * ((float(bet[:-1])) / 100)
+            else:
+                try:
+                    bet = float(bet.replace(",", ""))
+                except ValueError:
+                    embed.description = f"```Invalid bet. e.g {ctx.prefix}slot 1000```"
+                    return await ctx.send(embed=embed)
+
+            if bet < 0:
+                embed.title = "Bet must be positive"
                 return await ctx.send(embed=embed)
 
-        if bet < 0:
-            embed.title = "Bet must be positive"
-            return await ctx.send(embed=embed)
+            if bal <= 1:
+                bal += 1
 
-        if bal <= 1:
-            bal += 1
+            if bal < bet:
+                embed.title = "You don't have enough cash"
+                return await ctx.send(embed=embed)
 
-        if bal < bet:
-            embed.title = "You don't have enough cash"
-            return await ctx.send(embed=embed)
+            result, winnings, reels = self.roll()
+            bal = txn.put_bal(member, bal + bet * winnings)
+            # Under the member lock so spins don't lose each others streaks
+            await self.streak_update(member, result)
+
+        if not silent:
+            embed.color = (
+                discord.Color.blurple() if result == "won" else discord.Color.red()
+            )
+            embed.title = f"[ {' '.join(reels)} ]"
+            embed.description = f"You {result} ${bet*(abs(winnings)):,.2f}"
+            embed.set_footer(text=f"Balance: ${bal:,}")
+
+            await ctx.reply(embed=embed, mention_author=False)
 
+    @staticmethod
+    def roll():
+        """Spins the slot machine returning the result, multiplier and reels."""
         emojis = (
             ":apple:",
             ":tangerine:",
@@ -341,10 +374,9 @@ class economy(commands.Cog):
             ":mango:",
         )
 
-        a, b, c, d = random.choices(emojis, k=4)
+        a, b, c, d = reels = random.choices(emojis, k=4)
 
         result = "won"
-        embed.color = discord.Color.blurple()
         if a == b == c == d:
             winnings = 100
         elif (a == b == c) or (a == c == d) or (a == b == d) or (b == c == d):
@@ -356,19 +388,8 @@ class economy(commands.Cog):
         else:
             winnings = -1
             result = "lost"
-            embed.color = discord.Color.red()
 
-        bal += bet * winnings
-        await self.DB.put_bal(member, bal)
-
-        if not silent:
-            embed.title = f"[ {a} {b} {c} {d} ]"
-            embed.description = f"You {result} ${bet*(abs(winnings)):,.2f}"
-            embed.set_footer(text=f"Balance: ${bal:,}")
-
-            await ctx.reply(embed=embed, mention_author=False)
-
-        await self.streak_update(member, result)
+        return result, winnings, reels
 
     @commands.command(aliases=["streaks"])
     async def streak(self, ctx, user: discord.User = None):
@@ -381,7 +402,7 @@ class economy(commands.Cog):
         else:
             user = str(ctx.author.id).encode()
 
-        wins = self.DB.wins.get(user)
+        wins = await self.DB.wins.get(user)
 
         if not wins:
             return
@@ -484,18 +505,16 @@ class economy(commands.Cog):
         """Shows the top slot streaks."""
         streak_top = []
 
-        for member, data in self.DB.wins:
+        for member, data in await self.DB.streaktop.top(10):
             user = self.bot.get_user(int(member))
             if user is not None:
                 json = orjson.loads(data)
                 data = ((json["highestwin"], json["highestlose"]), user.display_name)
                 streak_top.append(data)
 
-        streak_top.sort(reverse=True)
-
         embed = discord.Embed(color=discord.Color.blurple())
         embed.description = "```Highest Streaks [win/lose]:\n\n{}```".format(
-            "\n".join([f"{member}: {hw[0]}/{hw[1]}" for hw, member in streak_top[:10]])
+            "\n".join([f"{member}: {hw[0]}/{hw[1]}" for hw, member in streak_top])
         )
 
         await ctx.send(embed=embed)
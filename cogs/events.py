@@ -26,28 +26,7 @@ class events(commands.Cog):
         if not payload.guild_id or payload.emoji.is_custom_emoji():
             return
 
-        polls = self.DB.main.get(b"polls")
-
-        if not polls:
-            return
-
-        polls = orjson.loads(polls)
-        guild = str(payload.guild_id)
-
-        if guild not in polls:
-            return
-
-        message = str(payload.message_id)
-
-        if message not in polls[guild]:
-            return
-
-        if payload.emoji.name not in polls[guild][message]:
-            return
-
-        polls[guild][message][payload.emoji.name]["count"] += 1
-
-        self.DB.main.put(b"polls", orjson.dumps(polls))
+        self.DB.add_vote(payload.message_id, payload.emoji.name)
 
     async def emoji_submission_check(self, payload):
         """Checks if an emoji submission has passed 8 votes.
@@ -55,7 +34,7 @@ class events(commands.Cog):
         payload: discord.RawReactionActionEvent
             A payload of raw data about the reaction and member.
         """
-        emojis = self.DB.main.get(b"emoji_submissions")
+        emojis = await self.DB.main.get(b"emoji_submissions")
 
         if not payload.emoji.is_custom_emoji():
             return
@@ -91,8 +70,9 @@ class events(commands.Cog):
                 await message.add_reaction(emoji)
 
             emojis.pop(message_id)
+            self.DB.reaction_messages.discard(payload.message_id)
 
-        self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
+        await self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
 
     async def reaction_role_check(self, payload):
         """Checks if a reaction was on a reaction role message.
@@ -100,7 +80,7 @@ class events(commands.Cog):
         payload: discord.RawReactionActionEvent
             A payload of raw data about the reaction and member.
         """
-        reaction_roles = self.DB.rrole.get(str(payload.message_id).encode())
+        reaction_roles = await self.DB.rrole.get(str(payload.message_id).encode())
 
         if not reaction_roles:
             return
@@ -143,6 +123,10 @@ class events(commands.Cog):
         if payload.member == self.bot.user:
             return
 
+        if payload.message_id not in self.DB.reaction_messages:
+            self.DB.skipped_reactions += 1
+            return
+
         await self.emoji_submission_check(payload)
         await self.poll_check(payload)
         await self.reaction_role_check(payload)
@@ -154,6 +138,10 @@ class events(commands.Cog):
         payload: discord.RawReactionActionEvent
             A payload of raw data about the reaction and member.
         """
+        if payload.message_id not in self.DB.reaction_messages:
+            self.DB.skipped_reactions += 1
+            return
+
         await self.reaction_role_check(payload)
 
     @commands.Cog.listener()
@@ -213,7 +201,7 @@ class events(commands.Cog):
         message: discord.Message
         reactions: List[discord.Reaction]
         """
-        if await self.DB.get_blacklist(message.author.id, message.guild.id) == b"1":
+        if self.DB.get_blacklist(message.author.id, message.guild.id) == b"1":
             try:
                 await message.add_reaction("<:downvote:766414744730206228>")
             except discord.errors.HTTPException:
@@ -233,7 +221,7 @@ class events(commands.Cog):
         if not after.channel:
             return
 
-        if await self.DB.get_blacklist(member.id, member.guild.id) == b"1":
+        if self.DB.get_blacklist(member.id, member.guild.id) == b"1":
             await member.edit(voice_channel=None)
             await self.DB.add_karma(member.id, -1)
 
@@ -248,25 +236,20 @@ class events(commands.Cog):
         """
         if (
             not before.guild
-            or self.DB.main.get(f"{after.guild.id}-logging".encode())
+            or not (await self.DB.get_guild_settings(after.guild.id)).logging
             or not after.content
             or before.content == after.content
             or after.author == self.bot.user
         ):
             return
 
-        member_id = f"{before.guild.id}-{before.author.id}".encode()
-        edited = self.DB.edited.get(member_id)
-
-        if not edited:
-            edited = {}
-        else:
-            edited = orjson.loads(edited)
-
-        date = str(int(datetime.now().timestamp()))
-        edited[date] = [before.content, after.content]
-        self.DB.edited.put(member_id, orjson.dumps(edited))
-        self.DB.main.put(
+        await self.DB.add_history(
+            self.DB.edited,
+            before.guild.id,
+            before.author.id,
+            [before.content, after.content],
+        )
+        self.DB.main.queue_put(
             f"{before.guild.id}-editsnipe_message".encode(),
             orjson.dumps([before.content, after.content, before.author.display_name]),
         )
@@ -301,7 +284,7 @@ class events(commands.Cog):
         """
         if (
             not message.guild
-            or self.DB.main.get(f"{message.guild.id}-logging".encode())
+            or not (await self.DB.get_guild_settings(message.guild.id)).logging
             or message.author == self.bot.user
             or not message.content
             and (
@@ -322,19 +305,10 @@ class events(commands.Cog):
             "\n".join(image_urls),
         )
 
-        member_id = f"{message.guild.id}-{message.author.id}".encode()
-        deleted = self.DB.deleted.get(member_id)
-
-        if not deleted:
-            deleted = {}
-        else:
-            deleted = orjson.loads(deleted)
-
-        date = str(int(datetime.now().timestamp()))
-        deleted[date] = message.content
-
-        self.DB.deleted.put(member_id, orjson.dumps(deleted))
-        self.DB.main.put(
+        await self.DB.add_history(
+            self.DB.deleted, message.guild.id, message.author.id, message.content
+        )
+        self.DB.main.queue_put(
             f"{message.guild.id}-snipe_message".encode(),
             orjson.dumps([content, message.author.display_name]),
         )
@@ -362,18 +336,11 @@ class events(commands.Cog):
             guild = message.guild.id
 
             key = f"{guild}-{message.author.id}".encode()
-            count = self.DB.message_count.get(key)
-
-            if count:
-                count = int(count) + 1
-            else:
-                count = 1
-
-            self.DB.message_count.put(key, str(count).encode())
+            self.DB.count(self.DB.message_count, key)
         else:
             guild = None
 
-        if await self.DB.get_blacklist(message.author.id, guild) == b"1":
+        if self.DB.get_blacklist(message.author.id, guild) == b"1":
             try:
                 await message.add_reaction("<:downvote:766414744730206228>")
             except discord.errors.HTTPException:
@@ -393,7 +360,7 @@ class events(commands.Cog):
 
         member_id = str(after.id).encode()
 
-        nicks = self.DB.nicks.get(member_id)
+        nicks = await self.DB.nicks.get(member_id)
 
         if not nicks:
             nicks = {"nicks": {}, "names": {}}
@@ -410,7 +377,7 @@ class events(commands.Cog):
         nicks["nicks"][date] = before.nick
         nicks["nicks"]["current"] = [after.nick, now]
 
-        self.DB.nicks.put(member_id, orjson.dumps(nicks))
+        self.DB.nicks.queue_put(member_id, orjson.dumps(nicks))
 
     @commands.Cog.listener()
     async def on_user_update(self, before, after):
@@ -426,7 +393,7 @@ class events(commands.Cog):
 
         member_id = str(after.id).encode()
 
-        names = self.DB.nicks.get(member_id)
+        names = await self.DB.nicks.get(member_id)
 
         if not names:
             names = {"nicks": {}, "names": {}}
@@ -443,7 +410,7 @@ class events(commands.Cog):
         names["names"][date] = before.name
         names["names"]["current"] = [after.name, now]
 
-        self.DB.nicks.put(member_id, orjson.dumps(names))
+        self.DB.nicks.queue_put(member_id, orjson.dumps(names))
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
@@ -453,14 +420,14 @@ class events(commands.Cog):
         """
         for invite in await member.guild.invites():
             key = f"{invite.code}-{invite.guild.id}"
-            uses = self.DB.invites.get(key.encode())
+            uses = await self.DB.invites.get(key.encode())
 
             if not uses:
-                self.DB.invites.put(key.encode(), str(invite.uses).encode())
+                self.DB.invites.queue_put(key.encode(), str(invite.uses).encode())
                 continue
 
             if invite.uses > int(uses):
-                self.DB.invites.put(str(member.id).encode(), invite.code.encode())
+                self.DB.invites.queue_put(str(member.id).encode(), invite.code.encode())
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
@@ -487,7 +454,7 @@ class events(commands.Cog):
         invite: discord.Invite
         """
         key = f"{invite.code}-{invite.guild.id}"
-        self.DB.invites.put(key.encode(), str(invite.uses).encode())
+        self.DB.invites.queue_put(key.encode(), str(invite.uses).encode())
 
     @commands.Cog.listener()
     async def on_invite_delete(self, invite):
@@ -495,7 +462,7 @@ class events(commands.Cog):
 
         invite: discord.Invite
         """
-        self.DB.invites.delete(f"{invite.code}-{invite.guild.id}".encode())
+        self.DB.invites.queue_delete(f"{invite.code}-{invite.guild.id}".encode())
 
     @staticmethod
     async def can_run(ctx, command):
@@ -591,7 +558,7 @@ class events(commands.Cog):
             boot_time = start_time - psutil.Process(os.getpid()).create_time()
 
             self.bot.uptime = start_time
-            boot_times = self.DB.main.get(b"boot_times")
+            boot_times = await self.DB.main.get(b"boot_times")
 
             if boot_times:
                 boot_times = orjson.loads(boot_times)
@@ -599,11 +566,11 @@ class events(commands.Cog):
                 boot_times = []
 
             boot_times.append(round(boot_time, 5))
-            self.DB.main.put(b"boot_times", orjson.dumps(boot_times))
+            await self.DB.main.put(b"boot_times", orjson.dumps(boot_times))
 
-            # Wipe the cache and polls as we have no way of knowing if they have expired
-            self.DB.main.put(b"cache", b"{}")
-            self.DB.main.delete(b"polls")
+            # Wipe the cache, running polls are resumed by the moderation cog
+            await self.DB.main.put(b"cache", b"{}")
+            await self.DB.main.delete(b"polls")
 
             print(
                 f"Logged in as {self.bot.user.name}\n"
@@ -620,17 +587,15 @@ class events(commands.Cog):
             return True
 
         if ctx.guild:
-            disabled = self.DB.main.get(f"{ctx.guild.id}-disabled_channels".encode())
+            settings = await self.DB.get_guild_settings(ctx.guild.id)
 
             if (
-                disabled
-                and ctx.command.name != "disable_channel"
-                and str(ctx.guild.id) in (disabled := orjson.loads(disabled))
+                ctx.command.name != "disable_channel"
+                and ctx.channel.id in settings.disabled_channels
             ):
-                if ctx.channel.id in disabled[str(ctx.guild.id)]:
-                    return False
+                return False
 
-            if ctx.guild and self.DB.main.get(f"{ctx.guild.id}-{ctx.command}".encode()):
+            if str(ctx.command) in settings.disabled_commands:
                 await ctx.send(
                     embed=discord.Embed(
                         color=discord.Color.red(), description="```Command disabled```"
@@ -638,9 +603,7 @@ class events(commands.Cog):
                 )
                 return False
 
-        if await self.DB.get_blacklist(
-            ctx.author.id, ctx.guild.id if ctx.guild else None
-        ):
+        if self.DB.get_blacklist(ctx.author.id, ctx.guild.id if ctx.guild else None):
             await ctx.send(
                 embed=discord.Embed(
                     color=discord.Color.red(),
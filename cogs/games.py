@@ -44,7 +44,7 @@ class CookieClicker(discord.ui.View):
     async def click(self, button, interaction):
         if interaction.user == self.user:
             user_id = str(interaction.user.id).encode()
-            cookies = self.DB.cookies.get(user_id)
+            cookies = await self.DB.cookies.get(user_id)
 
             if not cookies:
                 cookies = {"cookies": 1, "upgrade": 1}
@@ -62,13 +62,13 @@ class CookieClicker(discord.ui.View):
             await interaction.response.edit_message(
                 content=None, embed=self.get_embed(self.user.display_name, cookies)
             )
-            self.DB.cookies.put(user_id, orjson.dumps(cookies))
+            await self.DB.cookies.put(user_id, orjson.dumps(cookies))
 
     @discord.ui.button(label="🆙", style=discord.ButtonStyle.blurple)
     async def upgrade(self, button, interaction):
         if interaction.user == self.user:
             user_id = str(interaction.user.id).encode()
-            cookies = self.DB.cookies.get(user_id)
+            cookies = await self.DB.cookies.get(user_id)
 
             if not cookies:
                 cookies = {"cookies": 1, "upgrade": 1}
@@ -98,7 +98,7 @@ class CookieClicker(discord.ui.View):
                     cookies["cookies"] -= cost
                     cookies["upgrade"] += 1
 
-            self.DB.cookies.put(user_id, orjson.dumps(cookies))
+            await self.DB.cookies.put(user_id, orjson.dumps(cookies))
             await interaction.response.edit_message(
                 content=None, embed=self.get_embed(self.user.display_name, cookies)
             )
@@ -107,7 +107,7 @@ class CookieClicker(discord.ui.View):
     async def autocookie(self, button, interaction):
         if interaction.user == self.user:
             user_id = str(interaction.user.id).encode()
-            cookies = self.DB.cookies.get(user_id)
+            cookies = await self.DB.cookies.get(user_id)
 
             if not cookies:
                 return
@@ -140,7 +140,7 @@ class CookieClicker(discord.ui.View):
                     cookies["cookies"] -= cost
                     cookies["cps"] += 1
 
-            self.DB.cookies.put(user_id, orjson.dumps(cookies))
+            await self.DB.cookies.put(user_id, orjson.dumps(cookies))
             await interaction.response.edit_message(
                 content=None, embed=self.get_embed(self.user.display_name, cookies)
             )
@@ -149,7 +149,7 @@ class CookieClicker(discord.ui.View):
     async def toggle(self, button, interaction):
         if interaction.user == self.user:
             user_id = str(interaction.user.id).encode()
-            cookies = self.DB.cookies.get(user_id)
+            cookies = await self.DB.cookies.get(user_id)
 
             if not cookies:
                 return
@@ -157,7 +157,7 @@ class CookieClicker(discord.ui.View):
             cookies = orjson.loads(cookies)
             cookies["buy_all"] = not cookies.get("buy_all")
 
-            self.DB.cookies.put(user_id, orjson.dumps(cookies))
+            await self.DB.cookies.put(user_id, orjson.dumps(cookies))
             response = "on" if cookies["buy_all"] else "off"
             await interaction.response.edit_message(
                 content=None, embed=self.get_embed(self.user.display_name, cookies)
@@ -277,7 +277,7 @@ class games(commands.Cog):
         user = user or ctx.author
 
         user_id = str(user.id).encode()
-        cookies = self.DB.cookies.get(user_id)
+        cookies = await self.DB.cookies.get(user_id)
 
         if not cookies:
             cookies = {"cookies": 0, "upgrade": 1}
@@ -296,13 +296,19 @@ class games(commands.Cog):
         )
 
         await ctx.send(embed=embed)
-        self.DB.cookies.put(user_id, orjson.dumps(cookies))
+        await self.DB.cookies.put(user_id, orjson.dumps(cookies))
 
     @commands.command()
     async def cookietop(self, ctx):
-        """Gets the users with the most cookies."""
+        """Gets the users with the most cookies.
+
+        The top 10 is picked by banked cookies, cookies made since the last
+        bank only reorder those 10.
+        """
         cookietop = []
-        for member, data in self.DB.cookies:
+        await self.DB.flush()
+        # Ranked by banked cookies then re-sorted with what has been made since
+        for member, data in await self.DB.cookietop.top(10):
             data = orjson.loads(data)
             cps = data.get("cps", 0)
             if cps:
@@ -310,7 +316,7 @@ class games(commands.Cog):
 
             cookietop.append(((data["cookies"], data["upgrade"], cps), int(member)))
 
-        cookietop = sorted(cookietop, reverse=True)[:10]
+        cookietop.sort(reverse=True)
 
         embed = discord.Embed(color=discord.Color.blurple())
         embed.title = f"Top {len(cookietop)} members"
@@ -342,35 +348,36 @@ class games(commands.Cog):
         sender = str(ctx.author.id).encode()
         receiver = str(member.id).encode()
 
-        sender_bal = self.DB.cookies.get(sender)
+        async with self.DB.transaction(sender, receiver) as txn:
+            sender_bal = await txn.get(self.DB.cookies, sender)
 
-        if not sender_bal:
-            embed.description = "```You don't have any cookies```"
-            return await ctx.send(embed=embed)
+            if not sender_bal:
+                embed.description = "```You don't have any cookies```"
+                return await ctx.send(embed=embed)
 
-        sender_bal = orjson.loads(sender_bal)
+            sender_bal = orjson.loads(sender_bal)
 
-        if sender_bal["cookies"] < amount:
-            embed.description = "```You don't have enough cookies```"
-            return await ctx.send(embed=embed)
+            if sender_bal["cookies"] < amount:
+                embed.description = "```You don't have enough cookies```"
+                return await ctx.send(embed=embed)
 
-        receiver_bal = self.DB.cookies.get(receiver)
+            receiver_bal = await txn.get(self.DB.cookies, receiver)
 
-        if not receiver_bal:
-            receiver_bal = {"cookies": amount, "upgrade": 1}
-        else:
-            receiver_bal = orjson.loads(receiver_bal)
-            receiver_bal["cookies"] += amount
+            if not receiver_bal:
+                receiver_bal = {"cookies": amount, "upgrade": 1}
+            else:
+                receiver_bal = orjson.loads(receiver_bal)
+                receiver_bal["cookies"] += amount
 
-        sender_bal["cookies"] -= amount
+            sender_bal["cookies"] -= amount
+
+            txn.put(self.DB.cookies, sender, orjson.dumps(sender_bal))
+            txn.put(self.DB.cookies, receiver, orjson.dumps(receiver_bal))
 
         embed.description = f"{sender_bal['cookies']} 🍪 left"
         embed.title = f"You sent {amount} 🍪 to {member}"
         await ctx.send(embed=embed)
 
-        self.DB.cookies.put(sender, orjson.dumps(sender_bal))
-        self.DB.cookies.put(receiver, orjson.dumps(receiver_bal))
-
     @commands.command()
     async def tictactoe(self, ctx):
         """Starts a game of tic tac toe."""
@@ -454,7 +461,7 @@ class games(commands.Cog):
     @commands.guild_only()
     async def chess(self, ctx):
         """Starts a Chess In The Park game."""
-        if (code := self.DB.main.get(b"chess")) and discord.utils.get(
+        if (code := await self.DB.main.get(b"chess")) and discord.utils.get(
             await ctx.guild.invites(), code=code.decode()
         ):
             return await ctx.send(
@@ -488,13 +495,13 @@ class games(commands.Cog):
             data = await response.json()
 
         await ctx.send(f"https://discord.gg/{data['code']}")
-        self.DB.main.put(b"chess", data["code"].encode())
+        await self.DB.main.put(b"chess", data["code"].encode())
 
     @commands.command()
     @commands.guild_only()
     async def poker(self, ctx):
         """Starts a Discord Poke Night."""
-        if (code := self.DB.main.get(b"poker_night")) and discord.utils.get(
+        if (code := await self.DB.main.get(b"poker_night")) and discord.utils.get(
             await ctx.guild.invites(), code=code.decode()
         ):
             return await ctx.send(
@@ -528,13 +535,13 @@ class games(commands.Cog):
             data = await response.json()
 
         await ctx.send(f"https://discord.gg/{data['code']}")
-        self.DB.main.put(b"poker_night", data["code"].encode())
+        await self.DB.main.put(b"poker_night", data["code"].encode())
 
     @commands.command()
     @commands.guild_only()
     async def betrayal(self, ctx):
         """Starts a Betrayal.io game."""
-        if (code := self.DB.main.get(b"betrayal_io")) and discord.utils.get(
+        if (code := await self.DB.main.get(b"betrayal_io")) and discord.utils.get(
             await ctx.guild.invites(), code=code.decode()
         ):
             return await ctx.send(
@@ -568,13 +575,13 @@ class games(commands.Cog):
             data = await response.json()
 
         await ctx.send(f"https://discord.gg/{data['code']}")
-        self.DB.main.put(b"betrayal_io", data["code"].encode())
+        await self.DB.main.put(b"betrayal_io", data["code"].encode())
 
     @commands.command()
     @commands.guild_only()
     async def fishing(self, ctx):
         """Starts a Fishington.io game."""
-        if (code := self.DB.main.get(b"fishington")) and discord.utils.get(
+        if (code := await self.DB.main.get(b"fishington")) and discord.utils.get(
             await ctx.guild.invites(), code=code.decode()
         ):
             return await ctx.send(
@@ -608,7 +615,7 @@ class games(commands.Cog):
             data = await response.json()
 
         await ctx.send(f"https://discord.gg/{data['code']}")
-        self.DB.main.put(b"fishington", data["code"].encode())
+        await self.DB.main.put(b"fishington", data["code"].encode())
 
 
 def setup(bot: commands.Bot) -> None:
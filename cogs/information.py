@@ -106,14 +106,11 @@ class information(commands.Cog):
         """
         amount = max(0, min(50, amount))
 
-        msgtop = sorted(
-            [
-                (int(b), m.decode())
-                for m, b in self.DB.message_count
-                if int(m.decode().split("-")[0]) == ctx.guild.id
-            ],
-            reverse=True,
-        )[:amount]
+        await self.DB.flush()
+        msgtop = [
+            (int(b), m.decode())
+            for m, b in await self.DB.messagetop.top(amount, ctx.guild.id)
+        ]
 
         embed = discord.Embed(color=discord.Color.blurple())
         members = []
@@ -159,7 +156,7 @@ class information(commands.Cog):
         number: int
             Which rule to get.
         """
-        rules = self.DB.main.get(f"{ctx.guild.id}-rules".encode())
+        rules = await self.DB.main.get(f"{ctx.guild.id}-rules".encode())
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not rules:
@@ -178,7 +175,7 @@ class information(commands.Cog):
     @commands.command()
     async def rules(self, ctx):
         """Shows all the rules of the server"""
-        rules = self.DB.main.get(f"{ctx.guild.id}-rules".encode())
+        rules = await self.DB.main.get(f"{ctx.guild.id}-rules".encode())
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not rules:
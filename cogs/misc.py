@@ -459,7 +459,7 @@ class misc(commands.Cog):
     @commands.guild_only()
     async def youtube(self, ctx):
         """Starts a YouTube Together."""
-        if (code := self.DB.main.get(b"youtube_together")) and discord.utils.get(
+        if (code := await self.DB.main.get(b"youtube_together")) and discord.utils.get(
             await ctx.guild.invites(), code=code.decode()
         ):
             return await ctx.send(
@@ -493,7 +493,7 @@ class misc(commands.Cog):
             data = await response.json()
 
         await ctx.send(f"https://discord.gg/{data['code']}")
-        self.DB.main.put(b"youtube_together", data["code"].encode())
+        await self.DB.main.put(b"youtube_together", data["code"].encode())
 
     @commands.command(name="8ball")
     async def eightball(self, ctx):
@@ -574,12 +574,7 @@ class misc(commands.Cog):
         """
         user = user or ctx.author
         user_id = str(user.id).encode()
-        karma = self.DB.karma.get(user_id)
-
-        if not karma:
-            karma = 0
-        else:
-            karma = karma.decode()
+        karma = await self.DB.get_count(self.DB.karma, user_id)
 
         tenary = "+" if int(karma) > 0 else ""
 
@@ -590,14 +585,15 @@ class misc(commands.Cog):
     @commands.command(aliases=["kboard", "karmab", "karmatop"])
     async def karmaboard(self, ctx):
         """Displays the top 5 and bottom 5 members karma."""
-        sorted_karma = sorted(
-            [(int(k), int(m)) for m, k in self.DB.karma], reverse=True
-        )
+        await self.DB.flush()
+        top = await self.DB.karmatop.top(5)
+        bottom = await self.DB.karmatop.bottom(5)
         embed = discord.Embed(title="Karma Board", color=discord.Color.blurple())
 
         def parse_karma(data):
             lst = []
-            for karma, member in data:
+            for member, karma in data:
+                karma, member = int(karma), int(member)
                 temp = self.bot.get_user(member)
                 member = temp.display_name if temp else member
                 lst.append(f"{'-' if karma < 0 else '+'} {member}: {karma}")
@@ -605,11 +601,11 @@ class misc(commands.Cog):
 
         embed.add_field(
             name="Top Five",
-            value="```diff\n{}```".format("\n".join(parse_karma(sorted_karma[:5]))),
+            value="```diff\n{}```".format("\n".join(parse_karma(top))),
         )
         embed.add_field(
             name="Bottom Five",
-            value="```diff\n{}```".format("\n".join(parse_karma(sorted_karma[-5:]))),
+            value="```diff\n{}```".format("\n".join(parse_karma(bottom[::-1]))),
         )
         await ctx.send(embed=embed)
 
@@ -1,4 +1,5 @@
 import asyncio
+import time
 
 from discord.ext import commands, menus
 import discord
@@ -25,6 +26,36 @@ class moderation(commands.Cog):
         self.bot = bot
         self.DB = bot.DB
         self.loop = bot.loop
+        self.polls_resumed = False
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Schedules the end of polls that were running before a restart."""
+        if self.polls_resumed:
+            return
+        self.polls_resumed = True
+
+        for message_id, poll in list(self.DB.active_polls.items()):
+            # Polls from before their channel and end were stored can't be resumed
+            if not poll.get("channel") or not poll.get("end"):
+                await self.DB.end_poll(message_id)
+                continue
+
+            self.loop.call_later(
+                max(poll["end"] - time.time(), 0),
+                asyncio.create_task,
+                self._resume_poll(poll["channel"], message_id),
+            )
+
+    async def _resume_poll(self, channel_id, message_id):
+        """Ends a poll resumed after a restart, fetching its message first."""
+        try:
+            channel = self.bot.get_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+        except (AttributeError, discord.HTTPException):
+            return await self.DB.end_poll(message_id)
+
+        await self._end_poll(message)
 
     @commands.command()
     async def inactive(self, ctx, days: int = 7):
@@ -40,31 +71,18 @@ class moderation(commands.Cog):
             )
         )
 
-    async def _end_poll(self, guild, message):
+    async def _end_poll(self, message):
         """Ends a poll and sends the results."""
-        polls = self.DB.main.get(b"polls")
-
-        if not polls:
-            return
-
-        message_id = str(message.id)
-        polls = orjson.loads(polls)
+        poll = await self.DB.end_poll(message.id)
 
-        if guild not in polls:
+        if not poll:
             return
 
-        if message_id not in polls[guild]:
-            return
-
-        winner = max(
-            polls[guild][message_id], key=lambda x: polls[guild][message_id][x]["count"]
-        )
+        options = poll["options"]
+        winner = max(options, key=lambda x: options[x]["count"])
 
         await message.reply(f"Winner of the poll was {winner}")
 
-        polls[guild].pop(message_id)
-        self.DB.main.put(b"polls", orjson.dumps(polls))
-
     @commands.command()
     @commands.has_permissions(kick_members=True)
     async def poll(self, ctx, title, *options):
@@ -83,75 +101,45 @@ class moderation(commands.Cog):
             embed.description = "```You need at least 2 options```"
             return await ctx.send(embed=embed)
 
-        polls = self.DB.main.get(b"polls")
-
-        if not polls:
-            polls = {}
-        else:
-            polls = orjson.loads(polls)
-
-        guild = str(ctx.guild.id)
-
-        if guild not in polls:
-            polls[guild] = {}
-
-        polls[guild]["temp"] = {}
+        options = {
+            chr(127462 + number): option for number, option in enumerate(options)
+        }
         embed.description = ""
 
-        for number, option in enumerate(options):
-            emoji = chr(127462 + number)
-            polls[guild]["temp"][emoji] = {
-                "name": option,
-                "count": 0,
-            }
+        for emoji, option in options.items():
             embed.description += f"{emoji}: {option}\n"
 
         embed.title = title
         message = await ctx.send(embed=embed)
 
-        polls[guild][str(message.id)] = polls[guild].pop("temp")
+        for emoji in options:
+            await message.add_reaction(emoji)
 
-        for i in range(len(options)):
-            await message.add_reaction(chr(127462 + i))
-
-        self.DB.main.put(b"polls", orjson.dumps(polls))
-        self.loop.call_later(21600, asyncio.create_task, self.end_poll(guild, message))
+        await self.DB.add_poll(
+            message.id, ctx.guild.id, options, ctx.channel.id, time.time() + 21600
+        )
+        self.loop.call_later(21600, asyncio.create_task, self._end_poll(message))
 
     @commands.command()
     @commands.has_permissions(kick_members=True)
-    async def end_poll(self, ctx, message_id):
+    async def end_poll(self, ctx, message_id: int):
         """Ends a poll based off its message id."""
-        polls = self.DB.main.get(b"polls")
+        poll = self.DB.active_polls.get(message_id)
 
-        if not polls:
-            return
-
-        polls = orjson.loads(polls)
-
-        if str(ctx.guild.id) not in polls:
+        if not poll or poll["guild"] != ctx.guild.id:
             return await ctx.send(
                 embed=discord.Embed(
-                    color=discord.Colo.blurple(), description="No polls found"
+                    color=discord.Color.blurple(), description="Poll not found"
                 )
             )
 
-        if message_id not in polls[str(ctx.guild.id)]:
-            return await ctx.send(
-                embed=discord.Embed(
-                    color=discord.Colo.blurple(), description="Poll not found"
-                )
-            )
+        await self.DB.end_poll(message_id)
 
-        winner = max(
-            polls[str(ctx.guild.id)][message_id],
-            key=lambda x: polls[str(ctx.guild.id)][message_id][x]["count"],
-        )
+        options = poll["options"]
+        winner = max(options, key=lambda x: options[x]["count"])
 
         await ctx.reply(f"Winner of the poll was {winner}")
 
-        polls[str(ctx.guild.id)].pop(message_id)
-        self.DB.main.put(b"polls", orjson.dumps(polls))
-
     @commands.command(name="mute")
     @commands.has_permissions(kick_members=True)
     async def mute_member(self, ctx, member: discord.Member, *, reason=None):
@@ -169,7 +157,7 @@ class moderation(commands.Cog):
             return await ctx.send(embed=embed)
 
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
 
         if not infractions:
             infractions = {
@@ -227,7 +215,7 @@ class moderation(commands.Cog):
         )
         await ctx.send(embed=embed)
 
-        self.DB.infractions.put(member_id, orjson.dumps(infractions))
+        await self.DB.infractions.put(member_id, orjson.dumps(infractions))
 
     @commands.command()
     @commands.has_permissions(manage_nicknames=True)
@@ -249,7 +237,7 @@ class moderation(commands.Cog):
         reason: str
         """
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
 
         if not infractions:
             infractions = {
@@ -273,7 +261,7 @@ class moderation(commands.Cog):
         )
         await ctx.send(embed=embed)
 
-        self.DB.infractions.put(member_id, orjson.dumps(infractions))
+        await self.DB.infractions.put(member_id, orjson.dumps(infractions))
 
     @commands.command()
     @commands.has_permissions(manage_messages=True)
@@ -283,7 +271,7 @@ class moderation(commands.Cog):
         member: discord.members
         """
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not infractions:
@@ -307,8 +295,8 @@ class moderation(commands.Cog):
         seconds = 0
         times = {"s": 1, "m": 60, "h": 3600, "d": 86400}
         try:
-            for time in duration.split():
-                seconds += int(time[:-1]) * times[time[-1]]
+            for amount in duration.split():
+                seconds += int(amount[:-1]) * times[amount[-1]]
         except ValueError:
             return None
 
@@ -344,7 +332,7 @@ class moderation(commands.Cog):
         await member.ban(reason=reason)
 
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
 
         if not infractions:
             infractions = {
@@ -361,7 +349,7 @@ class moderation(commands.Cog):
         infractions["bans"].append(reason)
 
         embed.description = f"```They had {infractions['count']} total infractions.```"
-        self.DB.infractions.put(member_id, orjson.dumps(infractions))
+        await self.DB.infractions.put(member_id, orjson.dumps(infractions))
 
         await ctx.send(embed=embed)
 
@@ -437,7 +425,7 @@ class moderation(commands.Cog):
         await member.kick()
 
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
 
         if not infractions:
             infractions = {
@@ -459,7 +447,7 @@ class moderation(commands.Cog):
             description=f"```They had {infractions['count']} total infractions.```",
         )
         await ctx.send(embed=embed)
-        self.DB.infractions.put(member_id, orjson.dumps(infractions))
+        await self.DB.infractions.put(member_id, orjson.dumps(infractions))
 
     @commands.command()
     @commands.has_permissions(manage_roles=True)
@@ -580,7 +568,7 @@ class moderation(commands.Cog):
 
     @history.command(aliases=["d"])
     @commands.has_permissions(manage_messages=True)
-    async def deleted(self, ctx, member: discord.Member = None):
+    async def deleted(self, ctx, member: discord.Member = None, amount: int = 100):
         """Shows a members most recent deleted message history.
 
         member: discord.Member
@@ -590,19 +578,19 @@ class moderation(commands.Cog):
         """
         member = member or ctx.author
 
-        member_id = f"{ctx.guild.id}-{member.id}".encode()
-        deleted = self.DB.deleted.get(member_id)
+        deleted = await self.DB.get_history(
+            self.DB.deleted, ctx.guild.id, member.id, amount
+        )
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not deleted:
             embed.description = "```No deleted messages found```"
             return await ctx.send(embed=embed)
 
-        deleted = orjson.loads(deleted)
         messages = []
 
-        for index, date in enumerate(reversed(deleted)):
-            messages.append((date, deleted[date].replace("`", "`​")))
+        for date, content in deleted:
+            messages.append((date, content.replace("`", "`​")))
 
         pages = menus.MenuPages(
             source=HistoryMenu(messages),
@@ -623,23 +611,20 @@ class moderation(commands.Cog):
         """
         member = member or ctx.author
 
-        member_id = f"{ctx.guild.id}-{member.id}".encode()
-        edited = self.DB.edited.get(member_id)
+        edited = await self.DB.get_history(
+            self.DB.edited, ctx.guild.id, member.id, amount
+        )
         embed = discord.Embed(color=discord.Color.blurple())
 
         if not edited:
             embed.description = "```No edited messages found```"
             return await ctx.send(embed=embed)
 
-        edited = orjson.loads(edited)
         messages = []
 
-        for index, date in enumerate(reversed(edited)):
-            if index == amount:
-                break
-
-            before = edited[date][0].replace("`", "`\u200b")
-            after = edited[date][1].replace("`", "`\u200b")
+        for date, (before, after) in edited:
+            before = before.replace("`", "`\u200b")
+            after = after.replace("`", "`\u200b")
 
             messages.append((date, f"{before} >>> {after}"))
 
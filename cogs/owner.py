@@ -12,6 +12,7 @@ from discord.ext import commands
 import discord
 import orjson
 
+from cogs.utils.database import AsyncDB, backup_chain, backup_files
 from cogs.utils.useful import run_process
 
 
@@ -127,8 +128,7 @@ class owner(commands.Cog):
     @commands.command(name="wipeblacklist")
     async def wipe_blacklist(self, ctx):
         """Wipes everyone from the blacklist list includes downvoted members."""
-        for member, value in self.DB.blacklist:
-            self.DB.blacklist.delete(member)
+        await self.DB.clear_blacklist()
 
     @commands.group()
     async def db(self, ctx):
@@ -136,7 +136,7 @@ class owner(commands.Cog):
             await ctx.send(
                 embed=discord.Embed(
                     color=discord.Color.blurple(),
-                    description=f"```Usage: {ctx.prefix}db [del/show/get/put/pre]```",
+                    description=f"```Usage: {ctx.prefix}db [del/show/get/put/pre/latency/stats/migrate/compact]```",
                 )
             )
 
@@ -147,7 +147,7 @@ class owner(commands.Cog):
         key: str
         value: str
         """
-        self.DB.main.put(key.encode(), value.encode())
+        await self.DB.main.put(key.encode(), value.encode())
 
         await ctx.send(
             embed=discord.Embed(
@@ -162,7 +162,7 @@ class owner(commands.Cog):
 
         key: str
         """
-        self.DB.main.delete(key.encode())
+        await self.DB.main.delete(key.encode())
 
         await ctx.send(
             embed=discord.Embed(
@@ -177,7 +177,7 @@ class owner(commands.Cog):
 
         key: str
         """
-        item = self.DB.main.get(key.encode())
+        item = await self.DB.main.get(key.encode())
 
         if not item:
             return await ctx.send(
@@ -187,7 +187,7 @@ class owner(commands.Cog):
                 )
             )
 
-        file = StringIO(item.decode())
+        file = StringIO(str(self.DB.dump_value(key.encode(), item)))
 
         await ctx.send(file=discord.File(file, "data.txt"))
 
@@ -195,32 +195,30 @@ class owner(commands.Cog):
     async def show(self, ctx, exclude=True):
         """Sends a json of the entire database."""
         database = {}
+        await self.DB.flush()
+
+        # Index keys are binary and can be rebuilt from the values
+        excluded = {name.encode() for name in self.DB.leaderboards}
 
         if exclude:
-            excluded = (
-                b"crypto",
-                b"stocks",
-                b"message_count",
-                b"invites",
-                b"karma",
-                b"boot_times",
-                b"aliases",
+            excluded.update(
+                (
+                    b"crypto",
+                    b"stocks",
+                    b"message_count",
+                    b"invites",
+                    b"karma",
+                    b"boot_times",
+                    b"aliases",
+                )
             )
 
-            for key, value in self.DB.main:
-                if key.split(b"-")[0] not in excluded:
-                    if value[:1] in [b"{", b"["]:
-                        value = orjson.loads(value)
-                    else:
-                        value = value.decode()
-                    database[key.decode()] = value
-        else:
-            for key, value in self.DB.main:
-                if value[:1] in [b"{", b"["]:
-                    value = orjson.loads(value)
-                else:
-                    value = value.decode()
-                database[key.decode()] = value
+        def dump(key, value):
+            if key.split(b"-")[0] not in excluded:
+                return key.decode(), self.DB.dump_value(key, value)
+
+        async for chunk in self.DB.main.scan(dump):
+            database.update(chunk)
 
         file = StringIO(str(database))
         await ctx.send(file=discord.File(file, "data.json"))
@@ -228,7 +226,7 @@ class owner(commands.Cog):
     @db.command(aliases=["pre"])
     async def show_prefixed(self, ctx, prefixed):
         """Sends a json of the entire database."""
-        if not hasattr(self.DB, prefixed):
+        if not isinstance(getattr(self.DB, prefixed, None), AsyncDB):
             return await ctx.send(
                 embed=discord.Embed(
                     color=discord.Color.blurple(),
@@ -236,21 +234,156 @@ class owner(commands.Cog):
                 )
             )
 
-        database = {
-            key.decode(): value.decode() for key, value in getattr(self.DB, prefixed)
-        }
+        await self.DB.flush()
+        database = {}
+        prefix = f"{prefixed}-".encode()
+
+        async for chunk in getattr(self.DB, prefixed).scan(
+            lambda key, value: (key.decode(), self.DB.dump_value(prefix + key, value))
+        ):
+            database.update(chunk)
 
         file = StringIO(str(database))
 
         await ctx.send(file=discord.File(file, "data.json"))
 
+    @db.command()
+    async def latency(self, ctx):
+        """Shows how long database calls are taking."""
+        executor = self.DB.executor
+        msg = f"Queued: {executor.queued}/{executor.queue_size}\n"
+        msg += f"Skipped reactions: {self.DB.skipped_reactions}\n"
+
+        if self.DB.backup_progress is not None:
+            msg += f"Backup: {self.DB.backup_progress} keys written\n"
+        elif last_backup := await self.DB.main.get(b"last_backup"):
+            last_backup = orjson.loads(last_backup)
+            msg += "Last backup: {} keys {:.2f}MB in {:.2f}s\n".format(
+                last_backup["keys"],
+                last_backup["bytes"] / 1000000,
+                last_backup["duration"],
+            )
+
+        for name, update in self.DB.market_updates.items():
+            msg += "{} refresh: {} changed {} unchanged {} removed\n".format(
+                name, update["changed"], update["unchanged"], update["removed"]
+            )
+
+        msg += "\n"
+        msg += "Call:                  Count:     Avg:       Max:\n"
+
+        stats = sorted(
+            executor.copy_stats().items(), key=lambda item: item[1][1], reverse=True
+        )
+
+        # Sorted by total time so the calls blocking the most show first
+        for name, (count, total, highest, *_) in stats[:40]:
+            msg += "{:<23}{:<11}{:<11}{:.2f}ms\n".format(
+                name, count, f"{total / count * 1000:.2f}ms", highest * 1000
+            )
+
+        embed = discord.Embed(color=discord.Color.blurple())
+        embed.description = f"```\n{msg}```"
+        await ctx.send(embed=embed)
+
+    @db.command()
+    async def stats(self, ctx, prefix=""):
+        """Shows the calls, bytes and latency percentiles of each prefixed DB.
+
+        prefix: str
+            Only show one prefix with its hot keys, or export to send the
+            stats and histograms as json.
+        """
+        executor = self.DB.executor
+
+        if prefix == "export":
+            stats = orjson.dumps(executor.export(), option=orjson.OPT_INDENT_2)
+            file = StringIO(stats.decode())
+            return await ctx.send(file=discord.File(file, "stats.json"))
+
+        msg = "Call:                  Count:   Read:     Written:  p50:     p99:\n"
+
+        copy = executor.copy_stats()
+
+        for name in sorted(copy):
+            if prefix and name.split(".")[0] != prefix:
+                continue
+
+            stats = copy[name]
+            msg += "{:<23}{:<9}{:<10}{:<10}{:<9}{:.2f}ms\n".format(
+                name,
+                stats[0],
+                f"{stats[3] / 1000:.1f}KB",
+                f"{stats[4] / 1000:.1f}KB",
+                f"{executor.percentile(name, 0.5, copy) * 1000:.2f}ms",
+                executor.percentile(name, 0.99, copy) * 1000,
+            )
+
+        if prefix in executor.keys:
+            msg += "\nHot keys:\n"
+            for key, count in executor.keys[prefix].most_common(10):
+                msg += f"{key.decode(errors='backslashreplace'):<40}{count}\n"
+
+        embed = discord.Embed(color=discord.Color.blurple())
+        embed.description = f"```\n{msg[:4000]}```"
+        await ctx.send(embed=embed)
+
+    @db.command()
+    async def migrate(self, ctx, version: int = None):
+        """Runs the pending schema migrations or reruns one.
+
+        version: int
+        """
+        start = time.perf_counter()
+
+        if version is None:
+            migrated = await self.DB.migrate()
+        else:
+            migrated = {version: await self.DB.run_migration(version)}
+
+        msg = "".join(
+            f"Version {version}: {count} keys\n" for version, count in migrated.items()
+        )
+        msg += f"Schema version {self.DB.schema_version}"
+        msg += f" in {time.perf_counter() - start:.2f}s"
+
+        embed = discord.Embed(color=discord.Color.blurple())
+        embed.description = f"```\n{msg}```"
+        await ctx.send(embed=embed)
+
+    @db.command()
+    async def compact(self, ctx, *prefixes):
+        """Compacts prefixes of the database and shows the size and scan times.
+
+        prefixes: tuple[str]
+            Defaults to stocks and crypto.
+        """
+        prefixes = prefixes or ("stocks", "crypto")
+        stats = await self.DB.compact([f"{prefix}-".encode() for prefix in prefixes])
+
+        msg = "Prefix:          Size:                    Scan:\n"
+
+        for prefix, data in stats["prefixes"].items():
+            size = "{:.2f}MB -> {:.2f}MB".format(*[b / 1000000 for b in data["size"]])
+            msg += "{:<17}{:<25}{:.2f}ms -> {:.2f}ms\n".format(
+                prefix, size, *[scan * 1000 for scan in data["scan"]]
+            )
+
+        before, after = stats["disk"]
+        msg += f"\nDisk: {before / 1000000:.2f}MB -> {after / 1000000:.2f}MB"
+        msg += f" in {stats['duration']:.2f}s"
+
+        embed = discord.Embed(color=discord.Color.blurple())
+        embed.description = f"```\n{msg}```"
+        await ctx.send(embed=embed)
+
     @commands.command(aliases=["clearinf"])
     async def clear_infractions(self, ctx, member: discord.Member):
         """Removes all infractions of a member.
 
         member: discord.Member
         """
-        self.DB.infractions.delete(f"{ctx.guild.id}-{member.id}".encode())
+        await self.DB.infractions.delete(f"{ctx.guild.id}-{member.id}".encode())
 
     @commands.command(aliases=["showinf"])
     async def show_infractions(self, ctx, member: discord.Member):
@@ -259,7 +392,7 @@ class owner(commands.Cog):
         member: discord.Member
         """
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
 
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -275,7 +408,7 @@ class owner(commands.Cog):
 
         await ctx.send(embed=embed)
 
-        self.DB.infractions.put(member_id, orjson.dumps(infractions))
+        await self.DB.infractions.put(member_id, orjson.dumps(infractions))
 
     @commands.command(aliases=["removeinf"])
     async def remove_infraction(
@@ -290,7 +423,7 @@ class owner(commands.Cog):
             The index of the infraction to remove e.g 0, 1, 2
         """
         member_id = f"{ctx.guild.id}-{member.id}".encode()
-        infractions = self.DB.infractions.get(member_id)
+        infractions = await self.DB.infractions.get(member_id)
 
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -304,7 +437,7 @@ class owner(commands.Cog):
         embed.description = f"Deleted infraction [{infraction}] from {member}"
         await ctx.send(embed=embed)
 
-        self.DB.infractions.put(member_id, orjson.dumps(infractions))
+        await self.DB.infractions.put(member_id, orjson.dumps(infractions))
 
     @commands.command(name="loglevel")
     async def log_level(self, ctx, level):
@@ -327,15 +460,14 @@ class owner(commands.Cog):
         """
         embed = discord.Embed(color=discord.Color.blurple())
 
-        user_id = str(user.id).encode()
-        if self.DB.blacklist.get(user_id):
-            self.DB.blacklist.delete(user_id)
+        if user.id in self.DB.blacklisted:
+            await self.DB.set_blacklist(user.id, None)
 
             embed.title = "User Unblacklisted"
             embed.description = f"***{user}*** has been unblacklisted"
             return await ctx.send(embed=embed)
 
-        self.DB.blacklist.put(user_id, b"2")
+        await self.DB.set_blacklist(user.id, b"2")
         embed.title = "User Blacklisted"
         embed.description = f"**{user}** has been added to the blacklist"
 
@@ -349,42 +481,77 @@ class owner(commands.Cog):
         """
         embed = discord.Embed(color=discord.Color.blurple())
 
-        user_id = str(user.id).encode()
-        if self.DB.blacklist.get(user_id):
-            self.DB.blacklist.delete(user_id)
+        if user.id in self.DB.blacklisted:
+            await self.DB.set_blacklist(user.id, None)
 
             embed.title = "User Undownvoted"
             embed.description = f"***{user}*** has been undownvoted"
             return await ctx.send(embed=embed)
 
-        self.DB.blacklist.put(user_id, b"1")
+        await self.DB.set_blacklist(user.id, b"1")
         embed.title = "User Downvoted"
         embed.description = f"**{user}** has been added to the downvote list"
 
         await ctx.send(embed=embed)
 
     @commands.command()
-    async def backup(self, ctx, number: int = None):
-        """Sends the bot database backup as a json file.
+    async def backup(self, ctx, number: int = 0):
+        """Sends a database backup as a gzipped json lines file.
 
         number: int
-            Which backup to get.
+            How many backups before the latest to get.
         """
-        if not number:
-            number = int(self.DB.main.get(b"backup_number").decode())
+        names = backup_files("backup")
+
+        if not names:
+            return await ctx.send(
+                embed=discord.Embed(
+                    color=discord.Color.blurple(),
+                    description="```No backups found```",
+                )
+            )
 
-            with open(f"backup/{number}backup.json", "rb") as file:
-                return await ctx.send(file=discord.File(file, "backup.json"))
+        name = names[-1 - min(len(names) - 1, max(number, 0))]
 
-        number = min(10, max(number, 0))
+        with open(f"backup/{name}", "rb") as file:
+            await ctx.send(file=discord.File(file, name))
 
-        with open(f"backup/{number}backup.json", "rb") as file:
-            await ctx.send(file=discord.File(file, "backup.json"))
+    @commands.command()
+    async def restore(self, ctx, verify: bool = False):
+        """Restores the database from the latest full and incremental backup.
+
+        verify: bool
+            Whether to only check the checksums of the backups.
+        """
+        embed = discord.Embed(color=discord.Color.blurple())
+        chain = backup_chain("backup")
+        size = sum(os.path.getsize(path) for path in chain) / 1000000
+        start = time.perf_counter()
+
+        try:
+            if verify:
+                headers, keys = await self.DB.verify_backups(chain)
+                duration = time.perf_counter() - start
+                action = "Verified"
+            else:
+                stats = await self.DB.restore(chain)
+                keys, duration = stats["keys"], stats["duration"]
+                action = "Restored"
+        except ValueError as e:
+            embed.description = f"```{e}```"
+            return await ctx.send(embed=embed)
+
+        embed.description = (
+            f"```{action} {keys} keys from {len(chain)} backups ({size:.2f}MB)"
+            f" in {duration:.2f}s\n{keys / duration:,.0f} keys/s"
+            f" {size / duration:.2f}MB/s```"
+        )
+        await ctx.send(embed=embed)
 
     @commands.command(name="boot")
     async def boot_times(self, ctx):
         """Shows the average fastest and slowest boot times of the bot."""
-        boot_times = self.DB.main.get(b"boot_times")
+        boot_times = await self.DB.main.get(b"boot_times")
 
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -418,7 +585,7 @@ class owner(commands.Cog):
     @cache.command()
     async def wipe(self, ctx):
         """Wipes cache from the db."""
-        self.DB.main.delete(b"cache")
+        await self.DB.main.delete(b"cache")
 
         await ctx.send(
             embed=discord.Embed(
@@ -430,7 +597,7 @@ class owner(commands.Cog):
     async def list(self, ctx):
         """Lists the cached items in the db."""
         embed = discord.Embed(color=discord.Color.blurple())
-        cache = self.DB.main.get(b"cache")
+        cache = await self.DB.main.get(b"cache")
 
         if not cache or cache == b"{}":
             embed.description = "```Nothing has been cached```"
@@ -687,7 +854,7 @@ class owner(commands.Cog):
     async def restart(self, ctx):
         """Restarts all extensions."""
         embed = discord.Embed(color=discord.Color.blurple())
-        self.DB.main.put(b"restart", b"1")
+        await self.DB.main.put(b"restart", b"1")
 
         for ext in [f[:-3] for f in os.listdir("cogs") if f.endswith(".py")]:
             try:
@@ -715,7 +882,7 @@ class owner(commands.Cog):
     async def rrole_list(self, ctx):
         """Sends a list of the message ids of current reaction roles."""
         msg = ""
-        for message_id, roles in self.DB.rrole:
+        for message_id, roles in await self.DB.rrole.items():
             msg += f"\n\n{message_id.decode()}: {orjson.loads(roles)}"
         await ctx.send(f"```{msg}```")
 
@@ -726,7 +893,8 @@ class owner(commands.Cog):
         message: int
             Id of the reaction role messgae to delete.
         """
-        self.DB.rrole.delete(str(message_id).encode())
+        await self.DB.rrole.delete(str(message_id).encode())
+        self.DB.reaction_messages.discard(message_id)
         message = ctx.channel.get_partial_message(message_id)
         await message.delete()
 
@@ -787,9 +955,10 @@ class owner(commands.Cog):
             await message.delete()
             return await ctx.send("Invalid emoji")
 
-        self.DB.rrole.put(
+        await self.DB.rrole.put(
             str(message.id).encode(), orjson.dumps(dict(zip(emojis, roles)))
         )
+        self.DB.reaction_messages.add(message.id)
 
     @rrole.command()
     async def edit(self, ctx, message: discord.Message, *emojis):
@@ -800,7 +969,7 @@ class owner(commands.Cog):
         emojis: tuple
             A tuple of emojis.
         """
-        reaction = self.DB.rrole.get(str(message.id).encode())
+        reaction = await self.DB.rrole.get(str(message.id).encode())
 
         if not reaction:
             return await ctx.send(
@@ -842,7 +1011,7 @@ class owner(commands.Cog):
         for emoji, role in zip(emojis, roles):
             reaction[emoji] = role
 
-        self.DB.rrole.put(str(message.id).encode(), orjson.dumps(reaction))
+        await self.DB.rrole.put(str(message.id).encode(), orjson.dumps(reaction))
 
     @staticmethod
     async def await_for_message(ctx, message):
@@ -2,7 +2,8 @@ import textwrap
 
 from discord.ext import commands, menus
 import discord
-import orjson
+
+from cogs.utils.useful import sparkline
 
 
 class StockMenu(menus.ListPageSource):
@@ -37,7 +38,7 @@ class stocks(commands.Cog):
         if not ctx.subcommand_passed:
             embed = discord.Embed(color=discord.Color.blurple())
             embed.description = (
-                f"```Usage: {ctx.prefix}stock [buy/sell/bal/profile/list/history]"
+                f"```Usage: {ctx.prefix}stock [buy/sell/bal/profile/list/history/chart]"
                 f" or {ctx.prefix}stock [ticker]```"
             )
             return await ctx.send(embed=embed)
@@ -69,6 +70,49 @@ class stocks(commands.Cog):
             """
         )
 
+        history = await self.DB.get_price_history(self.DB.stocks, symbol, 86400)
+
+        if len(history) > 1:
+            chart = sparkline([price for _, price in history])
+            embed.add_field(name="24h", value=f"```{chart}```")
+
+        await ctx.send(embed=embed)
+
+    @stock.command()
+    async def chart(self, ctx, symbol, period="1d"):
+        """Shows a chart of the price of a stock and how much it changed.
+
+        symbol: str
+            The symbol of the stock.
+        period: str
+            How far back to go e.g 6h, 1d or 4w, up to a year.
+        """
+        embed = discord.Embed(color=discord.Color.blurple())
+        symbol = symbol.upper()
+        times = {"h": 3600, "d": 86400, "w": 604800}
+
+        try:
+            seconds = int(period[:-1]) * times[period[-1]]
+        except (ValueError, KeyError, IndexError):
+            embed.description = "```Invalid period. Example: 6h, 1d or 4w```"
+            return await ctx.send(embed=embed)
+
+        history = await self.DB.get_price_history(self.DB.stocks, symbol, seconds)
+
+        if len(history) < 2:
+            embed.description = f"```No price history for {symbol} yet```"
+            return await ctx.send(embed=embed)
+
+        prices = [price for _, price in history]
+        change = (prices[-1] / prices[0] - 1) * 100 if prices[0] else 0
+
+        embed.title = f"{symbol} over {period}"
+        embed.description = (
+            f"```diff\n{sparkline(prices)}\n\n"
+            f"{'+' if change >= 0 else ''}{change:.2f}%```"
+        )
+        embed.set_footer(text=f"${prices[0]:,.2f} -> ${prices[-1]:,.2f}")
+
         await ctx.send(embed=embed)
 
     @stock.command()
@@ -83,47 +127,51 @@ class stocks(commands.Cog):
         embed = discord.Embed(color=discord.Color.blurple())
 
         symbol = symbol.upper()
-        price = await self.DB.get_stock(symbol)
+        price = await self.DB.get_stock_price(symbol)
 
-        if not price:
+        if price is None:
             embed.description = f"```Couldn't find stock {symbol}```"
             return await ctx.send(embed=embed)
 
-        price = price["price"]
         member_id = str(ctx.author.id).encode()
-        stockbal = await self.DB.get_stockbal(member_id)
 
-        if not stockbal:
-            embed.description = f"```You have never invested in {symbol}```"
-            return await ctx.send(embed=embed)
+        async with self.DB.transaction(member_id) as txn:
+            stockbal = await txn.get_stockbal(member_id)
 
-        if amount[-1] == "%":
-            amount = stockbal[symbol]["total"] * ((float(amount[:-1])) / 100)
-        else:
-            amount = float(amount)
+            if not stockbal:
+                embed.description = f"```You have never invested in {symbol}```"
+                return await ctx.send(embed=embed)
 
-        if amount < 0:
-            embed.description = "```You can't sell a negative amount of stocks```"
-            return await ctx.send(embed=embed)
+            if amount[-1] == "%":
+                amount = stockbal[symbol]["total"] * ((float(amount[:-1])) / 100)
+            else:
+                amount = float(amount)
 
-        if stockbal[symbol]["total"] < amount:
-            embed.description = (
-                f"```Not enough stock you have: {stockbal[symbol]['total']}```"
-            )
-            return await ctx.send(embed=embed)
+            if amount < 0:
+                embed.description = "```You can't sell a negative amount of stocks```"
+                return await ctx.send(embed=embed)
 
-        bal = await self.DB.get_bal(member_id)
+            if stockbal[symbol]["total"] < amount:
+                embed.description = (
+                    f"```Not enough stock you have: {stockbal[symbol]['total']}```"
+                )
+                return await ctx.send(embed=embed)
+
+            bal = await txn.get_bal(member_id)
 
-        cash = amount * float(price)
+            cash = amount * price
 
-        stockbal[symbol]["total"] -= amount
+            stockbal[symbol]["total"] -= amount
+
+            if stockbal[symbol]["total"] == 0:
+                stockbal.pop(symbol, None)
+            else:
+                stockbal[symbol]["history"].append((-amount, cash))
 
-        if stockbal[symbol]["total"] == 0:
-            stockbal.pop(symbol, None)
-        else:
-            stockbal[symbol]["history"].append((-amount, cash))
+            bal += cash
 
-        bal += cash
+            txn.put_bal(member_id, bal)
+            txn.put_stockbal(member_id, stockbal)
 
         embed = discord.Embed(
             title=f"Sold {amount:.2f} stocks for ${cash:.2f}",
@@ -133,9 +181,6 @@ class stocks(commands.Cog):
 
         await ctx.send(embed=embed)
 
-        await self.DB.put_bal(member_id, bal)
-        await self.DB.put_stockbal(member_id, stockbal)
-
     @stock.command(aliases=["buy"])
     async def invest(self, ctx, symbol, cash: float):
         """Buys stock or if nothing is passed in it shows the price of some stocks.
@@ -151,31 +196,35 @@ class stocks(commands.Cog):
             return await ctx.send(embed=embed)
 
         symbol = symbol.upper()
-        stock = await self.DB.get_stock(symbol)
+        price = await self.DB.get_stock_price(symbol)
 
-        if not stock:
+        if price is None:
             embed.description = f"```Couldn't find stock {symbol}```"
             return await ctx.send(embed=embed)
 
-        stock = stock["price"]
         member_id = str(ctx.author.id).encode()
-        bal = await self.DB.get_bal(member_id)
 
-        if bal < cash:
-            embed.description = "```You don't have enough cash```"
-            return await ctx.send(embed=embed)
+        async with self.DB.transaction(member_id) as txn:
+            bal = await txn.get_bal(member_id)
 
-        amount = cash / float(stock)
+            if bal < cash:
+                embed.description = "```You don't have enough cash```"
+                return await ctx.send(embed=embed)
 
-        stockbal = await self.DB.get_stockbal(member_id)
+            amount = cash / price
 
-        if symbol not in stockbal:
-            stockbal[symbol] = {"total": 0, "history": [(amount, cash)]}
-        else:
-            stockbal[symbol]["history"].append((amount, cash))
+            stockbal = await txn.get_stockbal(member_id)
+
+            if symbol not in stockbal:
+                stockbal[symbol] = {"total": 0, "history": [(amount, cash)]}
+            else:
+                stockbal[symbol]["history"].append((amount, cash))
 
-        stockbal[symbol]["total"] += amount
-        bal -= cash
+            stockbal[symbol]["total"] += amount
+            bal -= cash
+
+            txn.put_bal(member_id, bal)
+            txn.put_stockbal(member_id, stockbal)
 
         embed = discord.Embed(
             title=f"You bought {amount:.2f} stocks in {symbol}",
@@ -185,9 +234,6 @@ class stocks(commands.Cog):
 
         await ctx.send(embed=embed)
 
-        await self.DB.put_bal(member_id, bal)
-        await self.DB.put_stockbal(member_id, stockbal)
-
     @stock.command(aliases=["balance"])
     async def bal(self, ctx, symbol):
         """Shows the amount of stocks you have bought in a stock.
@@ -208,24 +254,29 @@ class stocks(commands.Cog):
             embed.description = f"```You have never invested in {symbol}```"
             return await ctx.send(embed=embed)
 
-        stock = await self.DB.get_stock(symbol)
+        stock = (await self.DB.get_prices(self.DB.stocks)).row(symbol)
+
+        if not stock:
+            embed.description = f"```Couldn't find stock {symbol}```"
+            return await ctx.send(embed=embed)
 
+        price, _, cap = stock
         trades = [
             trade[1] / trade[0] for trade in stockbal[symbol]["history"] if trade[0] > 0
         ]
-        change = ((float(stock["price"]) / (sum(trades) / len(trades))) - 1) * 100
+        change = ((price / (sum(trades) / len(trades))) - 1) * 100
 
         embed.description = textwrap.dedent(
             f"""
                 ```diff
                 You have {stockbal[symbol]['total']:.2f} stocks in {symbol}
 
-                Price: {stock['price']}
+                Price: {price:,.2f}
 
                 Percent Gain/Loss:
                 {"" if str(change)[0] == "-" else "+"}{change:.2f}%
 
-                Market Cap: {stock['cap']}
+                Market Cap: {cap:,.0f}
                 ```
             """
         )
@@ -259,9 +310,11 @@ class stocks(commands.Cog):
             " Name:  Amount:        Price:             Percent Gain:\n"
         )
 
+        prices = await self.DB.get_prices(self.DB.stocks)
+
         for stock in stockbal:
-            data = await self.DB.get_stock(stock)
-            price = float(data["price"])
+            # Delisted stocks are worth nothing
+            price = prices.get(stock, 0.0)
 
             trades = [
                 trade[1] / trade[0]
@@ -282,14 +335,15 @@ class stocks(commands.Cog):
     @stock.command()
     async def list(self, ctx):
         """Shows the prices of stocks from the nasdaq api."""
-        data = []
-        for i, (stock, price) in enumerate(self.DB.stocks, start=1):
-            price = orjson.loads(price)["price"]
+        prices = await self.DB.get_prices(self.DB.stocks)
 
+        data = []
+        for i, stock in enumerate(sorted(prices), start=1):
+            price = prices.get(stock)
             if not i % 3:
-                data.append(f"{stock.decode():}: ${float(price):.2f}\n")
+                data.append(f"{stock}: ${price:.2f}\n")
             else:
-                data.append(f"{stock.decode():}: ${float(price):.2f}\t".expandtabs())
+                data.append(f"{stock}: ${price:.2f}\t".expandtabs())
 
         pages = menus.MenuPages(
             source=StockMenu(data),
@@ -305,41 +359,27 @@ class stocks(commands.Cog):
         amount: int
             The amount of members to get
         """
+        limit = max(amount, 1) * 2
+
+        # Members the bot can't see are skipped so ask for more until it's full
+        while True:
+            ranking = await self.DB.get_net_top(limit)
+            net_top = [
+                (user, bal)
+                for member_id, bal in ranking
+                if (user := self.bot.get_user(int(member_id)))
+            ]
 
-        def get_value(values, db):
-            if values:
-                return sum(
-                    [
-                        stock[1]["total"]
-                        * float(orjson.loads(db.get(stock[0].encode()))["price"])
-                        for stock in values.items()
-                    ]
-                )
-
-            return 0
-
-        net_top = []
-
-        for member_id, value in self.DB.bal:
-            stock_value = get_value(
-                await self.DB.get_stockbal(member_id), self.DB.stocks
-            )
-            crypto_value = get_value(
-                await self.DB.get_cryptobal(member_id), self.DB.crypto
-            )
-            # fmt: off
-            if (member := self.bot.get_user(int(member_id))):
-                net_top.append(
-                    (float(value) + stock_value + crypto_value, member.display_name)
-                )
-            # fmt: on
+            if len(net_top) >= amount or len(ranking) < limit:
+                break
+            limit *= 2
 
-        net_top = sorted(net_top, reverse=True)[:amount]
+        net_top = net_top[:amount]
         embed = discord.Embed(color=discord.Color.blurple())
 
         embed.title = f"Top {len(net_top)} Richest Members"
         embed.description = "\n".join(
-            [f"**{member}:** ${bal:,.2f}" for bal, member in net_top]
+            [f"**{user.display_name}:** ${bal:,.2f}" for user, bal in net_top]
         )
         await ctx.send(embed=embed)
 
@@ -353,25 +393,10 @@ class stocks(commands.Cog):
         member = member or ctx.author
 
         member_id = str(member.id).encode()
-        bal = await self.DB.get_bal(member_id)
+        bal, stock_value, crypto_value = await self.DB.get_net_worth(member_id)
 
         embed = discord.Embed(color=discord.Color.blurple())
 
-        def get_value(values, db):
-            if values:
-                return sum(
-                    [
-                        stock[1]["total"]
-                        * float(orjson.loads(db.get(stock[0].encode()))["price"])
-                        for stock in values.items()
-                    ]
-                )
-
-            return 0
-
-        stock_value = get_value(await self.DB.get_stockbal(member_id), self.DB.stocks)
-        crypto_value = get_value(await self.DB.get_cryptobal(member_id), self.DB.crypto)
-
         embed.add_field(
             name=f"{member.display_name}'s net worth",
             value=f"${bal + stock_value + crypto_value:,.2f}",
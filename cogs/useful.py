@@ -1,4 +1,5 @@
 from io import StringIO
+import asyncio
 import random
 import re
 import time
@@ -102,7 +103,7 @@ class useful(commands.Cog):
     @commands.command()
     async def tiolanguages(self, ctx):
         """Shows all the languages that tio.run can handle."""
-        languages = orjson.loads(self.DB.main.get(b"tiolanguages"))
+        languages = orjson.loads(await self.DB.main.get(b"tiolanguages"))
 
         pages = menus.MenuPages(
             source=LanguageMenu(languages),
@@ -117,7 +118,7 @@ class useful(commands.Cog):
 
         language: str
         """
-        data = orjson.loads(self.DB.main.get(b"helloworlds"))
+        data = orjson.loads(await self.DB.main.get(b"helloworlds"))
         code = data.get(language)
 
         embed = discord.Embed(color=discord.Color.blurple())
@@ -170,7 +171,7 @@ class useful(commands.Cog):
         if lang == "python":  # tio doesn't default python to python3 it
             lang = "python3"
 
-        if lang not in orjson.loads(self.DB.main.get(b"tiolanguages")):
+        if lang not in orjson.loads(await self.DB.main.get(b"tiolanguages")):
             return await ctx.reply(
                 embed=discord.Embed(
                     color=discord.Color.blurple(),
@@ -453,7 +454,7 @@ class useful(commands.Cog):
     @commands.command()
     async def languages(self, ctx):
         """Shows the languages that the run command can use."""
-        languages = orjson.loads(self.DB.main.get(b"languages"))
+        languages = orjson.loads(await self.DB.main.get(b"languages"))
 
         msg = ""
 
@@ -496,7 +497,7 @@ class useful(commands.Cog):
             return await ctx.send(
                 "```You need to attach the emoji image to the message```"
             )
-        emojis = self.DB.main.get(b"emoji_submissions")
+        emojis = await self.DB.main.get(b"emoji_submissions")
 
         if not emojis:
             emojis = {}
@@ -505,18 +506,25 @@ class useful(commands.Cog):
 
         emojis[str(ctx.message.id)] = {"name": name, "users": []}
 
-        self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
+        await self.DB.main.put(b"emoji_submissions", orjson.dumps(emojis))
+        self.DB.reaction_messages.add(ctx.message.id)
 
     @commands.command()
     async def invites(self, ctx):
         """Shows the invites that users joined from."""
         invite_list = []
-        for member, invite in self.DB.invites:
+
+        def member_invite(member, invite):
+            # Invite keys are {code}-{guild}, member keys are just the member id
             if len(member) <= 18:
-                member = self.bot.get_user(int(member))
+                return int(member), invite.decode()
+
+        async for chunk in self.DB.invites.scan(member_invite):
+            for member, invite in chunk:
+                member = self.bot.get_user(member)
                 # I don't fetch the invite cause it takes 300ms per invite
                 if member:
-                    invite_list.append(f"{member.display_name}: {invite.decode()}\n")
+                    invite_list.append(f"{member.display_name}: {invite}\n")
 
         if not invite_list:
             return await ctx.send(
@@ -571,7 +579,7 @@ class useful(commands.Cog):
 
         lang = lang.strip()
 
-        if lang not in orjson.loads(self.DB.main.get(b"aliases")):
+        if lang not in orjson.loads(await self.DB.main.get(b"aliases")):
             return await ctx.reply(
                 embed=discord.Embed(
                     color=discord.Color.blurple(),
@@ -633,7 +641,7 @@ class useful(commands.Cog):
     @commands.command()
     async def snipe(self, ctx):
         """Snipes the last deleted message."""
-        data = self.DB.main.get(f"{ctx.guild.id}-snipe_message".encode())
+        data = await self.DB.main.get(f"{ctx.guild.id}-snipe_message".encode())
 
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -651,7 +659,7 @@ class useful(commands.Cog):
     @commands.command()
     async def editsnipe(self, ctx):
         """Snipes the last edited message."""
-        data = self.DB.main.get(f"{ctx.guild.id}-editsnipe_message".encode())
+        data = await self.DB.main.get(f"{ctx.guild.id}-editsnipe_message".encode())
 
         embed = discord.Embed(color=discord.Color.blurple())
 
@@ -682,7 +690,7 @@ class useful(commands.Cog):
 
         search: str
         """
-        cache = orjson.loads(self.DB.main.get(b"cache"))
+        cache = orjson.loads(await self.DB.main.get(b"cache"))
 
         if search in cache:
             if len(cache[search]) == 0:
@@ -692,7 +700,7 @@ class useful(commands.Cog):
 
             cache[search].pop(url)
 
-            self.DB.main.put(b"cache", orjson.dumps(cache))
+            await self.DB.main.put(b"cache", orjson.dumps(cache))
 
             return url, title
         return cache
@@ -745,8 +753,10 @@ class useful(commands.Cog):
             message = await ctx.send(embed=embed)
 
             cache[cache_search] = images
-            self.loop.call_later(300, self.DB.delete_cache, cache_search, cache)
-            self.DB.main.put(b"cache", orjson.dumps(cache))
+            self.loop.call_later(
+                300, asyncio.create_task, self.DB.delete_cache(cache_search, cache)
+            )
+            await self.DB.main.put(b"cache", orjson.dumps(cache))
 
         await self.wait_for_deletion(ctx.author, message)
 
@@ -796,8 +806,10 @@ class useful(commands.Cog):
             message = await ctx.send(embed=embed)
 
             cache[cache_search] = images
-            self.loop.call_later(300, self.DB.delete_cache, cache_search, cache)
-            self.DB.main.put(b"cache", orjson.dumps(cache))
+            self.loop.call_later(
+                300, asyncio.create_task, self.DB.delete_cache(cache_search, cache)
+            )
+            await self.DB.main.put(b"cache", orjson.dumps(cache))
 
         await self.wait_for_deletion(ctx.author, message)
 
@@ -0,0 +1,538 @@
+from bisect import bisect_left, bisect_right
+import os
+import threading
+
+import plyvel
+
+try:
+    import lmdb
+except ImportError:
+    lmdb = None
+
+
+def prefix_end(prefix: bytes) -> bytes:
+    """Returns the first key after every key starting with prefix.
+
+    None if there isn't one, as with an empty prefix.
+
+    prefix: bytes
+    """
+    prefix = prefix.rstrip(b"\xff")
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+def leveldb(path, **options):
+    """Opens a LevelDB database, plyvel.DB is the reference backend.
+
+    path: str
+    options are passed to plyvel.DB e.g lru_cache_size, bloom_filter_bits
+    """
+    return plyvel.DB(path, create_if_missing=True, **options)
+
+
+class Backend:
+    """A sorted key value store with the subset of the plyvel.DB interface
+    Database uses.
+
+    get(key, default=None), put(key, value), delete(key)
+    prefixed_db(prefix) a view that adds prefix to keys
+    write_batch(transaction=False) a batch of puts and deletes
+    iterator(prefix, start, stop, reverse, include_key, include_value)
+    snapshot() a read only view with get and iterator
+    approximate_size(start, stop), compact_range(start, stop), close()
+
+    Subclasses implement get, put, delete, iterator, snapshot and _write.
+    """
+
+    def prefixed_db(self, prefix):
+        """Returns a view of the keys starting with prefix.
+
+        prefix: bytes
+        """
+        return PrefixedDB(self, prefix)
+
+    def write_batch(self, transaction=False):
+        """Returns a batch that's written with write or at the end of a with block.
+
+        transaction: bool
+            Whether to skip writing the batch if the with block raises.
+        """
+        return WriteBatch(self, transaction)
+
+    def approximate_size(self, start, stop):
+        """Returns the size of the keys and values in a range.
+
+        start: bytes
+        stop: bytes
+        """
+        with self.iterator(start=start, stop=stop) as iterator:
+            return sum(len(key) + len(value) for key, value in iterator)
+
+    def compact_range(self, start=None, stop=None):
+        """Does nothing as there are no tables to compact."""
+
+    def close(self):
+        """Closes the backend."""
+
+    def __iter__(self):
+        return self.iterator()
+
+
+class WriteBatch:
+    """Collects puts and deletes to write them together.
+
+    db: Backend
+    transaction: bool
+    prefix: bytes
+        Added to the keys of a batch on a prefixed view.
+    """
+
+    def __init__(self, db, transaction=False, prefix=b""):
+        self.db = db
+        self.transaction = transaction
+        self.prefix = prefix
+        self.ops = []
+
+    def put(self, key, value):
+        if type(key) is not bytes or type(value) is not bytes:
+            raise TypeError("Keys and values have to be bytes")
+        self.ops.append((self.prefix + key, value))
+
+    def delete(self, key):
+        self.ops.append((self.prefix + key, None))
+
+    def clear(self):
+        self.ops = []
+
+    def write(self):
+        self.db._write(self.ops)
+        self.ops = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Like plyvel the batch is written on errors unless it's a transaction
+        if exc_type is None or not self.transaction:
+            self.write()
+
+
+class PrefixedDB:
+    """A view of the keys of a backend starting with prefix.
+
+    db: Backend
+    prefix: bytes
+    """
+
+    def __init__(self, db, prefix):
+        self.db = db
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        return self.db.get(self.prefix + key, default)
+
+    def put(self, key, value):
+        self.db.put(self.prefix + key, value)
+
+    def delete(self, key):
+        self.db.delete(self.prefix + key)
+
+    def write_batch(self, transaction=False):
+        return WriteBatch(self.db, transaction, self.prefix)
+
+    def prefixed_db(self, prefix):
+        return PrefixedDB(self.db, self.prefix + prefix)
+
+    def iterator(
+        self,
+        prefix=None,
+        start=None,
+        stop=None,
+        reverse=False,
+        include_key=True,
+        include_value=True,
+    ):
+        if prefix is not None:
+            start, stop = prefix, prefix_end(prefix)
+
+        start = self.prefix + (start or b"")
+        stop = prefix_end(self.prefix) if stop is None else self.prefix + stop
+
+        return PrefixedIterator(
+            self.db.iterator(
+                start=start,
+                stop=stop,
+                reverse=reverse,
+                include_value=include_value,
+            ),
+            self.prefix,
+            include_key,
+            include_value,
+        )
+
+    def __iter__(self):
+        return self.iterator()
+
+
+class PrefixedIterator:
+    """Strips the prefix of a view from the keys of an iterator.
+
+    iterator: SortedIterator | LMDBIterator
+    prefix: bytes
+    include_key: bool
+    include_value: bool
+    """
+
+    def __init__(self, iterator, prefix, include_key, include_value):
+        self.iterator = iterator
+        self.prefix = prefix
+        self.length = len(prefix)
+        self.include_key = include_key
+        self.include_value = include_value
+
+    def __next__(self):
+        item = next(self.iterator)
+
+        if not self.include_key:
+            return item[1]
+        if not self.include_value:
+            return item[self.length :]
+        return item[0][self.length :], item[1]
+
+    def seek(self, target):
+        self.iterator.seek(self.prefix + target)
+
+    def close(self):
+        self.iterator.close()
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SortedIterator:
+    """Iterates over a key range of a MemoryBackend.
+
+    The position is the last key returned so writes during iteration
+    don't skip or repeat keys, like plyvel start is inclusive and stop
+    exclusive.
+    """
+
+    def __init__(
+        self,
+        db,
+        prefix=None,
+        start=None,
+        stop=None,
+        reverse=False,
+        include_key=True,
+        include_value=True,
+    ):
+        if prefix is not None:
+            start, stop = prefix, prefix_end(prefix)
+
+        self.db = db
+        self.start = start
+        self.stop = stop
+        self.reverse = reverse
+        self.include_key = include_key
+        self.include_value = include_value
+        # The next key is the first after (or before if reversed) the position,
+        # it's inclusive after a seek
+        self.position = None
+        self.inclusive = True
+
+    def __next__(self):
+        keys = self.db.keys
+
+        with self.db.lock:
+            if self.reverse:
+                if self.position is None:
+                    i = len(keys) if self.stop is None else bisect_left(keys, self.stop)
+                else:
+                    i = bisect_left(keys, self.position)
+                i -= 1
+
+                if i < 0 or (self.start is not None and keys[i] < self.start):
+                    raise StopIteration
+            else:
+                if self.position is None:
+                    i = 0 if self.start is None else bisect_left(keys, self.start)
+                elif self.inclusive:
+                    i = bisect_left(keys, self.position)
+                else:
+                    i = bisect_right(keys, self.position)
+
+                if i >= len(keys) or (self.stop is not None and keys[i] >= self.stop):
+                    raise StopIteration
+
+            key = keys[i]
+            value = self.db.data[key]
+
+        self.position = key
+        self.inclusive = False
+
+        if not self.include_key:
+            return value
+        if not self.include_value:
+            return key
+        return key, value
+
+    def seek(self, target):
+        """Moves to the first key at or after target, or before it if reversed.
+
+        target: bytes
+        """
+        self.position = target
+        self.inclusive = True
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MemoryBackend(Backend):
+    """Keeps keys in a dict and a sorted list of keys for tests and benchmarks.
+
+    Nothing is written to disk, options for the other backends are ignored.
+    """
+
+    def __init__(self, path=None, **options):
+        self.data = {}
+        self.keys = []
+        self.lock = threading.RLock()
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def put(self, key, value):
+        if type(key) is not bytes or type(value) is not bytes:
+            raise TypeError("Keys and values have to be bytes")
+        self._write(((key, value),))
+
+    def delete(self, key):
+        self._write(((key, None),))
+
+    def _write(self, ops):
+        with self.lock:
+            for key, value in ops:
+                if value is None:
+                    if self.data.pop(key, None) is not None:
+                        del self.keys[bisect_left(self.keys, key)]
+                    continue
+
+                if key not in self.data:
+                    self.keys.insert(bisect_left(self.keys, key), key)
+                self.data[key] = value
+
+    def iterator(self, **kwargs):
+        return SortedIterator(self, **kwargs)
+
+    def snapshot(self):
+        """Returns a copy of the data to read from."""
+        snapshot = MemoryBackend()
+
+        with self.lock:
+            snapshot.data = self.data.copy()
+            snapshot.keys = self.keys.copy()
+
+        return snapshot
+
+
+class LMDBIterator:
+    """Iterates over a key range of an LMDB read transaction with a cursor.
+
+    txn: lmdb.Transaction
+    owned: bool
+        Whether to end the transaction when the iterator is closed.
+    """
+
+    def __init__(
+        self,
+        txn,
+        owned,
+        prefix=None,
+        start=None,
+        stop=None,
+        reverse=False,
+        include_key=True,
+        include_value=True,
+    ):
+        if prefix is not None:
+            start, stop = prefix, prefix_end(prefix)
+
+        self.txn = txn
+        self.owned = owned
+        self.cursor = txn.cursor()
+        self.start = start
+        self.stop = stop
+        self.reverse = reverse
+        self.include_key = include_key
+        self.include_value = include_value
+        # Whether the cursor is on the next item to return, None before the first
+        self.pending = None
+        self.closed = False
+
+    def _position(self, target):
+        found = self.cursor.set_range(target)
+
+        if self.reverse:
+            found = self.cursor.prev() if found else self.cursor.last()
+
+        self.pending = found
+
+    def __next__(self):
+        if self.pending is None:
+            if self.reverse and self.stop is None:
+                self.pending = self.cursor.last()
+            elif self.reverse:
+                self._position(self.stop)
+            elif self.start is None:
+                self.pending = self.cursor.first()
+            else:
+                self._position(self.start)
+
+        if self.closed:
+            raise StopIteration
+
+        if self.pending:
+            self.pending = False
+        elif not (self.cursor.prev() if self.reverse else self.cursor.next()):
+            self.close()
+            raise StopIteration
+
+        key = self.cursor.key()
+
+        if (self.reverse and self.start is not None and key < self.start) or (
+            not self.reverse and self.stop is not None and key >= self.stop
+        ):
+            self.close()
+            raise StopIteration
+
+        if not self.include_key:
+            return self.cursor.value()
+        if not self.include_value:
+            return key
+        return key, self.cursor.value()
+
+    def seek(self, target):
+        """Moves to the first key at or after target, or before it if reversed.
+
+        target: bytes
+        """
+        self._position(target)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.cursor.close()
+
+            if self.owned:
+                self.txn.abort()
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LMDBSnapshot:
+    """A read transaction, LMDB readers see the data from when it began.
+
+    txn: lmdb.Transaction
+    """
+
+    def __init__(self, txn):
+        self.txn = txn
+
+    def get(self, key, default=None):
+        return self.txn.get(key, default)
+
+    def iterator(self, **kwargs):
+        return LMDBIterator(self.txn, False, **kwargs)
+
+    def close(self):
+        self.txn.abort()
+
+
+class LMDBBackend(Backend):
+    """Stores keys in an LMDB environment, needs the lmdb package.
+
+    path: str
+    map_size: int
+        The most the database can grow to in bytes.
+
+    LevelDB options are ignored.
+    """
+
+    def __init__(self, path, map_size=16 * 1024**3, **options):
+        if lmdb is None:
+            raise RuntimeError("The lmdb backend needs lmdb, pip install lmdb")
+
+        os.makedirs(path, exist_ok=True)
+        self.env = lmdb.open(path, map_size=map_size)
+
+    def get(self, key, default=None):
+        with self.env.begin() as txn:
+            return txn.get(key, default)
+
+    def put(self, key, value):
+        with self.env.begin(write=True) as txn:
+            txn.put(key, value)
+
+    def delete(self, key):
+        with self.env.begin(write=True) as txn:
+            txn.delete(key)
+
+    def _write(self, ops):
+        with self.env.begin(write=True) as txn:
+            for key, value in ops:
+                if value is None:
+                    txn.delete(key)
+                else:
+                    txn.put(key, value)
+
+    def iterator(self, **kwargs):
+        return LMDBIterator(self.env.begin(), True, **kwargs)
+
+    def snapshot(self):
+        return LMDBSnapshot(self.env.begin())
+
+    def close(self):
+        self.env.close()
+
+
+BACKENDS = {"leveldb": leveldb, "memory": MemoryBackend, "lmdb": LMDBBackend}
+
+
+def open_backend(name, path, **options):
+    """Opens a backend by name.
+
+    name: str
+        leveldb, memory or lmdb.
+    path: str
+    options are passed to the backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, expected one of {list(BACKENDS)}")
+
+    return BACKENDS[name](path, **options)
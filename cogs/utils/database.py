@@ -1,31 +1,1931 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from operator import mul
+import asyncio
+import base64
+import gzip
+import hashlib
+import itertools
+import logging
+import os
 import pathlib
-import plyvel
+import struct
+import threading
+import time
+import weakref
+
 import orjson
 
+from cogs.utils.backends import PrefixedDB, open_backend, prefix_end
+
+
+def encode_score(score: float) -> bytes:
+    """Encodes a float into 8 bytes that sort in the same order as the float.
+
+    score: float
+    """
+    (bits,) = struct.unpack(">Q", struct.pack(">d", score))
+    # Negative floats have every bit flipped, positive floats just the sign bit
+    bits ^= 0xFFFFFFFFFFFFFFFF if bits >> 63 else 0x8000000000000000
+    return bits.to_bytes(8, "big")
+
+
+def decode_score(data: bytes) -> float:
+    """Decodes a float encoded with encode_score.
+
+    data: bytes
+    """
+    bits = int.from_bytes(data[:8], "big")
+    bits ^= 0x8000000000000000 if bits >> 63 else 0xFFFFFFFFFFFFFFFF
+    return struct.unpack(">d", bits.to_bytes(8, "big"))[0]
+
+
+def streak_score(value: bytes) -> tuple:
+    """Sorts slot streaks by highest win then highest lose streak."""
+    data = orjson.loads(value)
+    return data["highestwin"], data["highestlose"]
+
+
+def cookie_score(value: bytes) -> tuple:
+    """Sorts cookies by banked cookies, upgrades then cps."""
+    data = orjson.loads(value)
+    return data["cookies"], data["upgrade"], data.get("cps", 0)
+
+
+# The pad byte skips the version byte without an offset
+_packed_double = struct.Struct(">xd")
+_unpack_double = _packed_double.unpack
+# Maps the length of an int packed before schema version 3 to its format
+_unpack_ints = {
+    fmt.size: fmt.unpack for fmt in map(struct.Struct, (">xb", ">xh", ">xi", ">xq"))
+}
+
+
+class FloatCodec:
+    """Packs floats as a version byte and a big endian double.
+
+    Values without the version byte are the old str(value).encode() format.
+    """
+
+    version = b"\x01"
+    double = struct.Struct(">d")
+
+    def encode(self, value: float) -> bytes:
+        """Packs a float.
+
+        value: float
+        """
+        return self.version + self.double.pack(value)
+
+    def decode(self, data: bytes) -> float:
+        """Unpacks a float packed with encode or stored as text.
+
+        data: bytes
+        """
+        # Text never starts with the version byte
+        if data[0] == 1:
+            return _unpack_double(data)[0]
+        return float(data)
+
+    def decode_packed(self, values: list) -> list:
+        """Unpacks values that are all packed in one struct call, every balance
+        is once the database is at schema version 2.
+
+        values: list[bytes]
+        """
+        return [value for value, in _packed_double.iter_unpack(b"".join(values))]
+
+    def score(self, value: bytes) -> tuple:
+        """Sorts a leaderboard by the number value."""
+        return (self.decode(value),)
+
+
+class IntCodec:
+    """Stores ints as text.
+
+    Schema version 2 packed them like floats but int() parses the short
+    text of a counter faster than a struct unpack, version 3 unpacks them.
+    """
+
+    # int itself so decoding doesn't go through a python call
+    decode = staticmethod(int)
+
+    def encode(self, value: int) -> bytes:
+        """Formats an int.
+
+        value: int
+        """
+        return str(value).encode()
+
+    def score(self, value: bytes) -> tuple:
+        """Sorts a leaderboard by the number value."""
+        # Old index entries are moved while version 3 unpacks the counters
+        if value[0] == 1:
+            return (_unpack_ints[len(value)](value)[0],)
+        return (int(value),)
+
+
+def backup_files(directory: str) -> list:
+    """Returns the names of the backups in a directory, oldest first.
+
+    directory: str
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith(".ndjson.gz"))
+
+
+def backup_chain(directory: str) -> list:
+    """Returns the paths of the latest full backup and the latest incremental
+    backup based on it, the chain to restore.
+
+    directory: str
+    """
+    names = backup_files(directory)
+    fulls = [i for i, name in enumerate(names) if name.endswith("-full.ndjson.gz")]
+
+    if not fulls:
+        return []
+
+    # Incremental backups have every change since the full backup
+    chain = names[fulls[-1] : fulls[-1] + 1] + names[fulls[-1] + 1 :][-1:]
+    return [f"{directory}/{name}" for name in chain]
+
+
+def prune_backups(directory: str, keep: int = 3):
+    """Deletes backups older than the last keep full backups.
+
+    directory: str
+    keep: int
+    """
+    names = backup_files(directory)
+    fulls = [i for i, name in enumerate(names) if name.endswith("-full.ndjson.gz")]
+
+    if len(fulls) > keep:
+        for name in names[: fulls[-keep]]:
+            os.remove(f"{directory}/{name}")
+
+
+def backup_value(value: bytes):
+    """Returns a value as text, binary values like price histories aren't
+    utf-8 so they're base64 encoded in a dict restore_value can tell apart.
+
+    value: bytes
+    """
+    try:
+        return value.decode()
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(value).decode()}
+
+
+def restore_value(value) -> bytes:
+    """Returns the bytes of a value from backup_value.
+
+    value: str | dict
+    """
+    if isinstance(value, dict):
+        return base64.b64decode(value["base64"])
+    return value.encode()
+
+
+def disk_size(path: str) -> int:
+    """Returns the size of the files in a directory in bytes.
+
+    path: str
+    """
+    if not os.path.isdir(path):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+FLOAT = FloatCodec()
+INT = IntCodec()
+
+# The codecs of the prefixed DBs that store numbers
+CODECS = {"bal": FLOAT, "karma": INT, "message_count": INT}
+
+# Schema version to the prefixed DBs a migration goes over and its function
+MIGRATIONS = {}
+
+
+def migration(version: int, *names: str):
+    """Registers a function that migrates the keys of prefixed DBs.
+
+    The function is called on the database thread with the Database, the
+    AsyncDB, a write batch and a key and value. It stages its changes with
+    db.stage and returns whether it changed anything. Keys it writes can
+    be read again so it has to skip keys that are already migrated.
+
+    version: int
+        The schema version of the database once the migration has run.
+    names: tuple[str]
+        The prefixed DBs to go over in order.
+    """
+
+    def decorator(func):
+        MIGRATIONS[version] = (names, func)
+        return func
+
+    return decorator
+
+
+@migration(1, "deleted", "edited")
+def split_history(database, db, wb, key, value):
+    """Splits the old per member history dicts into an entry per message."""
+    # Old keys are {guild}-{member}, new ones have a timestamp
+    if key.count(b"-") != 1:
+        return False
+
+    db.stage(wb, key)
+    entries = sorted(orjson.loads(value).items(), key=lambda x: int(x[0]))
+
+    for date, entry in entries[-database.history_size :]:
+        db.stage(wb, key + f"-{int(date) * 1000000}".encode(), orjson.dumps(entry))
+    return True
+
+
+@migration(2, "bal")
+def pack_values(database, db, wb, key, value):
+    """Packs numbers still stored as text with their codec."""
+    if value[:1] == db.codec.version:
+        return False
+
+    # Staging moves the leaderboard entries to the packed value
+    db.stage(wb, key, db.codec.encode(db.codec.decode(value)))
+    return True
+
+
+@migration(3, "karma", "message_count")
+def unpack_counters(database, db, wb, key, value):
+    """Stores counters packed by version 2 as text again."""
+    if value[0] != 1:
+        return False
+
+    db.stage(wb, key, db.encode(_unpack_ints[len(value)](value)[0]))
+    return True
+
+
+class Executor:
+    """Runs blocking database calls on dedicated threads.
+
+    workers: int
+        The amount of threads to run calls on.
+    queue_size: int
+        How many calls can be queued before callers have to wait for a slot.
+    """
+
+    # Upper bounds of the latency histogram buckets in seconds, the last
+    # bucket counts anything slower
+    buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+    buckets += (0.1, 0.25, 1.0)
+
+    def __init__(self, workers=1, queue_size=256, hot_keys=256):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="database")
+        self.queue_size = queue_size
+        self.queued = 0
+        self.calls = 0
+        # Call name to [count, total, max, bytes read, bytes written, histogram]
+        self.stats = {}
+        # Bytes are added on the database threads while the loop records
+        # calls and reads the stats
+        self.stats_lock = threading.Lock()
+        # DB name to a Counter of its most used keys
+        self.keys = {}
+        self.hot_keys = hot_keys
+        self._slots = None
+
+    async def run(self, name, func, *args):
+        """Runs func on a database thread and records how long it took.
+
+        name: str
+            The name the latency is recorded under e.g bal.get
+        func: Callable
+        """
+        # Created lazily so the semaphore is bound to the running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_size)
+
+        async with self._slots:
+            self.queued += 1
+            start = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.pool, func, *args
+                )
+            finally:
+                self.queued -= 1
+                self.record(name, time.perf_counter() - start)
+
+    def record(self, name, elapsed):
+        """Adds a call to the latency stats.
+
+        name: str
+        elapsed: float
+            How long the call took in seconds.
+        """
+        with self.stats_lock:
+            self.calls += 1
+            stats = self._stats(name)
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            stats[5][bisect_left(self.buckets, elapsed)] += 1
+
+    def copy_stats(self):
+        """Returns a copy of the stats that can be read while calls run."""
+        with self.stats_lock:
+            return {
+                name: [*stats[:5], stats[5][:]] for name, stats in self.stats.items()
+            }
+
+    def _stats(self, name):
+        if name not in self.stats:
+            self.stats[name] = [0, 0.0, 0.0, 0, 0, [0] * (len(self.buckets) + 1)]
+        return self.stats[name]
+
+    def transfer(self, name, read=0, written=0):
+        """Adds the bytes read and written by a call.
+
+        name: str
+        read: int
+        written: int
+        """
+        with self.stats_lock:
+            stats = self._stats(name)
+            stats[3] += read
+            stats[4] += written
+
+    def count_key(self, name, key):
+        """Counts a use of a key to find the hot keys of a DB.
+
+        Only the most used keys are kept, once there are twice hot_keys
+        keys the least used half is dropped.
+
+        name: str
+        key: bytes
+        """
+        if name not in self.keys:
+            self.keys[name] = Counter()
+
+        keys = self.keys[name]
+        keys[key] += 1
+
+        if len(keys) >= self.hot_keys * 2:
+            self.keys[name] = Counter(dict(keys.most_common(self.hot_keys)))
+
+    def percentile(self, name, q, stats=None):
+        """Returns the upper bound in seconds of the bucket a percentile is in.
+
+        name: str
+        q: float
+            Between 0 and 1.
+        stats: dict
+            A copy from copy_stats to read instead of the live stats.
+        """
+        stats = (stats or self.copy_stats())[name]
+        target = stats[0] * q
+        seen = 0
+
+        for bound, count in zip(self.buckets, stats[5]):
+            seen += count
+            if seen >= target:
+                return bound
+        return stats[2]
+
+    def export(self):
+        """Returns the stats and hot keys as a dict that can be dumped as json."""
+        bounds = [f"{bound * 1000:g}ms" for bound in self.buckets] + ["inf"]
+        fields = ("count", "total", "max", "read", "written")
+        calls = {}
+
+        for name, stats in self.copy_stats().items():
+            calls[name] = dict(zip(fields, stats))
+            calls[name]["histogram"] = dict(zip(bounds, stats[5]))
+
+        return {
+            "calls": calls,
+            "keys": {
+                name: [
+                    [key.decode(errors="backslashreplace"), count]
+                    for key, count in keys.most_common(20)
+                ]
+                for name, keys in self.keys.items()
+            },
+        }
+
+    def shutdown(self):
+        """Waits for queued calls to finish and stops the threads."""
+        self.pool.shutdown(wait=True)
+
+
+class WriteQueue:
+    """Puts and deletes from every prefixed DB committed together in one batch.
+
+    Writes are committed delay seconds after the first one is queued or once
+    size writes are waiting, whichever is first. Gets read queued writes so
+    they're seen before they're committed and scans commit them first.
+
+    executor: Executor
+    write: Callable[[dict, set], None]
+        Stages the queued writes and trims on the database thread.
+    delay: float
+    size: int
+    """
+
+    def __init__(self, executor, write, delay=0.05, size=1000):
+        self.executor = executor
+        self.write = write
+        self.delay = delay
+        self.size = size
+        # Full keys to (AsyncDB, key, value) with None values for deletes
+        self.pending = {}
+        self.committing = {}
+        # (AsyncDB, prefix) of histories to trim once their entries are written
+        self.trims = set()
+        self.lock = asyncio.Lock()
+        self.full = asyncio.Event()
+        self.task = None
+
+    def add(self, db, key, value=None):
+        """Queues a put, or a delete if value is None.
+
+        db: AsyncDB
+        key: bytes
+        value: bytes
+        """
+        self.pending[db.prefix + key] = (db, key, value)
+
+        if len(self.pending) >= self.size:
+            self.full.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self._commit_later())
+
+    def get(self, key):
+        """Returns the queued (AsyncDB, key, value) of a full key or None.
+
+        key: bytes
+        """
+        return self.pending.get(key) or self.committing.get(key)
+
+    def has_prefix(self, prefix):
+        """Returns whether any queued key starts with prefix.
+
+        prefix: bytes
+        """
+        return any(
+            key.startswith(prefix)
+            for key in itertools.chain(self.pending, self.committing)
+        )
+
+    async def _commit_later(self):
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.full.wait(), self.delay)
+
+        self.task = None
+        self.full.clear()
+
+        try:
+            await self.commit()
+        except Exception:
+            # Nothing awaits this task, commit queued the writes again to retry
+            logging.getLogger("discord").exception("Committing the write queue failed")
+
+            if self.task is None and (self.pending or self.trims):
+                self.task = asyncio.create_task(self._commit_later())
+
+    async def commit(self):
+        """Writes the queued writes in one batch."""
+        async with self.lock:
+            if not self.pending and not self.trims:
+                return
+
+            self.committing, self.pending = self.pending, {}
+            trims, self.trims = self.trims, set()
+
+            try:
+                await self.executor.run(
+                    "queue.write", self.write, self.committing, trims
+                )
+            except Exception:
+                # Writes queued since are newer so they're kept over these
+                for key, write in self.committing.items():
+                    self.pending.setdefault(key, write)
+                self.trims |= trims
+                raise
+            finally:
+                self.committing = {}
+
+    def close(self):
+        """Stops the timer of the next commit, commit has to be awaited after."""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+
+class AsyncDB:
+    """An async facade over a backend DB or prefixed DB.
+
+    Every call runs on the database executor so reads, writes
+    and scans never block the event loop. Writes are staged in batches
+    under the lock so changed keys can be added to the journal.
+    """
+
+    def __init__(
+        self,
+        executor,
+        db,
+        name,
+        lock,
+        prefix=b"",
+        root=None,
+        codec=None,
+        journal=None,
+        queue=None,
+    ):
+        self.executor = executor
+        self.db = db
+        self.name = name
+        self.lock = lock
+        self.prefix = prefix
+        self.root = db if root is None else root
+        self.codec = codec
+        self.journal = journal
+        self.queue = queue
+        self.leaderboards = []
+
+    def encode(self, value):
+        """Encodes a number with the codec of the DB or as text without one.
+
+        value: int | float
+        """
+        return self.codec.encode(value) if self.codec else str(value).encode()
+
+    def decode(self, data):
+        """Decodes a number with the codec of the DB or as text without one.
+
+        data: bytes
+        """
+        return self.codec.decode(data) if self.codec else int(data)
+
+    async def get(self, key, default=None):
+        """Gets the value of a key.
+
+        key: bytes
+        default: bytes
+        """
+        self.executor.count_key(self.name, key)
+
+        if self.queue is not None and (write := self.queue.get(self.prefix + key)):
+            value = write[2]
+        else:
+            value = await self.executor.run(f"{self.name}.get", self.db.get, key)
+            self.executor.transfer(f"{self.name}.get", len(value) if value else 0)
+
+        return default if value is None else value
+
+    async def put(self, key, value):
+        """Sets the value of a key.
+
+        key: bytes
+        value: bytes
+        """
+        self.executor.count_key(self.name, key)
+        self.unqueue(key)
+        await self.executor.run(
+            f"{self.name}.put", self._write, ((key, value),), (), "put"
+        )
+
+    async def delete(self, key):
+        """Deletes a key.
+
+        key: bytes
+        """
+        self.executor.count_key(self.name, key)
+        self.unqueue(key)
+        await self.executor.run(
+            f"{self.name}.delete", self._write, (), (key,), "delete"
+        )
+
+    def queue_put(self, key, value):
+        """Queues setting the value of a key to be committed with other writes.
+
+        For event handlers that write often, the value can be read straight
+        away but is only written on the next commit of the write queue.
+
+        key: bytes
+        value: bytes
+        """
+        self.executor.count_key(self.name, key)
+        self.queue.add(self, key, value)
+
+    def queue_delete(self, key):
+        """Queues deleting a key to be committed with other writes.
+
+        key: bytes
+        """
+        self.executor.count_key(self.name, key)
+        self.queue.add(self, key)
+
+    async def commit_queued(self, prefix=b""):
+        """Commits the write queue if it has writes to keys starting with prefix,
+        so a read of other keys e.g a guilds settings doesn't commit it.
+
+        prefix: bytes
+        """
+        if self.queue is not None and self.queue.has_prefix(self.prefix + prefix):
+            await self.queue.commit()
+
+    def unqueue(self, key):
+        # A direct write is newer than a queued one so it mustn't be overwritten
+        if self.queue is not None:
+            self.queue.pending.pop(self.prefix + key, None)
+
+    async def items(self, amount=None, **kwargs):
+        """Returns a list of key value pairs.
+
+        amount: int
+            The most pairs to return, all of them if None.
+
+        kwargs are passed to plyvel's iterator e.g prefix, reverse
+        """
+        await self.commit_queued(kwargs.get("prefix", b""))
+
+        return await self.executor.run(
+            f"{self.name}.iterate", self._items, amount, kwargs
+        )
+
+    async def keys(self, amount=None, **kwargs):
+        """Returns a list of keys.
+
+        amount: int
+
+        kwargs are passed to plyvel's iterator e.g prefix, reverse
+        """
+        return await self.items(amount, include_value=False, **kwargs)
+
+    async def scan(self, func=None, chunk=1000, snapshot=None, **kwargs):
+        """Yields the results of a scan over a snapshot in lists of up to chunk.
+
+        The iteration and func run on the database thread and only a chunk
+        is read per call, so long scans don't block the loop or queue other
+        calls behind them. Reading from a snapshot means writes made during
+        the scan e.g by update_stocks aren't seen half way through.
+
+        func: Callable[[bytes, bytes], Any]
+            Called with each key and value, its result is yielded instead
+            of the pair and None results are skipped.
+        chunk: int
+        snapshot: plyvel.Snapshot
+            A snapshot of the root db from Database.snapshot to scan several
+            prefixed DBs at the same point in time, one is taken if None.
+
+        kwargs are passed to plyvel's iterator e.g prefix, start, reverse
+        """
+        await self.commit_queued(kwargs.get("prefix", b""))
+
+        owned = snapshot is None
+        if owned:
+            snapshot = await self.executor.run(
+                f"{self.name}.snapshot", self.root.snapshot
+            )
+
+        view = PrefixedDB(snapshot, self.prefix) if self.prefix else snapshot
+        iterator = view.iterator(**kwargs)
+
+        try:
+            while True:
+                results, done = await self.executor.run(
+                    f"{self.name}.scan", self._scan, iterator, func, chunk
+                )
+                if results:
+                    yield results
+                if done:
+                    break
+        finally:
+            iterator.close()
+            if owned:
+                snapshot.close()
+
+    def _scan(self, iterator, func, chunk):
+        results = []
+        read = size = 0
+
+        for read, (key, value) in enumerate(itertools.islice(iterator, chunk), 1):
+            size += len(key) + len(value)
+
+            if func is None:
+                results.append((key, value))
+            elif (result := func(key, value)) is not None:
+                results.append(result)
+
+        self.executor.transfer(f"{self.name}.scan", size)
+        return results, read < chunk
+
+    def _items(self, amount, kwargs):
+        with self.db.iterator(**kwargs) as iterator:
+            items = list(itertools.islice(iterator, amount))
+
+        if kwargs.get("include_key", True) and kwargs.get("include_value", True):
+            read = sum(len(key) + len(value) for key, value in items)
+        else:
+            read = sum(map(len, items))
+
+        self.executor.transfer(f"{self.name}.iterate", read)
+        return items
+
+    async def write(self, puts=(), deletes=()):
+        """Writes multiple puts and deletes in one batch.
+
+        puts: Iterable[tuple[bytes, bytes]]
+        deletes: Iterable[bytes]
+        """
+        await self.executor.run(f"{self.name}.write", self._write, puts, deletes)
+
+    def _write(self, puts, deletes, op="write"):
+        written = 0
+
+        with self.lock, self.root.write_batch() as wb:
+            for key in deletes:
+                self.stage(wb, key)
+                written += len(key)
+            for key, value in puts:
+                self.stage(wb, key, value)
+                written += len(key) + len(value)
+
+        self.executor.transfer(f"{self.name}.{op}", written=written)
+
+    def stage(self, wb, key, value=None):
+        """Adds a put, or a delete if value is None, to a write batch on the root db.
+
+        Leaderboard entries of the key are moved in the same batch and the key
+        is added to the journal, so the caller has to hold the lock.
+
+        wb: plyvel.WriteBatch
+        key: bytes
+        value: bytes
+        """
+        if self.leaderboards:
+            old = self.db.get(key)
+            for leaderboard in self.leaderboards:
+                leaderboard.update(wb, key, old, value)
+
+        if value is None:
+            wb.delete(self.prefix + key)
+        else:
+            wb.put(self.prefix + key, value)
+
+        if self.journal is not None:
+            self.journal.add(self.prefix + key)
+
+
+class Leaderboard:
+    """A sorted index over the values of a prefixed DB.
+
+    Index keys are [group-] + encoded scores + key so the highest or lowest
+    values are a short iterator read, the index values are copies of the values.
+    Values of a source with a codec are returned decoded.
+
+    source: AsyncDB
+        The prefixed DB being ranked.
+    index: AsyncDB
+        Where the index is stored.
+    score: Callable[[bytes], tuple]
+        Returns the numbers a value is sorted by.
+    width: int
+        How many numbers score returns.
+    grouped: bool
+        Whether keys start with a group e.g a guild id to rank separately.
+    """
+
+    def __init__(self, source, index, score, width=1, grouped=False):
+        self.source = source
+        self.index = index
+        self.score = score
+        self.width = width
+        self.grouped = grouped
+        source.leaderboards.append(self)
+
+    def index_key(self, key, value):
+        """Returns the key in the index of a key and value.
+
+        key: bytes
+        value: bytes
+        """
+        group = key.split(b"-", 1)[0] + b"-" if self.grouped else b""
+        scores = b"".join([encode_score(score) for score in self.score(value)])
+        return self.index.prefix + group + scores + key
+
+    def update(self, wb, key, old, new):
+        """Moves the index entry of a key in a write batch on the root db.
+
+        key: bytes
+        old: bytes | None
+        new: bytes | None
+        """
+        if old is not None:
+            wb.delete(self.index_key(key, old))
+        if new is not None:
+            wb.put(self.index_key(key, new), new)
+
+    def build(self):
+        """Rebuilds the index from every value in the source."""
+        with self.index.root.write_batch() as wb:
+            for key in self.index.db.iterator(include_value=False):
+                wb.delete(self.index.prefix + key)
+
+            for key, value in self.source.db:
+                wb.put(self.index_key(key, value), value)
+
+    async def top(self, amount, group=None):
+        """Returns the keys and values of the highest scores.
+
+        amount: int
+        group: int
+            The group to rank in e.g a guild id.
+        """
+        return await self.index.executor.run(
+            f"{self.index.name}.top", self._range, amount, group, True
+        )
+
+    async def bottom(self, amount, group=None):
+        """Returns the keys and values of the lowest scores, lowest first.
+
+        amount: int
+        group: int
+        """
+        return await self.index.executor.run(
+            f"{self.index.name}.bottom", self._range, amount, group, False
+        )
+
+    def _range(self, amount, group, reverse):
+        prefix = b"" if group is None else f"{group}-".encode()
+        start = len(prefix) + self.width * 8
+
+        with self.index.db.iterator(prefix=prefix, reverse=reverse) as iterator:
+            items = [
+                (key[start:], value)
+                for key, value in itertools.islice(iterator, amount)
+            ]
+
+        if self.source.codec:
+            return [(key, self.source.decode(value)) for key, value in items]
+        return items
+
+
+class Transaction:
+    """Stages writes to multiple keys so they can be committed together.
+
+    Made by Database.transaction which holds the members locks.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.balances = {}
+        self.puts = {}
+
+    async def get(self, db, key):
+        """Gets a value, including ones staged in this transaction.
+
+        db: AsyncDB
+        key: bytes
+        """
+        if (db, key) in self.puts:
+            return self.puts[db, key]
+        return await db.get(key)
+
+    def put(self, db, key, value):
+        """Stages a put.
+
+        db: AsyncDB
+        key: bytes
+        value: bytes
+        """
+        self.puts[db, key] = value
+
+    async def get_bal(self, member_id):
+        """Gets the balance of a member.
+
+        member_id: bytes
+        """
+        if member_id in self.balances:
+            return self.balances[member_id]
+        return await self.database.get_bal(member_id)
+
+    def put_bal(self, member_id, amount: float):
+        """Stages setting the balance of a member.
+
+        member_id: bytes
+        amount: float
+        """
+        self.balances[member_id] = amount
+        return amount
+
+    async def get_stockbal(self, member_id):
+        """Returns a members stockbal.
+
+        member_id: bytes
+        """
+        data = await self.get(self.database.stockbal, member_id)
+        return orjson.loads(data) if data else {}
+
+    def put_stockbal(self, member_id, data):
+        """Stages setting a members stockbal.
+
+        member_id: bytes
+        data: dict
+        """
+        self.put(self.database.stockbal, member_id, orjson.dumps(data))
+
+    async def get_cryptobal(self, member_id):
+        """Returns a members cryptobal.
+
+        member_id: bytes
+        """
+        data = await self.get(self.database.cryptobal, member_id)
+        return orjson.loads(data) if data else {}
+
+    def put_cryptobal(self, member_id, data):
+        """Stages setting a members cryptobal.
+
+        member_id: bytes
+        data: dict
+        """
+        self.put(self.database.cryptobal, member_id, orjson.dumps(data))
+
+    async def commit(self):
+        """Applies the staged writes.
+
+        Balances on their own go through the balance cache, which flushes
+        every dirty balance in one batch. Anything else is written in a
+        single batch together with the balances.
+        """
+        database = self.database
+
+        if not self.puts:
+            for member_id, balance in self.balances.items():
+                database.cache_bal(member_id, balance)
+                database.dirty_balances[member_id] = balance
+            return
+
+        # Stops a flush of older balances landing after this batch
+        async with database.flush_lock:
+            await database.write_balances(self.balances, self.puts)
+
+            for member_id, balance in self.balances.items():
+                database.cache_bal(member_id, balance)
+                database.dirty_balances.pop(member_id, None)
+
+
+class GuildSettings:
+    """The settings of a guild that are checked on every command or event.
+
+    disabled_channels: set[int]
+        Channels commands can't be used in.
+    disabled_commands: set[str]
+        Names of commands toggled off in the guild.
+    logging: bool
+        Whether edited and deleted messages are logged.
+    """
+
+    def __init__(self, disabled_channels=(), disabled_commands=(), logging=True):
+        self.disabled_channels = set(disabled_channels)
+        self.disabled_commands = set(disabled_commands)
+        self.logging = logging
+
+    @classmethod
+    def from_items(cls, guild_id, items):
+        """Makes the settings from the main db keys of a guild.
+
+        guild_id: int
+        items: list[tuple[bytes, bytes]]
+            Keys with the {guild_id}- prefix removed and their values.
+        """
+        settings = cls()
+
+        for key, value in items:
+            if key == b"disabled_channels":
+                disabled = orjson.loads(value)
+                settings.disabled_channels.update(disabled.get(str(guild_id), ()))
+            elif key == b"logging":
+                settings.logging = False
+            # Channel lock keys also end in -lock with a value of 1
+            elif value == b"1" and b"-" not in key:
+                settings.disabled_commands.add(key.decode())
+
+        return settings
+
+
+def to_float(value) -> float:
+    """Parses a number from the market apis, 0 if it's missing or not a number.
+
+    value: str | float | None
+        Stock values are text like $1,234.50 or NA.
+    """
+    if isinstance(value, str):
+        value = value.replace(",", "").lstrip("$")
+
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+def stock_row(symbol: str, stock: dict) -> tuple:
+    """Returns the PriceTable row of a stock.
+
+    symbol: str
+    stock: dict
+    """
+    return (
+        symbol,
+        to_float(stock["price"]),
+        to_float(stock["change"]),
+        to_float(stock["cap"]),
+    )
+
+
+def crypto_row(symbol: str, coin: dict) -> tuple:
+    """Returns the PriceTable row of a crypto, its change is the 24h percent change.
+
+    symbol: str
+    coin: dict
+    """
+    return (
+        symbol,
+        to_float(coin["price"]),
+        to_float(coin["change_24h"]),
+        to_float(coin["market_cap"]),
+    )
+
+
+PRICE_ROWS = {"stocks": stock_row, "crypto": crypto_row}
+
+
+def market_diff(hashes: dict, puts: list) -> tuple:
+    """Compares a stock or crypto refresh to the hashes of the last one.
+
+    Returns the puts that changed, the hashes of the refresh and the
+    symbols missing from it.
+
+    hashes: dict[bytes, int]
+    puts: list[tuple[bytes, bytes]]
+    """
+    new = {symbol: hash(data) for symbol, data in puts}
+    changed = [
+        (symbol, data) for symbol, data in puts if hashes.get(symbol) != new[symbol]
+    ]
+    removed = [symbol for symbol in hashes if symbol not in new]
+    return changed, new, removed
+
+
+class PriceTable:
+    """The price, change and market cap of every stock or crypto.
+
+    A table is never changed after it's made, the update tasks swap in a new
+    one so a command can keep using a table without seeing half an update.
+
+    rows: Iterable[tuple[str, float, float, float]]
+        The symbol, price, change and cap of each row.
+    """
+
+    def __init__(self, rows=()):
+        self.index = {}
+        price, change, cap = array("d"), array("d"), array("d")
+
+        for symbol, *row in rows:
+            if symbol in self.index:
+                i = self.index[symbol]
+                price[i], change[i], cap[i] = row
+                continue
+
+            self.index[symbol] = len(price)
+            price.append(row[0])
+            change.append(row[1])
+            cap.append(row[2])
+
+        self.price = memoryview(price).toreadonly()
+        self.change = memoryview(change).toreadonly()
+        self.cap = memoryview(cap).toreadonly()
+
+    def get(self, symbol, default=None):
+        """Returns the price of a symbol.
+
+        symbol: str
+        """
+        i = self.index.get(symbol)
+        return default if i is None else self.price[i]
+
+    def row(self, symbol):
+        """Returns the price, change and cap of a symbol or None.
+
+        symbol: str
+        """
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        return self.price[i], self.change[i], self.cap[i]
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+# The seconds per point and points kept of each price history tier, so a day
+# of 10 minute points, a week of hourly points and a year of daily points
+HISTORY_TIERS = {"10m": (600, 144), "1h": (3600, 168), "1d": (86400, 365)}
+
+
+class PriceHistory:
+    """Timestamped prices of a symbol in a ring buffer.
+
+    Stored as the count and position of the next point followed by
+    the uint32 timestamps and float32 prices, once it's full new points
+    overwrite the oldest.
+
+    capacity: int
+    data: bytes
+        A stored history, its capacity comes from its size.
+    """
+
+    header = struct.Struct("<HH")
+
+    def __init__(self, capacity=0, data=None):
+        if data:
+            self.count, self.head = self.header.unpack_from(data)
+            capacity = (len(data) - self.header.size) // 8
+            middle = self.header.size + capacity * 4
+            self.times = array("I", data[self.header.size : middle])
+            self.prices = array("f", data[middle:])
+        else:
+            self.count = self.head = 0
+            self.times = array("I", bytes(capacity * 4))
+            self.prices = array("f", bytes(capacity * 4))
+
+        self.capacity = capacity
+
+    def add(self, timestamp, price, step, replace=True):
+        """Adds a point, replacing the newest if it's in the same step.
+
+        Returns whether the history changed.
+
+        timestamp: int
+        price: float
+        step: int
+            The seconds per point.
+        replace: bool
+            Whether a point in the same step as the newest replaces it,
+            otherwise it's dropped.
+        """
+        if self.count:
+            last = (self.head - 1) % self.capacity
+
+            if self.times[last] // step == timestamp // step:
+                if not replace:
+                    return False
+
+                self.times[last] = timestamp
+                self.prices[last] = price
+                return True
+
+        self.times[self.head] = timestamp
+        self.prices[self.head] = price
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def points(self, since=0):
+        """Returns the (timestamp, price) points from since, oldest first.
+
+        The first point is the one at or before since, the price at that time.
+
+        since: float
+        """
+        if self.count < self.capacity:
+            times, prices = self.times[: self.count], self.prices[: self.count]
+        else:
+            times = self.times[self.head :] + self.times[: self.head]
+            prices = self.prices[self.head :] + self.prices[: self.head]
+
+        start = max(bisect_right(times, since) - 1, 0)
+        return list(zip(times[start:], prices[start:]))
+
+    def to_bytes(self):
+        return (
+            self.header.pack(self.count, self.head)
+            + self.times.tobytes()
+            + self.prices.tobytes()
+        )
+
+
+def holding_totals(data: bytes) -> tuple:
+    """Returns the symbols and totals of a stockbal or cryptobal value.
+
+    data: bytes
+    """
+    holdings = orjson.loads(data)
+    return tuple(holdings), tuple(holding["total"] for holding in holdings.values())
+
+
+def holding_value(holding: tuple, prices: PriceTable) -> float:
+    """Returns the value of symbols and totals, delisted symbols are worth nothing.
+
+    holding: tuple[tuple[str], tuple[float]]
+    prices: PriceTable
+    """
+    symbols, totals = holding
+    return sum(map(mul, totals, map(prices.get, symbols, itertools.repeat(0.0))))
+
+
+class NetWorths:
+    """The balance and the value of the stocks and crypto of every member.
+
+    Holdings are kept as symbols and totals so new prices are applied in
+    one pass over every member instead of decoding them again. Writes of
+    bal, stockbal and cryptobal mark the member as stale through
+    NetWorthSource and sync reads the written values back, so a batch that
+    fails to write isn't applied. It's only changed on the database executor
+    with the lock held.
+
+    The net worth of every member is kept in totals and ranking, a sorted
+    list of encode_score(total) + member_id like Leaderboard index keys,
+    so the richest members are read from its end.
+
+    database: Database
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.balances = {}
+        self.holdings = {"stocks": {}, "crypto": {}}
+        self.values = {"stocks": {}, "crypto": {}}
+        self.totals = {}
+        self.ranking = []
+        self.sources = {
+            None: database.bal,
+            "stocks": database.stockbal,
+            "crypto": database.cryptobal,
+        }
+        self.stale = {market: set() for market in self.sources}
+
+        NetWorthSource(self, database.bal)
+        NetWorthSource(self, database.stockbal, "stocks")
+        NetWorthSource(self, database.cryptobal, "crypto")
+
+    def load(self):
+        """Loads every balance and holding from the db."""
+        for stale in self.stale.values():
+            stale.clear()
+
+        balances = dict(self.database.bal.db)
+
+        values = None
+
+        # Every balance is packed once the values are migrated
+        if self.database.schema_version >= 2:
+            with suppress(struct.error):
+                values = FLOAT.decode_packed(list(balances.values()))
+        if values is None:
+            values = map(self.database.bal.codec.decode, balances.values())
+
+        self.balances = dict(zip(balances, values))
+
+        for market, source in (
+            ("stocks", self.database.stockbal),
+            ("crypto", self.database.cryptobal),
+        ):
+            self.holdings[market] = {
+                key: holding_totals(value) for key, value in source.db
+            }
+            self.reprice(market, self.database.price_tables.get(market))
+
+    def update(self, market, member_id, value):
+        """Updates a members balance or holdings from a new value.
+
+        market: str
+            stocks or crypto, None for a balance.
+        member_id: bytes
+        value: bytes | None
+        """
+        if market is None:
+            if value is None:
+                self.balances.pop(member_id, None)
+            else:
+                self.balances[member_id] = self.database.bal.decode(value)
+        elif value is None:
+            self.holdings[market].pop(member_id, None)
+            self.values[market].pop(member_id, None)
+        else:
+            holding = self.holdings[market][member_id] = holding_totals(value)
+
+            if (prices := self.database.price_tables.get(market)) is not None:
+                self.values[market][member_id] = holding_value(holding, prices)
+
+        self.rerank(member_id)
+
+    def sync(self):
+        """Updates the members written to since the last sync from the db."""
+        for market, stale in self.stale.items():
+            for member_id in stale:
+                self.update(market, member_id, self.sources[market].db.get(member_id))
+            stale.clear()
+
+    def rerank(self, member_id):
+        """Moves a member in the ranking to their current net worth.
+
+        member_id: bytes
+        """
+        if (old := self.totals.pop(member_id, None)) is not None:
+            del self.ranking[bisect_left(self.ranking, encode_score(old) + member_id)]
+
+        if member_id in self.balances or any(
+            member_id in values for values in self.values.values()
+        ):
+            total = self.totals[member_id] = sum(self.get(member_id))
+            insort(self.ranking, encode_score(total) + member_id)
+
+    def reprice(self, market, prices):
+        """Works out the value of every members stocks or crypto.
+
+        market: str
+        prices: PriceTable | None
+            Values are left out until there are prices.
+        """
+        self.sync()
+
+        if prices is None:
+            self.values[market] = {}
+        else:
+            self.values[market] = {
+                member_id: holding_value(holding, prices)
+                for member_id, holding in self.holdings[market].items()
+            }
+
+        # Every total changes so sorting once beats moving each member
+        self.totals = self.balances.copy()
+
+        for values in self.values.values():
+            for member_id, value in values.items():
+                self.totals[member_id] = self.totals.get(member_id, 0) + value
+
+        self.ranking = sorted(
+            encode_score(total) + member_id for member_id, total in self.totals.items()
+        )
+
+    def get(self, member_id):
+        """Returns a members balance, stock value and crypto value.
+
+        member_id: bytes
+        """
+        return (
+            self.balances.get(member_id, 0),
+            self.values["stocks"].get(member_id, 0),
+            self.values["crypto"].get(member_id, 0),
+        )
+
+    def top(self, amount):
+        """Returns the member ids and net worths of the richest members.
+
+        amount: int
+        """
+        self.sync()
+
+        return [
+            (key[8:], decode_score(key))
+            for key in itertools.islice(reversed(self.ranking), amount)
+        ]
+
+
+class NetWorthSource:
+    """Passes the members written to in bal, stockbal or cryptobal on to
+    NetWorths.
+
+    It's added to the leaderboards of the source so staging a write marks
+    the member as stale, NetWorths.sync applies it once the batch is written.
+
+    net_worths: NetWorths
+    source: AsyncDB
+    market: str
+        stocks or crypto for holdings, None for balances.
+    """
+
+    def __init__(self, net_worths, source, market=None):
+        self.net_worths = net_worths
+        self.market = market
+        source.leaderboards.append(self)
+
+    def update(self, wb, key, old, new):
+        self.net_worths.stale[self.market].add(key)
+
+
+class Database:
+    def __init__(
+        self,
+        path=None,
+        workers=1,
+        queue_size=256,
+        balance_cache_size=10000,
+        history_size=100,
+        history_age=2592000,
+        lru_cache_size=32 * 1024 * 1024,
+        bloom_filter_bits=10,
+        write_buffer_size=16 * 1024 * 1024,
+        compression="snappy",
+        backend="leveldb",
+        write_delay=0.05,
+        write_batch_size=1000,
+    ):
+        self.executor = Executor(workers, queue_size)
+        self.lock = threading.Lock()
+        # Event handler writes grouped into one batch every write_delay seconds
+        self.write_queue = WriteQueue(
+            self.executor, self._write_queue, write_delay, write_batch_size
+        )
+        self.path = path or f"{pathlib.Path(__file__).parent.parent.parent}/db"
+        # A bigger write buffer means fewer level 0 tables from the stock and
+        # crypto updates and bloom filters skip tables when a key is missing
+        self.db = open_backend(
+            backend,
+            self.path,
+            lru_cache_size=lru_cache_size,
+            bloom_filter_bits=bloom_filter_bits,
+            write_buffer_size=write_buffer_size,
+            compression=compression,
+        )
+        # Keys changed since the last full backup, journal_start is when that
+        # backup was taken or None if changes were missed e.g before a restart
+        self.journal = set()
+        self.journal_start = None
+        self.main = AsyncDB(
+            self.executor,
+            self.db,
+            "main",
+            self.lock,
+            journal=self.journal,
+            queue=self.write_queue,
+        )
+        self.infractions = self.prefixed("infractions")
+        self.karma = self.prefixed("karma")
+        self.blacklist = self.prefixed("blacklist")
+        self.rrole = self.prefixed("rrole")
+        self.deleted = self.prefixed("deleted")
+        self.edited = self.prefixed("edited")
+        self.invites = self.prefixed("invites")
+        self.nicks = self.prefixed("nicks")
+        self.cryptobal = self.prefixed("cryptobal")
+        self.crypto = self.prefixed("crypto")
+        self.stocks = self.prefixed("stocks")
+        self.stockbal = self.prefixed("stockbal")
+        self.bal = self.prefixed("bal")
+        self.wins = self.prefixed("wins")
+        self.message_count = self.prefixed("message_count")
+        self.cookies = self.prefixed("cookies")
+        self.polls = self.prefixed("polls")
+        self.price_history = self.prefixed("price_history")
+
+        self.leaderboards = {}
+        self.baltop = self.leaderboard("baltop", self.bal, FLOAT.score)
+        self.karmatop = self.leaderboard("karmatop", self.karma, INT.score)
+        self.streaktop = self.leaderboard("streaktop", self.wins, streak_score, 2)
+        self.cookietop = self.leaderboard("cookietop", self.cookies, cookie_score, 3)
+        self.messagetop = self.leaderboard(
+            "messagetop", self.message_count, INT.score, grouped=True
+        )
+
+        # Hot balances as floats, least recently used first
+        self.balances = OrderedDict()
+        self.balance_cache_size = balance_cache_size
+        # Balances that haven't been written to the db yet
+        self.dirty_balances = {}
+        self.flushing_balances = {}
+        # Counter deltas that haven't been written to the db yet
+        self.counts = {}
+        self.flush_lock = asyncio.Lock()
+        self.member_locks = weakref.WeakValueDictionary()
+
+        self.guild_settings = {}
+        # Bumped by invalidations so a load that raced one isn't cached
+        self.guild_settings_generation = 0
+
+        # Running polls keyed by message id and the ones with unflushed votes
+        self.active_polls = {}
+        self.dirty_polls = set()
+
+        # Price tables of the stocks and crypto dbs published by the update tasks
+        self.price_tables = {}
+        # Hashes of the stored stock and crypto values to skip unchanged ones
+        # and the changed, unchanged and removed counts of the last refresh
+        self.market_hashes = {}
+        self.market_updates = {}
+        # Balances and holdings for nettop, valued when prices are published
+        self.net_worths = NetWorths(self)
+
+        # Ids of reaction role, poll and emoji submission messages
+        self.reaction_messages = set()
+        self.skipped_reactions = 0
+
+        # Deleted and edited messages kept per member and for how many seconds
+        self.history_size = history_size
+        self.history_age = history_age
+        self.schema_version = 0
+
+        # Blacklist states keyed by member id or (guild id, member id)
+        self.blacklisted = {}
+
+        # Keys written by the running backup, None when one isn't running
+        self.backup_progress = None
+
+        # Nothing else is running yet, restore loads them on the executor
+        self._load_state()
+
+    def prefixed(self, name):
+        """Returns an async prefixed DB for keys starting with name-
+
+        name: str
+        """
+        prefix = f"{name}-".encode()
+        return AsyncDB(
+            self.executor,
+            self.db.prefixed_db(prefix),
+            name,
+            self.lock,
+            prefix,
+            self.db,
+            CODECS.get(name),
+            self.journal,
+            self.write_queue,
+        )
+
+    def leaderboard(self, name, source, score, width=1, grouped=False):
+        """Returns a leaderboard stored under name- building it if it's missing.
+
+        name: str
+        source: AsyncDB
+        score: Callable[[bytes], tuple]
+        width: int
+        grouped: bool
+        """
+        leaderboard = Leaderboard(source, self.prefixed(name), score, width, grouped)
+
+        if self.is_empty(leaderboard.index) and not self.is_empty(source):
+            leaderboard.build()
+
+        self.leaderboards[name] = leaderboard
+        return leaderboard
+
+    @staticmethod
+    def is_empty(db):
+        """Returns whether a prefixed DB has no keys, only for use at startup.
+
+        db: AsyncDB
+        """
+        with db.db.iterator(include_value=False) as iterator:
+            return next(iterator, None) is None
+
+    def member_lock(self, member_id):
+        """Returns the lock of a member, locks are dropped once nothing holds them.
+
+        member_id: bytes
+        """
+        lock = self.member_locks.get(member_id)
+
+        if lock is None:
+            lock = self.member_locks[member_id] = asyncio.Lock()
+
+        return lock
+
+    @asynccontextmanager
+    async def snapshot(self):
+        """A snapshot of the whole database to pass to AsyncDB.scan.
+
+        Queued writes are committed first so they're in the snapshot.
+        """
+        await self.write_queue.commit()
+        snapshot = await self.executor.run("snapshot", self.db.snapshot)
+
+        try:
+            yield snapshot
+        finally:
+            snapshot.close()
+
+    async def get_prices(self, db):
+        """Returns the PriceTable of the stocks or crypto db.
+
+        The update tasks publish a table each refresh, the db is only read
+        when there hasn't been one since the bot started.
+
+        db: AsyncDB
+        """
+        table = self.price_tables.get(db.name)
+
+        if table is None:
+            row = PRICE_ROWS[db.name]
+            rows = []
+
+            async for chunk in db.scan(
+                lambda symbol, data: row(symbol.decode(), orjson.loads(data))
+            ):
+                rows.extend(chunk)
+
+            table = PriceTable(rows)
+
+            # An update that finished during the scan has newer prices
+            if db.name not in self.price_tables:
+                await self.publish_prices(db, table)
+            # An empty db isn't published but there's nothing to read again
+            table = self.price_tables.setdefault(db.name, table)
+
+        return table
+
+    async def write_market(self, db, puts):
+        """Writes a refresh of the stocks or crypto db.
+
+        Only symbols whose value changed since the last refresh are written
+        and symbols missing from it were delisted so they're deleted.
+        Returns the counts of changed, unchanged and removed symbols.
+
+        db: AsyncDB
+        puts: list[tuple[bytes, bytes]]
+        """
+        # A failed request rather than every symbol being delisted
+        if not puts:
+            return None
+
+        hashes = self.market_hashes.get(db.name)
+
+        if hashes is None:
+            hashes = {}
+            async for chunk in db.scan(lambda symbol, data: (symbol, hash(data))):
+                hashes.update(chunk)
+
+        # Off the loop as a stock refresh has around 50k values
+        changed, hashes, removed = await asyncio.get_running_loop().run_in_executor(
+            None, market_diff, hashes, puts
+        )
+        await db.write(changed, removed)
+        self.market_hashes[db.name] = hashes
+
+        update = self.market_updates[db.name] = {
+            "changed": len(changed),
+            "unchanged": len(puts) - len(changed),
+            "removed": len(removed),
+            "time": time.time(),
+        }
+        return update
+
+    async def record_prices(self, db, table, timestamp=None, chunk=1000):
+        """Adds the prices that changed since the current table to their
+        price histories, call it before publishing the table.
+
+        Every price is added when there isn't a table yet.
+
+        db: AsyncDB
+        table: PriceTable
+        timestamp: int
+        chunk: int
+            How many symbols to add per executor call.
+        """
+        previous = self.price_tables.get(db.name)
+        timestamp = int(timestamp or time.time())
+        symbols = list(table)
+
+        for start in range(0, len(symbols), chunk):
+            await self.executor.run(
+                "price_history.record",
+                self._record_prices,
+                db.name,
+                table,
+                previous,
+                symbols[start : start + chunk],
+                start,
+                timestamp,
+            )
+
+    def _record_prices(self, name, table, previous, symbols, start, timestamp):
+        written = 0
+
+        with self.lock, self.db.write_batch() as wb:
+            for i, symbol in enumerate(symbols, start):
+                price = table.price[i]
+
+                if previous is not None and previous.get(symbol) == price:
+                    continue
+
+                for tier, (step, capacity) in HISTORY_TIERS.items():
+                    key = f"{name}-{tier}-{symbol}".encode()
+                    history = PriceHistory(capacity, self.price_history.db.get(key))
+
+                    # The coarser tiers keep the first price of each step so
+                    # they're rewritten once a step rather than every change
+                    if not history.add(timestamp, price, step, tier == "10m"):
+                        continue
 
-class Database:
-    def __init__(self):
-        self.main = plyvel.DB(
-            f"{pathlib.Path(__file__).parent.parent.parent}/db", create_if_missing=True
-        )
-        self.infractions = self.main.prefixed_db(b"infractions-")
-        self.karma = self.main.prefixed_db(b"karma-")
-        self.blacklist = self.main.prefixed_db(b"blacklist-")
-        self.rrole = self.main.prefixed_db(b"rrole-")
-        self.deleted = self.main.prefixed_db(b"deleted-")
-        self.edited = self.main.prefixed_db(b"edited-")
-        self.invites = self.main.prefixed_db(b"invites-")
-        self.nicks = self.main.prefixed_db(b"nicks-")
-        self.cryptobal = self.main.prefixed_db(b"cryptobal-")
-        self.crypto = self.main.prefixed_db(b"crypto-")
-        self.stocks = self.main.prefixed_db(b"stocks-")
-        self.stockbal = self.main.prefixed_db(b"stockbal-")
-        self.bal = self.main.prefixed_db(b"bal-")
-        self.wins = self.main.prefixed_db(b"wins-")
-        self.message_count = self.main.prefixed_db(b"message_count-")
-        self.cookies = self.main.prefixed_db(b"cookies-")
-
-    def delete_cache(self, search, cache):
+                    value = history.to_bytes()
+                    self.price_history.stage(wb, key, value)
+                    written += len(key) + len(value)
+
+        self.executor.transfer("price_history.record", written=written)
+
+    async def get_price_history(self, db, symbol, seconds):
+        """Returns the (timestamp, price) points of a stock or crypto over the
+        last seconds from the finest tier that goes back that far.
+
+        The first point is the price at the start so the change over the
+        period is the last price over the first.
+
+        db: AsyncDB
+        symbol: str
+        seconds: int
+        """
+        for tier, (step, capacity) in HISTORY_TIERS.items():
+            if step * capacity >= seconds:
+                break
+
+        data = await self.price_history.get(f"{db.name}-{tier}-{symbol}".encode())
+
+        if not data:
+            return []
+        return PriceHistory(data=data).points(time.time() - seconds)
+
+    async def publish_prices(self, db, table):
+        """Replaces the PriceTable of the stocks or crypto db and revalues
+        every members holdings with it.
+
+        db: AsyncDB
+        table: PriceTable
+        """
+        # A failed refresh rather than every symbol losing its price
+        if not table:
+            return
+
+        self.price_tables[db.name] = table
+        await self.executor.run(
+            f"{db.name}.reprice", self._reprice_net_worths, db.name, table
+        )
+
+    def _reprice_net_worths(self, market, table):
+        with self.lock:
+            self.net_worths.reprice(market, table)
+
+    async def get_net_worth(self, member_id):
+        """Returns a members balance, stock value and crypto value.
+
+        member_id: bytes
+        """
+        # Holdings aren't valued until there are prices
+        await self.get_prices(self.stocks)
+        await self.get_prices(self.crypto)
+        _, stocks, crypto = await self.executor.run(
+            "net_worth.get", self._net_worth, member_id
+        )
+
+        return await self.get_bal(member_id), stocks, crypto
+
+    def _net_worth(self, member_id):
+        with self.lock:
+            self.net_worths.sync()
+            return self.net_worths.get(member_id)
+
+    async def get_net_top(self, amount):
+        """Returns the member ids and net worths of the richest members.
+
+        Members the bot can't see are left for the caller to filter on the
+        loop, so it should ask for more than it shows.
+
+        amount: int
+        """
+        await self.get_prices(self.stocks)
+        await self.get_prices(self.crypto)
+        await self.flush()
+
+        return await self.executor.run("net_worth.top", self._net_top, amount)
+
+    def _net_top(self, amount):
+        with self.lock:
+            return self.net_worths.top(amount)
+
+    @asynccontextmanager
+    async def transaction(self, *member_ids):
+        """Locks members and commits the writes staged on the transaction once.
+
+        If the block raises nothing is written.
+
+        member_ids: bytes
+        """
+        # Always acquired in the same order so two transactions can't deadlock
+        locks = [self.member_lock(member_id) for member_id in sorted(set(member_ids))]
+
+        for lock in locks:
+            await lock.acquire()
+
+        try:
+            transaction = Transaction(self)
+            yield transaction
+            await transaction.commit()
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    async def flush(self):
+        """Writes queued writes, cached balances, counters and poll votes in batches."""
+        await self.write_queue.commit()
+
+        async with self.flush_lock:
+            if self.dirty_balances:
+                await self.flush_balances()
+            if self.counts:
+                await self.flush_counts()
+            if self.dirty_polls:
+                await self.flush_polls()
+
+    async def flush_balances(self):
+        """Writes dirty balances in one batch, the flush lock has to be held."""
+        self.flushing_balances = self.dirty_balances
+        self.dirty_balances = {}
+
+        try:
+            await self.write_balances(self.flushing_balances)
+        except Exception:
+            for member_id, balance in self.flushing_balances.items():
+                self.dirty_balances.setdefault(member_id, balance)
+            raise
+        finally:
+            self.flushing_balances = {}
+
+    async def flush_counts(self):
+        """Adds counter deltas in one batch, the flush lock has to be held."""
+        counts = self.counts
+        self.counts = {}
+
+        try:
+            await self.executor.run("counts.write", self._write_counts, counts)
+        except Exception:
+            for key, amount in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + amount
+            raise
+
+    def _write_counts(self, counts):
+        with self.lock, self.db.write_batch() as wb:
+            for (db, key), amount in counts.items():
+                value = db.db.get(key)
+                value = amount if not value else db.decode(value) + amount
+                db.stage(wb, key, db.encode(value))
+
+    async def flush_polls(self):
+        """Writes polls with new votes in one batch, the flush lock has to be held."""
+        dirty = self.dirty_polls
+        self.dirty_polls = set()
+
+        try:
+            await self.polls.write(
+                [
+                    (
+                        str(message_id).encode(),
+                        orjson.dumps(self.active_polls[message_id]),
+                    )
+                    for message_id in dirty
+                    if message_id in self.active_polls
+                ]
+            )
+        except Exception:
+            self.dirty_polls |= dirty
+            raise
+
+    def count(self, db, key, amount=1):
+        """Adds to a counter in memory, written to the db on the next flush.
+
+        db: AsyncDB
+        key: bytes
+        amount: int
+        """
+        self.counts[db, key] = self.counts.get((db, key), 0) + amount
+
+    async def get_count(self, db, key):
+        """Returns a counter including deltas that haven't been flushed.
+
+        db: AsyncDB
+        key: bytes
+        """
+        # Held so a flush can't be half way through writing the deltas
+        async with self.flush_lock:
+            value = await db.get(key)
+            return (db.decode(value) if value else 0) + self.counts.get((db, key), 0)
+
+    async def close(self):
+        """Flushes cached changes, waits for queued calls and closes the database."""
+        self.write_queue.close()
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.db.close()
+
+    async def delete_cache(self, search, cache):
         """Deletes a search from the cache.
 
         search: str
@@ -34,7 +1934,7 @@ class Database:
             cache.pop(search)
         except KeyError:
             return
-        self.main.put(b"cache", orjson.dumps(cache))
+        await self.main.put(b"cache", orjson.dumps(cache))
 
     async def add_karma(self, member_id, amount):
         """Adds or removes an amount from a members karma.
@@ -42,45 +1942,793 @@ class Database:
         member_id: int
         amount: int
         """
-        member_id = str(member_id).encode()
-        member_karma = self.karma.get(member_id)
+        self.count(self.karma, str(member_id).encode(), amount)
+
+    async def get_guild_settings(self, guild_id):
+        """Returns the cached settings of a guild, loading them if needed.
+
+        guild_id: int
+        """
+        if settings := self.guild_settings.get(guild_id):
+            return settings
+
+        generation = self.guild_settings_generation
+        items = await self.main.items(prefix=f"{guild_id}-".encode())
+        prefix_length = len(str(guild_id)) + 1
+        settings = GuildSettings.from_items(
+            guild_id, [(key[prefix_length:], value) for key, value in items]
+        )
+
+        # The settings changed during the read so they might be stale
+        if generation != self.guild_settings_generation:
+            return settings
+        return self.guild_settings.setdefault(guild_id, settings)
+
+    def invalidate_guild_settings(self, guild_id):
+        """Drops the cached settings of a guild after they are changed.
+
+        guild_id: int
+        """
+        self.guild_settings_generation += 1
+        self.guild_settings.pop(guild_id, None)
+
+    async def add_poll(self, message_id, guild_id, options, channel_id=None, end=None):
+        """Starts counting the votes of a poll.
+
+        message_id: int
+        guild_id: int
+        options: dict[str, str]
+            The names of the options keyed by their emoji.
+        channel_id: int
+        end: float
+            When the poll ends so it can be resumed after a restart.
+        """
+        poll = {
+            "guild": guild_id,
+            "channel": channel_id,
+            "end": end,
+            "options": {
+                emoji: {"name": name, "count": 0} for emoji, name in options.items()
+            },
+        }
+        self.active_polls[message_id] = poll
+        self.reaction_messages.add(message_id)
+        await self.polls.put(str(message_id).encode(), orjson.dumps(poll))
+
+    def add_vote(self, message_id, emoji):
+        """Counts a vote in memory, returns whether it was on a poll option.
+
+        message_id: int
+        emoji: str
+        """
+        poll = self.active_polls.get(message_id)
+
+        if not poll or emoji not in poll["options"]:
+            return False
+
+        poll["options"][emoji]["count"] += 1
+        self.dirty_polls.add(message_id)
+        return True
+
+    async def end_poll(self, message_id):
+        """Stops counting the votes of a poll and returns it.
+
+        message_id: int
+        """
+        poll = self.active_polls.pop(message_id, None)
+
+        if poll:
+            self.reaction_messages.discard(message_id)
+
+            # Stops a flush writing the poll back after it's deleted
+            async with self.flush_lock:
+                self.dirty_polls.discard(message_id)
+                await self.polls.delete(str(message_id).encode())
+
+        return poll
+
+    async def clear_polls(self):
+        """Removes every poll."""
+        self.reaction_messages.difference_update(self.active_polls)
+        self.active_polls.clear()
+        self.dirty_polls.clear()
+        await self.polls.write(deletes=await self.polls.keys())
+
+    async def add_history(self, db, guild_id, member_id, value):
+        """Queues an entry in a members deleted or edited history, the oldest
+        entries are dropped when the write queue is committed.
+
+        db: AsyncDB
+            Either deleted or edited.
+        guild_id: int
+        member_id: int
+        value: str | list
+        """
+        prefix = f"{guild_id}-{member_id}-".encode()
+        # Microseconds so a purge doesn't overwrite entries from the same second
+        key = prefix + str(time.time_ns() // 1000).encode()
+
+        db.queue_put(key, orjson.dumps(value))
+        self.write_queue.trims.add((db, prefix))
+
+    def _write_queue(self, writes, trims):
+        written = 0
+
+        with self.lock:
+            with self.db.write_batch() as wb:
+                for db, key, value in writes.values():
+                    db.stage(wb, key, value)
+                    written += len(key) + (len(value) if value else 0)
+
+            # After the writes so new history entries are counted
+            with self.db.write_batch() as wb:
+                for db, prefix in trims:
+                    with db.db.iterator(
+                        prefix=prefix, reverse=True, include_value=False
+                    ) as iterator:
+                        for old in itertools.islice(iterator, self.history_size, None):
+                            db.stage(wb, old)
+
+        self.executor.transfer("queue.write", written=written)
+
+    async def get_history(self, db, guild_id, member_id, amount=None):
+        """Returns a members newest deleted or edited messages, newest first.
+
+        db: AsyncDB
+        guild_id: int
+        member_id: int
+        amount: int
+
+        Returns a list of (unix timestamp, value) pairs.
+        """
+        prefix = f"{guild_id}-{member_id}-".encode()
+
+        if amount is not None:
+            amount = max(amount, 0)
+
+        return [
+            (int(key[len(prefix) :]) // 1000000, orjson.loads(value))
+            for key, value in await db.items(amount, prefix=prefix, reverse=True)
+        ]
+
+    async def prune_history(self, chunk=1000):
+        """Deletes deleted and edited messages older than history_age.
+
+        Returns how many entries were deleted.
+
+        chunk: int
+            How many keys to check per executor call.
+        """
+        cutoff = (time.time() - self.history_age) * 1000000
+        pruned = 0
+
+        for db in (self.deleted, self.edited):
+            await db.commit_queued()
+            start = b""
+
+            # In chunks so other calls aren't queued behind the whole scan
+            while start is not None:
+                count, start = await self.executor.run(
+                    f"{db.name}.prune", self._prune_history, db, cutoff, start, chunk
+                )
+                pruned += count
+
+        return pruned
+
+    def _prune_history(self, db, cutoff, start, chunk):
+        pruned = read = 0
+
+        with self.lock, self.db.write_batch() as wb:
+            with db.db.iterator(start=start, include_value=False) as iterator:
+                for read, key in enumerate(itertools.islice(iterator, chunk), 1):
+                    if int(key.rsplit(b"-", 1)[1]) < cutoff:
+                        db.stage(wb, key)
+                        pruned += 1
+
+        if read < chunk:
+            return pruned, None
+        # The next chunk starts at the key right after the last one read
+        return pruned, key + b"\x00"
+
+    def dump_value(self, key, value):
+        """Returns a value of the main DB as text, json data or a number.
+
+        key: bytes
+        value: bytes
+        """
+        codec = CODECS.get(key.split(b"-", 1)[0].decode())
+
+        if codec:
+            return codec.decode(value)
+        if value[:1] in [b"{", b"["]:
+            return orjson.loads(value)
+        return backup_value(value)
+
+    async def backup(self, directory, excluded=(), full=True):
+        """Streams a snapshot of the database to a gzipped file of json lines.
+
+        Full backups have every key, incremental ones only the keys changed
+        since the last full backup with null values for deleted keys. It falls
+        back to a full backup if the journal missed changes.
+
+        The first line is a header, each line after is [key, value] with
+        numbers decoded by their codec, binary values base64 encoded by
+        backup_value and the last line has the amount of keys and a sha256 of
+        the key lines. It runs on its own thread so other calls aren't queued
+        behind it, the stats are stored under last_backup.
+        Leaderboards are left out as they're rebuilt from the values.
+
+        directory: str
+        excluded: tuple[bytes]
+            Key prefixes to leave out.
+        full: bool
+        """
+        excluded = (*excluded, *[f"{name}-".encode() for name in self.leaderboards])
+        full = full or self.journal_start is None
+        await self.flush()
+
+        snapshot, changed = await self.executor.run(
+            "backup.snapshot", self._snapshot, full
+        )
+        header = {
+            "type": "full" if full else "incremental",
+            "time": time.time(),
+            "base": self.journal_start,
+            "excluded": [prefix.decode() for prefix in excluded],
+        }
+        path = f"{directory}/{time.time_ns()}-{header['type']}.ndjson.gz"
+        self.backup_progress = 0
+        start = time.perf_counter()
+
+        try:
+            written = await asyncio.get_running_loop().run_in_executor(
+                None, self._backup, snapshot, path, header, changed
+            )
+        except Exception:
+            # Incremental backups can't be based on a full backup that failed
+            if full:
+                self.journal_start = None
+            raise
+        finally:
+            snapshot.close()
+            self.backup_progress = None
+
+        duration = time.perf_counter() - start
+        self.executor.record("backup", duration)
+
+        stats = {
+            "type": header["type"],
+            "path": path,
+            "keys": written,
+            "bytes": os.path.getsize(path),
+            "duration": duration,
+            "time": header["time"],
+        }
+        await self.main.put(b"last_backup", orjson.dumps(stats))
+        return stats
+
+    def _snapshot(self, full):
+        # Under the lock so no write lands between reading the journal and the
+        # snapshot, writers add to the journal while holding it
+        with self.lock:
+            if full:
+                self.journal.clear()
+                self.journal_start = time.time()
+                return self.db.snapshot(), None
+
+            return self.db.snapshot(), sorted(self.journal)
+
+    def _backup(self, snapshot, path, header, changed):
+        excluded = tuple(prefix.encode() for prefix in header["excluded"])
+        checksum = hashlib.sha256()
+        written = 0
+        lines = []
+
+        if changed is None:
+            items = self.snapshot_items(snapshot, excluded)
+        else:
+            items = (
+                (key, snapshot.get(key))
+                for key in changed
+                if not key.startswith(excluded)
+            )
+
+        # Written to a temporary file so a failed backup doesn't replace the last
+        with gzip.open(f"{path}.tmp", "wb") as file:
+            file.write(orjson.dumps(header) + b"\n")
+
+            for key, value in items:
+                if value is not None:
+                    codec = CODECS.get(key.split(b"-", 1)[0].decode())
+                    value = codec.decode(value) if codec else backup_value(value)
+
+                line = orjson.dumps([key.decode(), value]) + b"\n"
+                checksum.update(line)
+                lines.append(line)
+                written += 1
+
+                if len(lines) == 10000:
+                    file.write(b"".join(lines))
+                    lines.clear()
+                    self.backup_progress = written
+
+            file.write(b"".join(lines))
+            file.write(
+                orjson.dumps({"keys": written, "sha256": checksum.hexdigest()}) + b"\n"
+            )
+
+        os.replace(f"{path}.tmp", path)
+        return written
+
+    @staticmethod
+    def snapshot_items(snapshot, excluded):
+        """Yields the keys and values of a snapshot skipping excluded prefixes.
+
+        snapshot: plyvel.Snapshot
+        excluded: tuple[bytes]
+        """
+        with snapshot.iterator() as iterator:
+            for key, value in iterator:
+                if key.startswith(excluded):
+                    # Jumps past the prefix instead of reading every key in it
+                    for prefix in excluded:
+                        if key.startswith(prefix):
+                            iterator.seek(prefix_end(prefix))
+                            break
+                    continue
+
+                yield key, value
+
+    @staticmethod
+    def verify_backup(path):
+        """Checks the checksum of a backup.
+
+        Returns the header and amount of keys, raises ValueError if the
+        backup is corrupted or incomplete.
+
+        path: str
+        """
+        checksum = hashlib.sha256()
+        keys = 0
+        footer = None
+
+        try:
+            with gzip.open(path, "rb") as file:
+                header = orjson.loads(file.readline())
+
+                for line in file:
+                    # Key lines are lists so the footer is the only object
+                    if line[:1] == b"{":
+                        footer = orjson.loads(line)
+                        break
+
+                    checksum.update(line)
+                    keys += 1
+
+                # Nothing should come after the footer
+                if file.readline():
+                    footer = None
+        except (EOFError, gzip.BadGzipFile, orjson.JSONDecodeError) as e:
+            raise ValueError(f"{path} couldn't be read: {e}") from e
+
+        if footer != {"keys": keys, "sha256": checksum.hexdigest()}:
+            raise ValueError(f"{path} doesn't match its checksum")
+
+        return header, keys
+
+    async def verify_backups(self, paths):
+        """Checks the checksums of a full backup and incremental backups.
+
+        Returns the headers of the backups and how many keys they have.
+
+        paths: list[str]
+            The full backup followed by incremental backups based on it.
+        """
+        if not paths:
+            raise ValueError("No backups to verify")
+
+        loop = asyncio.get_running_loop()
+        headers = []
+        keys = 0
+
+        for path in paths:
+            header, count = await loop.run_in_executor(None, self.verify_backup, path)
+            headers.append(header)
+            keys += count
+
+            if headers[0]["type"] != "full":
+                raise ValueError(f"{paths[0]} isn't a full backup")
+            if header["base"] != headers[0]["base"]:
+                raise ValueError(f"{path} isn't based on {paths[0]}")
+
+        return headers, keys
+
+    async def restore(self, paths, chunk=10000):
+        """Replaces the database with a full backup and incremental backups.
+
+        Every backup is verified before anything is written, then they're
+        loaded in write batches of chunk keys and the leaderboards rebuilt.
+        Keys with an excluded prefix in the full backup are kept.
+
+        paths: list[str]
+            The full backup followed by incremental backups based on it.
+        chunk: int
+        """
+        start = time.perf_counter()
+        headers, keys = await self.verify_backups(paths)
+        excluded = tuple(prefix.encode() for prefix in headers[0]["excluded"])
+
+        verified = time.perf_counter()
+        # Writes to excluded keys are kept so they're written first
+        await self.flush()
+
+        # Held so neither a flush nor a queue commit writes over the restore
+        async with self.flush_lock, self.write_queue.lock:
+            await self.executor.run("restore", self._restore, paths, excluded, chunk)
+
+            # Writes made since the flush and cached state were of the replaced keys
+            self.write_queue.close()
+            self.write_queue.pending.clear()
+            self.write_queue.trims.clear()
+            self.dirty_balances.clear()
+            self.counts = {}
+            self.journal_start = None
+            self.balances.clear()
+            self.guild_settings_generation += 1
+            self.guild_settings.clear()
+            self.market_hashes.clear()
+            self.price_tables.clear()
+            await self.executor.run("restore.load", self._load_state)
+
+        return {
+            "backups": len(paths),
+            "keys": keys,
+            "bytes": sum(os.path.getsize(path) for path in paths),
+            "verify": verified - start,
+            "duration": time.perf_counter() - start,
+        }
+
+    def _restore(self, paths, excluded, chunk):
+        with self.lock:
+            wb = self.db.write_batch()
+            staged = 0
+
+            with self.db.iterator(include_value=False) as iterator:
+                for key in iterator:
+                    if not key.startswith(excluded):
+                        wb.delete(key)
+                        staged += 1
+
+                        if staged % chunk == 0:
+                            wb.write()
+                            wb = self.db.write_batch()
+
+            for path in paths:
+                with gzip.open(path, "rb") as file:
+                    file.readline()
+
+                    for line in file:
+                        if line[:1] == b"{":
+                            break
+
+                        key, value = orjson.loads(line)
+                        key = key.encode()
+
+                        if value is None:
+                            wb.delete(key)
+                        elif codec := CODECS.get(key.split(b"-", 1)[0].decode()):
+                            wb.put(key, codec.encode(value))
+                        else:
+                            wb.put(key, restore_value(value))
+
+                        staged += 1
+
+                        if staged % chunk == 0:
+                            wb.write()
+                            wb = self.db.write_batch()
+
+            wb.write()
+
+            for leaderboard in self.leaderboards.values():
+                leaderboard.build()
+
+            self.journal.clear()
+
+    def _load_state(self):
+        # Full prefix scans, each is swapped in whole so the loop never sees
+        # one half loaded
+        with self.lock:
+            self.load_schema_version()
+            self.load_polls()
+            self.load_blacklist()
+            self.load_reaction_messages()
+            self.net_worths.load()
+
+    async def compact(self, prefixes):
+        """Compacts the keys of prefixes dropping overwritten and deleted values.
+
+        Returns the size and the time to scan each prefix before and after,
+        the stats are also stored under last_compaction.
+
+        prefixes: Iterable[bytes]
+        """
+        loop = asyncio.get_running_loop()
+        await self.flush()
+
+        stats = {"prefixes": {}, "disk": [disk_size(self.path)], "time": time.time()}
+        start = time.perf_counter()
+
+        # On its own thread as compactions can take a while and reads
+        # and writes don't need to wait for them
+        for prefix in prefixes:
+            before, after = await loop.run_in_executor(
+                None, self._compact_prefix, prefix
+            )
+
+            stats["prefixes"][prefix.decode()] = {
+                "size": [before[0], after[0]],
+                "scan": [before[1], after[1]],
+            }
+
+        stats["disk"].append(disk_size(self.path))
+        stats["duration"] = time.perf_counter() - start
+        self.executor.record("compact", stats["duration"])
+
+        await self.main.put(b"last_compaction", orjson.dumps(stats))
+        return stats
+
+    def _compact_prefix(self, prefix):
+        before = self._prefix_stats(prefix)
+        self.db.compact_range(start=prefix, stop=prefix_end(prefix))
+        return before, self._prefix_stats(prefix)
+
+    def _prefix_stats(self, prefix):
+        size = self.db.approximate_size(prefix, prefix_end(prefix))
+        times = []
+
+        # The fastest of two scans so the blocks are cached for both
+        for _ in range(2):
+            start = time.perf_counter()
+
+            with self.db.iterator(prefix=prefix) as iterator:
+                for _ in iterator:
+                    pass
+
+            times.append(time.perf_counter() - start)
+
+        return size, min(times)
+
+    async def migrate(self, chunk=1000):
+        """Runs the migrations newer than the schema version of the database.
+
+        Returns how many keys each migration changed by version.
+
+        chunk: int
+            How many keys to migrate per executor call.
+        """
+        migrated = {}
+
+        for version in sorted(MIGRATIONS):
+            if version > self.schema_version:
+                migrated[version] = await self.run_migration(version, chunk)
+
+        return migrated
+
+    async def run_migration(self, version, chunk=1000):
+        """Runs a migration and sets the schema version to its version.
+
+        Keys are read in chunks, each chunk is written in one batch with
+        the progress so a migration that's stopped carries on from the last
+        chunk the next time it's run.
+
+        Returns how many keys were changed.
+
+        version: int
+        chunk: int
+        """
+        names, func = MIGRATIONS[version]
+        progress = await self.main.get(b"schema_progress")
+        progress = orjson.loads(progress) if progress else {}
+        migrated = 0
+
+        if progress.get("version") == version:
+            names = names[names.index(progress["name"]) :]
+            start = bytes.fromhex(progress["start"])
+        else:
+            start = b""
+
+        await self.flush()
+
+        for name in names:
+            # In chunks so other calls aren't queued behind the whole migration
+            while start is not None:
+                count, start = await self.executor.run(
+                    f"{name}.migrate",
+                    self._migrate_chunk,
+                    version,
+                    name,
+                    func,
+                    start,
+                    chunk,
+                )
+                migrated += count
 
-        if not member_karma:
-            member_karma = amount
+            start = b""
+
+        await self.executor.run("schema.migrate", self._set_schema_version, version)
+        return migrated
+
+    def _migrate_chunk(self, version, name, func, start, chunk):
+        db = getattr(self, name)
+        migrated = read = 0
+
+        with self.lock, self.db.write_batch() as wb:
+            with db.db.iterator(start=start) as iterator:
+                for read, (key, value) in enumerate(
+                    itertools.islice(iterator, chunk), 1
+                ):
+                    migrated += bool(func(self, db, wb, key, value))
+
+            if read < chunk:
+                return migrated, None
+
+            # The next chunk starts at the key right after the last one read
+            start = key + b"\x00"
+            progress = {"version": version, "name": name, "start": start.hex()}
+            self.main.stage(wb, b"schema_progress", orjson.dumps(progress))
+
+        return migrated, start
+
+    def _set_schema_version(self, version):
+        with self.lock, self.db.write_batch() as wb:
+            self.main.stage(wb, b"schema_progress")
+            self.main.stage(wb, b"history_migrated")
+            self.main.stage(wb, b"schema_version", str(version).encode())
+            self.schema_version = max(self.schema_version, version)
+
+    def load_schema_version(self):
+        """Loads the version of the last migration the database has had."""
+        # Databases from before the migrations only record the history split
+        if schema := self.db.get(b"schema_version"):
+            self.schema_version = int(schema)
+        elif self.db.get(b"history_migrated"):
+            self.schema_version = 1
+        elif self.is_empty(self.main):
+            self.schema_version = max(MIGRATIONS)
+            self.db.put(b"schema_version", str(self.schema_version).encode())
         else:
-            member_karma = int(member_karma) + amount
+            self.schema_version = 0
 
-        self.karma.put(member_id, str(member_karma).encode())
+    def load_polls(self):
+        """Loads the polls that were running when the bot stopped."""
+        self.active_polls = {
+            int(message_id): orjson.loads(poll) for message_id, poll in self.polls.db
+        }
+        self.dirty_polls = set()
 
-    async def get_blacklist(self, member_id, guild=None):
-        """Returns whether someone is blacklisted.
+    def load_reaction_messages(self):
+        """Loads the ids of messages that have reactions the bot handles."""
+        messages = set(self.active_polls)
+
+        with self.rrole.db.iterator(include_value=False) as iterator:
+            messages.update(map(int, iterator))
+
+        if emojis := self.db.get(b"emoji_submissions"):
+            messages.update(map(int, orjson.loads(emojis)))
+
+        self.reaction_messages = messages
+
+    def load_blacklist(self):
+        """Loads the blacklist into memory."""
+        blacklisted = {}
+
+        for key, state in self.blacklist.db:
+            key = tuple(map(int, key.split(b"-")))
+            blacklisted[key if len(key) > 1 else key[0]] = state
+
+        self.blacklisted = blacklisted
+
+    def get_blacklist(self, member_id, guild=None):
+        """Returns whether someone is blacklisted, b"1" is downvoted b"2" blacklisted.
 
         member_id: int
+        guild: int
         """
-        if state := self.blacklist.get(str(member_id).encode()):
+        if state := self.blacklisted.get(member_id):
             return state
 
-        if guild and (state := self.blacklist.get(f"{guild}-{member_id}".encode())):
-            return state
+        if guild:
+            return self.blacklisted.get((guild, member_id))
+
+    async def set_blacklist(self, member_id, state, guild=None):
+        """Sets someones blacklist state or removes them if state is None.
+
+        member_id: int
+        state: bytes
+        guild: int
+            The guild to blacklist them in, global if None.
+        """
+        if guild is None:
+            key, db_key = member_id, str(member_id).encode()
+        else:
+            key, db_key = (guild, member_id), f"{guild}-{member_id}".encode()
+
+        if state is None:
+            self.blacklisted.pop(key, None)
+            await self.blacklist.delete(db_key)
+        else:
+            self.blacklisted[key] = state
+            await self.blacklist.put(db_key, state)
+
+    async def clear_blacklist(self):
+        """Removes everyone from the blacklist."""
+        self.blacklisted.clear()
+        await self.blacklist.write(deletes=await self.blacklist.keys())
 
     async def get_bal(self, member_id):
         """Gets the balance of an member.
 
         member_id: bytes
         """
-        balance = self.bal.get(member_id)
+        if member_id in self.balances:
+            self.balances.move_to_end(member_id)
+            return self.balances[member_id]
 
-        if balance:
-            return float(balance)
+        if member_id in self.dirty_balances:
+            balance = self.dirty_balances[member_id]
+        elif member_id in self.flushing_balances:
+            balance = self.flushing_balances[member_id]
+        else:
+            balance = await self.bal.get(member_id)
+            balance = self.bal.decode(balance) if balance else 1000.0
+
+            # A put could have happened while we were reading
+            if member_id in self.balances:
+                return self.balances[member_id]
+
+        self.cache_bal(member_id, balance)
+        return balance
+
+    def cache_bal(self, member_id, balance):
+        """Puts a balance in the cache evicting the least recently used.
+
+        Evicted balances that haven't been flushed stay in dirty_balances.
+
+        member_id: bytes
+        balance: float
+        """
+        self.balances[member_id] = balance
+        self.balances.move_to_end(member_id)
 
-        return 1000.0
+        if len(self.balances) > self.balance_cache_size:
+            self.balances.popitem(last=False)
 
     async def get_baltop(self, amount: int):
         """Gets the top [amount] balances.
 
         amount: int
         """
-        return sorted([(float(b), int(m)) for m, b in self.bal], reverse=True)[:amount]
+        await self.flush()
+        return [
+            (balance, int(member_id))
+            for member_id, balance in await self.baltop.top(amount)
+        ]
+
+    async def write_balances(self, balances, puts=None):
+        """Writes balances and other staged puts in one batch.
+
+        balances: dict[bytes, float]
+        puts: dict[tuple[AsyncDB, bytes], bytes]
+        """
+        await self.executor.run("bal.write", self._write_balances, balances, puts or {})
+
+    def _write_balances(self, balances, puts):
+        with self.lock, self.db.write_batch() as wb:
+            for member_id, balance in balances.items():
+                self.bal.stage(wb, member_id, self.bal.encode(balance))
+
+            for (db, key), value in puts.items():
+                db.stage(wb, key, value)
 
     async def put_bal(self, member_id, amount: float):
         """Sets the balance of an member.
@@ -88,7 +2736,8 @@ class Database:
         member_id: bytes
         amount: int
         """
-        self.bal.put(member_id, str(amount).encode())
+        self.cache_bal(member_id, amount)
+        self.dirty_balances[member_id] = amount
         return amount
 
     async def add_bal(self, member_id, amount: float):
@@ -99,7 +2748,9 @@ class Database:
         """
         if amount < 0:
             raise ValueError("You can't pay a negative amount")
-        return await self.put_bal(member_id, await self.get_bal(member_id) + amount)
+
+        async with self.transaction(member_id) as txn:
+            return txn.put_bal(member_id, await txn.get_bal(member_id) + amount)
 
     async def withdraw_bal(self, member_id, amount: float):
         """Withdraws from the balance of an member.
@@ -109,7 +2760,9 @@ class Database:
         """
         if amount < 0:
             raise ValueError("You can't pay a negative amount")
-        return await self.put_bal(member_id, await self.get_bal(member_id) - amount)
+
+        async with self.transaction(member_id) as txn:
+            return txn.put_bal(member_id, await txn.get_bal(member_id) - amount)
 
     async def transfer(self, _from, to, amount: float):
         """Transfers money from one member to another.
@@ -118,37 +2771,51 @@ class Database:
         to: bytes
         amount: int
         """
-        from_bal = await self.get_bal(_from)
+        if amount < 0:
+            raise ValueError("You can't pay a negative amount")
+
+        async with self.transaction(_from, to) as txn:
+            from_bal = await txn.get_bal(_from)
 
-        if from_bal > amount:
-            await self.add_bal(to, amount)
-            return await self.withdraw_bal(_from, amount)
+            if from_bal > amount:
+                txn.put_bal(to, await txn.get_bal(to) + amount)
+                return txn.put_bal(_from, from_bal - amount)
 
     async def get_stock(self, symbol):
         """Returns the data of a stock.
 
         symbol: bytes
         """
-        stock = self.stocks.get(symbol.encode())
+        stock = await self.stocks.get(symbol.encode())
 
         if stock:
             return orjson.loads(stock)
         return None
 
+    async def get_stock_price(self, symbol):
+        """Returns the price of a stock or None.
+
+        symbol: str
+        """
+        return (await self.get_prices(self.stocks)).get(symbol)
+
     async def put_stock(self, symbol, data):
         """Sets the data of a stock.
 
         symbol: bytes
         data: dict
         """
-        self.stocks.put(symbol.encode(), orjson.dumps(data))
+        await self.stocks.put(symbol.encode(), orjson.dumps(data))
+        # Reloaded from the db on the next lookup
+        self.price_tables.pop("stocks", None)
+        self.market_hashes.pop("stocks", None)
 
     async def get_stockbal(self, member_id):
         """Returns a members stockbal.
 
         member_id: bytes
         """
-        data = self.stockbal.get(member_id)
+        data = await self.stockbal.get(member_id)
 
         if data:
             return orjson.loads(data)
@@ -160,19 +2827,26 @@ class Database:
         member_id: bytes
         data: dict
         """
-        self.stockbal.put(member_id, orjson.dumps(data))
+        await self.stockbal.put(member_id, orjson.dumps(data))
 
     async def get_crypto(self, symbol):
         """Returns the data of a crypto.
 
         symbol: bytes
         """
-        data = self.crypto.get(symbol.encode())
+        data = await self.crypto.get(symbol.encode())
 
         if data:
             return orjson.loads(data)
         return None
 
+    async def get_crypto_price(self, symbol):
+        """Returns the price of a crypto or None.
+
+        symbol: str
+        """
+        return (await self.get_prices(self.crypto)).get(symbol)
+
     async def put_crypto(self, symbol, data):
         """Sets the data of a crypto.
 
@@ -180,14 +2854,16 @@ class Database:
         data: dict
         """
         data = orjson.dumps(data)
-        self.crypto.put(symbol.encode(), data)
+        await self.crypto.put(symbol.encode(), data)
+        self.price_tables.pop("crypto", None)
+        self.market_hashes.pop("crypto", None)
 
     async def get_cryptobal(self, member_id):
         """Returns a members cryptobal.
 
         member_id: bytes
         """
-        data = self.cryptobal.get(member_id)
+        data = await self.cryptobal.get(member_id)
 
         if data:
             return orjson.loads(data)
@@ -199,4 +2875,4 @@ class Database:
         member_id: bytes
         data: dict
         """
-        self.cryptobal.put(member_id, orjson.dumps(data))
+        await self.cryptobal.put(member_id, orjson.dumps(data))
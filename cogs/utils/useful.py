@@ -27,3 +27,20 @@ async def run_process(command, raw=False):
         return [output.decode() for output in result]
 
     return "".join([output.decode() for output in result]).split()
+
+
+def sparkline(values, width=40):
+    """Draws values as a line of block characters.
+
+    values: Sequence[float]
+    width: int
+        The most characters to draw, values are sampled to fit.
+    """
+    if len(values) > width:
+        values = [values[(i + 1) * len(values) // width - 1] for i in range(width)]
+
+    blocks = "▁▂▃▄▅▆▇█"
+    low, high = min(values), max(values)
+    scale = (len(blocks) - 1) / (high - low) if high > low else 0
+
+    return "".join(blocks[round((value - low) * scale)] for value in values)
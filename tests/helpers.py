@@ -194,6 +194,7 @@ class MockBot(CustomMockMixin, unittest.mock.MagicMock):
     spec_set = Bot(
         command_prefix=".",
         loop=_get_mock_loop(),
+        database={"backend": "memory"},
     )
     additional_spec_asyncs = "wait_for"
 
@@ -0,0 +1,133 @@
+import random
+import tempfile
+import unittest
+
+from cogs.utils.backends import lmdb, open_backend
+
+
+class BackendTests(unittest.TestCase):
+    """Checks the other backends behave like LevelDB."""
+
+    backend = "memory"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.leveldb = open_backend("leveldb", f"{self.directory.name}/leveldb")
+        self.db = open_backend(self.backend, f"{self.directory.name}/{self.backend}")
+
+        random.seed(5)
+        keys = [
+            bytes(random.choices(b"ab-\xff", k=random.randint(1, 4)))
+            for _ in range(300)
+        ]
+
+        for db in (self.leveldb, self.db):
+            with db.write_batch() as wb:
+                for key in keys:
+                    wb.put(key, key * 2)
+                for key in keys[::7]:
+                    wb.delete(key)
+            db.put(b"a-1", b"1")
+            db.delete(b"b")
+
+    def tearDown(self):
+        self.leveldb.close()
+        self.db.close()
+        self.directory.cleanup()
+
+    def assertSameIterator(self, **kwargs):
+        with self.leveldb.iterator(**kwargs) as expected:
+            with self.db.iterator(**kwargs) as iterator:
+                self.assertEqual(list(iterator), list(expected), kwargs)
+
+    def test_get(self):
+        for key in (b"a-1", b"b", b"missing"):
+            self.assertEqual(self.db.get(key), self.leveldb.get(key))
+        self.assertEqual(self.db.get(b"missing", b"default"), b"default")
+
+    def test_iterators(self):
+        for reverse in (False, True):
+            self.assertSameIterator(reverse=reverse)
+            self.assertSameIterator(prefix=b"a-", reverse=reverse)
+            self.assertSameIterator(prefix=b"\xff", reverse=reverse)
+            self.assertSameIterator(start=b"a", stop=b"b-", reverse=reverse)
+            self.assertSameIterator(start=b"b", reverse=reverse)
+            self.assertSameIterator(prefix=b"a", include_value=False, reverse=reverse)
+            self.assertSameIterator(prefix=b"b", include_key=False, reverse=reverse)
+
+    def test_seek(self):
+        for target in (b"a-", b"b", b"\xff\xff\xff\xff\xff"):
+            for reverse in (False, True):
+                with self.leveldb.iterator(reverse=reverse) as expected:
+                    with self.db.iterator(reverse=reverse) as iterator:
+                        next(expected)
+                        next(iterator)
+                        expected.seek(target)
+                        iterator.seek(target)
+                        self.assertEqual(list(iterator), list(expected), target)
+
+    def test_prefixed_db(self):
+        expected = self.leveldb.prefixed_db(b"a")
+        db = self.db.prefixed_db(b"a")
+
+        self.assertEqual(list(db), list(expected))
+        self.assertEqual(
+            list(db.iterator(prefix=b"-", reverse=True)),
+            list(expected.iterator(prefix=b"-", reverse=True)),
+        )
+        self.assertEqual(
+            list(db.iterator(include_value=False)),
+            list(expected.iterator(include_value=False)),
+        )
+
+        db.put(b"-new", b"1")
+        self.assertEqual(self.db.get(b"a-new"), b"1")
+
+        expected.put(b"-new", b"1")
+        for reverse in (False, True):
+            with db.iterator(reverse=reverse) as iterator:
+                with expected.iterator(reverse=reverse) as expected_iterator:
+                    iterator.seek(b"-a")
+                    expected_iterator.seek(b"-a")
+                    self.assertEqual(list(iterator), list(expected_iterator))
+
+    def test_snapshot(self):
+        snapshot = self.db.snapshot()
+        self.db.put(b"a-1", b"2")
+        self.db.delete(b"a")
+
+        self.assertEqual(snapshot.get(b"a-1"), b"1")
+        with snapshot.iterator(prefix=b"a-1") as iterator:
+            self.assertEqual(list(iterator), [(b"a-1", b"1")])
+        snapshot.close()
+
+    def test_write_batch(self):
+        with self.assertRaises(ValueError):
+            with self.db.write_batch(transaction=True) as wb:
+                wb.put(b"c", b"1")
+                raise ValueError
+
+        self.assertIsNone(self.db.get(b"c"))
+
+        with self.assertRaises(TypeError):
+            self.db.put(b"c", "1")
+
+    def test_writes_while_iterating(self):
+        with self.db.iterator(prefix=b"a", include_value=False) as iterator:
+            keys = [next(iterator)]
+            self.db.delete(keys[0])
+            self.db.put(keys[0] + b"\x00", b"1")
+            keys.extend(iterator)
+
+        self.assertEqual(len(keys), len(set(keys)))
+
+
+@unittest.skipIf(lmdb is None, "lmdb isn't installed")
+class LMDBBackendTests(BackendTests):
+    backend = "lmdb"
+
+    def test_writes_while_iterating(self):
+        # Iterators read from a transaction so they don't see later writes
+        with self.db.iterator(prefix=b"a", include_value=False) as iterator:
+            self.db.put(b"a\xff\xff", b"1")
+            self.assertNotIn(b"a\xff\xff", list(iterator))
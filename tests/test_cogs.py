@@ -14,7 +14,7 @@ from cogs.crypto import crypto
 from cogs.apis import apis
 
 
-bot = Bot(helpers.MockBot())
+bot = Bot(helpers.MockBot(), database={"backend": "memory"})
 asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
@@ -0,0 +1,925 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import orjson
+
+from cogs.utils.database import (
+    FLOAT,
+    INT,
+    MIGRATIONS,
+    Database,
+    PriceHistory,
+    PriceTable,
+    backup_chain,
+    backup_files,
+    decode_score,
+    encode_score,
+    prefix_end,
+    prune_backups,
+)
+
+
+class DatabaseTests(unittest.IsolatedAsyncioTestCase):
+    backend = "leveldb"
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.DB = Database(self.directory.name, backend=self.backend)
+        self.backups = f"{self.directory.name}/backup"
+        os.makedirs(self.backups)
+
+    async def asyncTearDown(self):
+        await self.DB.close()
+        self.directory.cleanup()
+
+    async def test_get_put_delete(self):
+        await self.DB.main.put(b"key", b"value")
+        self.assertEqual(await self.DB.main.get(b"key"), b"value")
+
+        await self.DB.main.delete(b"key")
+        self.assertIsNone(await self.DB.main.get(b"key"))
+
+    async def test_prefixed_items(self):
+        await self.DB.karma.write([(b"1", b"5"), (b"2", b"-3")])
+
+        self.assertEqual(await self.DB.karma.items(), [(b"1", b"5"), (b"2", b"-3")])
+        self.assertEqual(await self.DB.karma.keys(), [b"1", b"2"])
+        self.assertEqual(await self.DB.main.get(b"karma-1"), b"5")
+
+    async def test_balances(self):
+        member = b"1"
+
+        self.assertEqual(await self.DB.get_bal(member), 1000.0)
+        await self.DB.add_bal(member, 500)
+        await self.DB.put_bal(b"2", 20.5)
+
+        self.assertEqual(await self.DB.get_bal(member), 1500.0)
+        self.assertEqual(await self.DB.get_baltop(1), [(1500.0, 1)])
+
+        with self.assertRaises(ValueError):
+            await self.DB.withdraw_bal(member, -5)
+
+    async def test_latency_stats(self):
+        await self.DB.bal.get(b"1")
+        await self.DB.bal.get(b"1")
+
+        self.assertEqual(self.DB.executor.stats["bal.get"][0], 2)
+        self.assertEqual(self.DB.executor.queued, 0)
+
+    async def test_prefix_metrics(self):
+        executor = self.DB.executor
+        await self.DB.stocks.put(b"AAPL", b"price")
+        await self.DB.stocks.get(b"AAPL")
+        await self.DB.stocks.get(b"AAPL")
+        await self.DB.stocks.items()
+        await self.DB.stocks.keys()
+
+        self.assertEqual(executor.stats["stocks.put"][4], 9)
+        self.assertEqual(executor.stats["stocks.get"][3], 10)
+        self.assertEqual(executor.stats["stocks.iterate"][3], 13)
+        self.assertEqual(sum(executor.stats["stocks.get"][5]), 2)
+        self.assertEqual(executor.keys["stocks"].most_common(1), [(b"AAPL", 3)])
+        self.assertLessEqual(
+            executor.percentile("stocks.get", 0.5), executor.buckets[-1]
+        )
+
+        stats = orjson.loads(orjson.dumps(executor.export()))
+        self.assertEqual(stats["calls"]["stocks.iterate"]["count"], 2)
+        self.assertEqual(sum(stats["calls"]["stocks.get"]["histogram"].values()), 2)
+        self.assertEqual(stats["keys"]["stocks"], [["AAPL", 3]])
+
+    async def test_stats_threads(self):
+        executor = self.DB.executor
+
+        def transfer(start):
+            for i in range(start, start + 2000):
+                executor.transfer(f"thread.{i % 500}", written=1)
+
+        # Copies are taken while the database threads add new calls
+        threads = [threading.Thread(target=transfer, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            executor.copy_stats()
+        for thread in threads:
+            thread.join()
+
+        copy = executor.copy_stats()
+        self.assertEqual(sum(copy[f"thread.{i}"][4] for i in range(500)), 8000)
+
+    async def test_hot_keys_capped(self):
+        self.DB.executor.hot_keys = 4
+
+        for i in range(20):
+            await self.DB.karma.get(b"hot")
+            await self.DB.karma.get(str(i).encode())
+
+        keys = self.DB.executor.keys["karma"]
+        self.assertLess(len(keys), 8)
+        self.assertEqual(keys.most_common(1), [(b"hot", 20)])
+
+    async def test_balance_cache(self):
+        await self.DB.put_bal(b"1", 50.0)
+
+        self.assertIsNone(await self.DB.bal.get(b"1"))
+        self.assertEqual(await self.DB.get_bal(b"1"), 50.0)
+
+        await self.DB.flush()
+
+        self.assertEqual(await self.DB.bal.get(b"1"), FLOAT.encode(50.0))
+        self.assertEqual(self.DB.dirty_balances, {})
+
+    async def test_balance_cache_eviction(self):
+        self.DB.balance_cache_size = 2
+
+        for member_id in (b"1", b"2", b"3"):
+            await self.DB.put_bal(member_id, 10.0)
+
+        self.assertNotIn(b"1", self.DB.balances)
+        self.assertEqual(await self.DB.get_bal(b"1"), 10.0)
+
+        await self.DB.flush()
+        self.assertEqual(len(await self.DB.bal.items()), 3)
+
+    async def test_transfer(self):
+        await self.DB.put_bal(b"1", 100.0)
+
+        await asyncio.gather(*[self.DB.transfer(b"1", b"2", 10) for _ in range(10)])
+
+        # The last transfer fails as the balance has to be more than the amount
+        self.assertEqual(await self.DB.get_bal(b"1"), 10.0)
+        self.assertEqual(await self.DB.get_bal(b"2"), 1090.0)
+
+    async def test_transaction(self):
+        await self.DB.put_bal(b"1", 100.0)
+
+        async with self.DB.transaction(b"1") as txn:
+            bal = await txn.get_bal(b"1")
+            txn.put_bal(b"1", bal - 40)
+            txn.put_stockbal(b"1", {"AAPL": {"total": 2, "history": []}})
+
+        self.assertEqual(await self.DB.bal.get(b"1"), FLOAT.encode(60.0))
+        self.assertEqual(
+            await self.DB.get_stockbal(b"1"), {"AAPL": {"total": 2, "history": []}}
+        )
+        self.assertEqual(self.DB.dirty_balances, {})
+
+    async def test_queued_write_in_transaction(self):
+        wins = orjson.dumps({"highestwin": 1, "highestlose": 0, "currentwin": 1})
+
+        # Like slot, a balance and a queued streak stay out of the batch path
+        async with self.DB.transaction(b"1") as txn:
+            txn.put_bal(b"1", 5.0)
+            self.DB.wins.queue_put(b"1", wins)
+
+        self.assertEqual(self.DB.dirty_balances, {b"1": 5.0})
+        self.assertEqual(await self.DB.wins.get(b"1"), wins)
+
+        await self.DB.flush()
+        self.assertEqual(await self.DB.bal.get(b"1"), FLOAT.encode(5.0))
+        self.assertEqual(self.DB.db.get(b"wins-1"), wins)
+
+    async def test_transaction_rollback(self):
+        with self.assertRaises(ValueError):
+            async with self.DB.transaction(b"1") as txn:
+                txn.put_bal(b"1", 5.0)
+                raise ValueError
+
+        self.assertEqual(await self.DB.get_bal(b"1"), 1000.0)
+
+    async def test_score_encoding(self):
+        scores = [-1e300, -5.5, -0.0, 0.0, 1e-300, 2.25, 1000.0, 1e300]
+
+        self.assertEqual(sorted(scores, key=encode_score), scores)
+        for score in scores:
+            self.assertEqual(decode_score(encode_score(score)), score)
+
+    async def test_baltop_index(self):
+        await self.DB.put_bal(b"1", 50.0)
+        await self.DB.put_bal(b"2", -20.0)
+        await self.DB.put_bal(b"3", 5000.0)
+        await self.DB.flush()
+        await self.DB.put_bal(b"3", 10.0)
+
+        self.assertEqual(
+            await self.DB.get_baltop(5), [(50.0, 1), (10.0, 3), (-20.0, 2)]
+        )
+        self.assertEqual(len(await self.DB.baltop.index.keys()), 3)
+
+    async def test_baltop_rebuild(self):
+        await self.DB.bal.write([(b"1", b"20.0"), (b"2", b"30.0")])
+        await self.DB.close()
+
+        self.DB = Database(self.directory.name)
+
+        self.assertEqual(await self.DB.get_baltop(1), [(30.0, 2)])
+
+    async def test_leaderboard(self):
+        await self.DB.add_karma(1, 5)
+        await self.DB.add_karma(2, -3)
+        await self.DB.add_karma(3, 1)
+        await self.DB.add_karma(1, -10)
+        await self.DB.flush()
+
+        self.assertEqual(await self.DB.karmatop.top(2), [(b"3", 1), (b"2", -3)])
+        self.assertEqual(await self.DB.karmatop.bottom(1), [(b"1", -5)])
+
+        await self.DB.karma.delete(b"1")
+        self.assertEqual(len(await self.DB.karmatop.index.keys()), 2)
+
+    async def test_grouped_leaderboard(self):
+        for key in (b"1-1", b"1-2", b"1-2", b"2-1", b"2-1", b"2-1"):
+            self.DB.count(self.DB.message_count, key)
+        await self.DB.flush()
+
+        self.assertEqual(await self.DB.messagetop.top(5, 1), [(b"1-2", 2), (b"1-1", 1)])
+        self.assertEqual(await self.DB.messagetop.top(5, 2), [(b"2-1", 3)])
+
+    async def test_transaction_leaderboard(self):
+        async with self.DB.transaction(b"1") as txn:
+            txn.put(self.DB.cookies, b"1", b'{"cookies": 5, "upgrade": 2}')
+            txn.put(self.DB.stockbal, b"1", b"{}")
+
+        self.assertEqual(
+            await self.DB.cookietop.top(1), [(b"1", b'{"cookies": 5, "upgrade": 2}')]
+        )
+
+    async def test_leaderboard_rebuild(self):
+        await self.DB.wins.put(b"1", b'{"highestwin": 3, "highestlose": 1}')
+        await self.DB.streaktop.index.write(
+            deletes=await self.DB.streaktop.index.keys()
+        )
+        await self.DB.close()
+
+        self.DB = Database(self.directory.name)
+
+        self.assertEqual(len(await self.DB.streaktop.top(10)), 1)
+
+    async def test_buffered_counts(self):
+        await self.DB.message_count.put(b"1-1", b"5")
+
+        for _ in range(3):
+            self.DB.count(self.DB.message_count, b"1-1")
+        await self.DB.add_karma(1, -2)
+
+        self.assertEqual(await self.DB.message_count.get(b"1-1"), b"5")
+        self.assertEqual(await self.DB.get_count(self.DB.message_count, b"1-1"), 8)
+        self.assertEqual(await self.DB.get_count(self.DB.karma, b"1"), -2)
+
+        await self.DB.flush()
+
+        self.assertEqual(self.DB.counts, {})
+        self.assertEqual(await self.DB.message_count.get(b"1-1"), INT.encode(8))
+        self.assertEqual(await self.DB.messagetop.top(1, 1), [(b"1-1", 8)])
+
+    async def test_blacklist(self):
+        await self.DB.set_blacklist(1, b"2")
+        await self.DB.set_blacklist(2, b"1", 10)
+
+        self.assertEqual(self.DB.get_blacklist(1), b"2")
+        self.assertEqual(self.DB.get_blacklist(2, 10), b"1")
+        self.assertIsNone(self.DB.get_blacklist(2, 11))
+
+        await self.DB.set_blacklist(1, None)
+        self.DB.load_blacklist()
+
+        self.assertEqual(self.DB.blacklisted, {(10, 2): b"1"})
+
+        await self.DB.clear_blacklist()
+        self.assertEqual(await self.DB.blacklist.keys(), [])
+
+    async def test_guild_settings(self):
+        await self.DB.main.write(
+            [
+                (b"1-disabled_channels", b'{"1": [5, 6]}'),
+                (b"1-logging", b"1"),
+                (b"1-ping", b"1"),
+                (b"1-7-lock", b"1"),
+                (b"1-rules", b'["Be nice"]'),
+            ]
+        )
+
+        settings = await self.DB.get_guild_settings(1)
+
+        self.assertEqual(settings.disabled_channels, {5, 6})
+        self.assertEqual(settings.disabled_commands, {"ping"})
+        self.assertFalse(settings.logging)
+        self.assertIs(await self.DB.get_guild_settings(1), settings)
+
+        await self.DB.main.delete(b"1-logging")
+        self.DB.invalidate_guild_settings(1)
+
+        self.assertTrue((await self.DB.get_guild_settings(1)).logging)
+        self.assertTrue((await self.DB.get_guild_settings(2)).logging)
+
+        # An invalidation during a load stops the load being cached
+        self.DB.invalidate_guild_settings(1)
+        load = asyncio.create_task(self.DB.get_guild_settings(1))
+        await asyncio.sleep(0)
+        self.DB.invalidate_guild_settings(1)
+        await load
+
+        self.assertNotIn(1, self.DB.guild_settings)
+
+        # Only queued writes to the guilds keys are committed by a load
+        self.DB.write_queue.delay = 60
+        self.DB.main.queue_put(b"3-logging", b"1")
+        self.assertFalse((await self.DB.get_guild_settings(3)).logging)
+
+        self.DB.main.queue_put(b"4-snipe_message", b"{}")
+        self.assertTrue((await self.DB.get_guild_settings(5)).logging)
+        self.assertEqual(len(self.DB.write_queue.pending), 1)
+
+    async def test_polls(self):
+        await self.DB.add_poll(5, 1, {"🇦": "Yes", "🇧": "No"})
+
+        self.assertTrue(self.DB.add_vote(5, "🇧"))
+        self.assertFalse(self.DB.add_vote(5, "🇨"))
+        self.assertFalse(self.DB.add_vote(6, "🇦"))
+
+        await self.DB.flush()
+        poll = orjson.loads(await self.DB.polls.get(b"5"))
+        self.assertEqual(poll["options"]["🇧"]["count"], 1)
+
+        self.assertEqual(await self.DB.end_poll(5), poll)
+        self.assertIsNone(await self.DB.end_poll(5))
+        self.assertEqual(await self.DB.polls.keys(), [])
+
+    async def test_polls_resume(self):
+        await self.DB.add_poll(5, 1, {"🇦": "Yes"}, 2, 100.0)
+        self.DB.add_vote(5, "🇦")
+        await self.DB.close()
+
+        self.DB = Database(self.directory.name)
+
+        poll = self.DB.active_polls[5]
+        self.assertEqual((poll["channel"], poll["end"]), (2, 100.0))
+        self.assertEqual(poll["options"]["🇦"]["count"], 1)
+        self.assertIn(5, self.DB.reaction_messages)
+
+    async def test_reaction_messages(self):
+        await self.DB.rrole.put(b"10", b"{}")
+        await self.DB.main.put(b"emoji_submissions", b'{"11": {}}')
+        await self.DB.add_poll(12, 1, {"🇦": "Yes"})
+
+        self.DB.load_reaction_messages()
+        self.assertEqual(self.DB.reaction_messages, {10, 11, 12})
+
+        await self.DB.clear_polls()
+        self.assertEqual(self.DB.reaction_messages, {10, 11})
+
+    async def test_history(self):
+        self.DB.history_size = 3
+
+        for content in ("a", "b", "c", "d"):
+            await self.DB.add_history(self.DB.deleted, 1, 2, content)
+        await self.DB.add_history(self.DB.edited, 1, 2, ["e", "f"])
+
+        history = await self.DB.get_history(self.DB.deleted, 1, 2)
+
+        self.assertEqual([content for date, content in history], ["d", "c", "b"])
+        self.assertAlmostEqual(history[0][0], time.time(), delta=5)
+        self.assertEqual(len(await self.DB.get_history(self.DB.deleted, 1, 2, 1)), 1)
+        self.assertEqual(await self.DB.get_history(self.DB.deleted, 1, 2, -1), [])
+
+        self.DB.history_age = -10
+        self.assertEqual(await self.DB.prune_history(chunk=2), 4)
+        self.assertEqual(self.DB.executor.stats["deleted.prune"][0], 2)
+        self.assertEqual(await self.DB.deleted.keys(), [])
+
+    async def test_write_queue(self):
+        queue = self.DB.write_queue
+        self.DB.nicks.queue_put(b"1", b"a")
+        self.DB.main.queue_put(b"2-snipe_message", b"b")
+        self.DB.nicks.queue_delete(b"2")
+
+        # Read before they're committed
+        self.assertEqual(await self.DB.main.get(b"nicks-1"), b"a")
+        self.assertEqual(await self.DB.nicks.get(b"2", b"default"), b"default")
+        self.assertIsNone(self.DB.db.get(b"nicks-1"))
+
+        await asyncio.sleep(queue.delay * 2)
+        self.assertEqual(self.DB.db.get(b"nicks-1"), b"a")
+        self.assertEqual(queue.pending, {})
+        self.assertEqual(self.DB.executor.stats["queue.write"][0], 1)
+
+        # A direct write is newer than a queued one
+        self.DB.nicks.queue_put(b"1", b"old")
+        await self.DB.nicks.put(b"1", b"new")
+        await self.DB.flush()
+        self.assertEqual(await self.DB.nicks.get(b"1"), b"new")
+
+        # Scans commit the queue first
+        self.DB.invites.queue_put(b"code-1", b"3")
+        self.assertEqual(await self.DB.invites.items(), [(b"code-1", b"3")])
+
+    async def test_write_queue_size(self):
+        queue = self.DB.write_queue
+        queue.delay = 60
+
+        for i in range(queue.size):
+            self.DB.nicks.queue_put(str(i).encode(), b"a")
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(queue.pending, {})
+        self.assertEqual(self.DB.executor.stats["queue.write"][0], 1)
+
+        # Closing drains writes that are still waiting
+        self.DB.nicks.queue_put(b"last", b"a")
+        await self.DB.close()
+        self.DB = Database(self.directory.name, backend=self.backend)
+
+        if self.backend != "memory":
+            self.assertEqual(await self.DB.nicks.get(b"last"), b"a")
+
+    async def test_write_queue_retry(self):
+        queue = self.DB.write_queue
+        write = queue.write
+        failures = []
+
+        def fail_once(writes, trims):
+            if not failures:
+                failures.append(len(writes))
+                raise OSError("disk full")
+            write(writes, trims)
+
+        queue.write = fail_once
+        self.DB.nicks.queue_put(b"1", b"a")
+
+        with self.assertLogs("discord", "ERROR"):
+            await asyncio.sleep(queue.delay * 2)
+        await asyncio.sleep(queue.delay * 2)
+
+        self.assertEqual(failures, [1])
+        self.assertEqual(queue.pending, {})
+        self.assertEqual(self.DB.nicks.db.get(b"1"), b"a")
+
+    async def test_scan(self):
+        await self.DB.stocks.write([(str(i).encode(), b"1") for i in range(10)])
+        self.DB.stocks.queue_put(b"9", b"2")
+
+        chunks = []
+        async for chunk in self.DB.stocks.scan(
+            lambda key, value: int(key) if value == b"1" else None, chunk=4
+        ):
+            chunks.append(chunk)
+            # Writes during the scan aren't seen
+            await self.DB.stocks.put(b"8", b"2")
+
+        self.assertEqual(chunks, [[0, 1, 2, 3], [4, 5, 6, 7], [8]])
+
+        items = []
+        async for chunk in self.DB.stocks.scan(start=b"2", stop=b"4", reverse=True):
+            items.extend(chunk)
+        self.assertEqual(items, [(b"3", b"1"), (b"2", b"1")])
+
+    async def test_shared_snapshot(self):
+        await self.DB.stocks.put(b"AAPL", b"1")
+
+        async with self.DB.snapshot() as snapshot:
+            await self.DB.stocks.put(b"AAPL", b"2")
+            await self.DB.crypto.put(b"BTC", b"3")
+
+            stocks = [c async for c in self.DB.stocks.scan(snapshot=snapshot)]
+            crypto = [c async for c in self.DB.crypto.scan(snapshot=snapshot)]
+
+        self.assertEqual(stocks, [[(b"AAPL", b"1")]])
+        self.assertEqual(crypto, [])
+
+    async def test_price_table(self):
+        table = PriceTable([("AAPL", 1.5, -0.5, 100), ("MSFT", 2, 0, 0)])
+        self.assertEqual(table.get("AAPL"), 1.5)
+        self.assertEqual(table.row("AAPL"), (1.5, -0.5, 100))
+        self.assertIsNone(table.get("TSLA"))
+        self.assertEqual(sorted(table), ["AAPL", "MSFT"])
+
+        with self.assertRaises(TypeError):
+            table.price[0] = 3
+
+        # Cold starts read the db
+        stock = {"price": "10.50", "change": "UNCH", "cap": "1,000", "name": "A"}
+        await self.DB.put_stock("AAPL", stock)
+        self.assertEqual(await self.DB.get_stock_price("AAPL"), 10.5)
+        prices = await self.DB.get_prices(self.DB.stocks)
+        self.assertEqual(prices.row("AAPL"), (10.5, 0, 1000))
+
+        # Published tables replace the old one without changing it
+        table = PriceTable([("AAPL", 11, 0.5, 1000)])
+        await self.DB.publish_prices(self.DB.stocks, table)
+        await self.DB.stocks.delete(b"AAPL")
+        self.assertEqual(await self.DB.get_stock_price("AAPL"), 11)
+        self.assertEqual(prices.get("AAPL"), 10.5)
+
+        self.assertIsNone(await self.DB.get_crypto_price("BTC"))
+
+    async def test_price_history(self):
+        history = PriceHistory(3)
+        history.add(0, 1, 10)
+        # Points in the same step replace the newest
+        history.add(5, 2, 10)
+        self.assertEqual(history.points(), [(5, 2)])
+
+        for timestamp in (10, 20, 30):
+            history.add(timestamp, timestamp / 10, 10)
+
+        history = PriceHistory(data=history.to_bytes())
+        self.assertEqual(history.points(), [(10, 1), (20, 2), (30, 3)])
+        self.assertEqual(history.points(25), [(20, 2), (30, 3)])
+        self.assertFalse(history.add(35, 4, 10, replace=False))
+        self.assertEqual(history.points(), [(10, 1), (20, 2), (30, 3)])
+
+        now = int(time.time())
+        table = PriceTable([("AAPL", 1.5, 0, 0), ("MSFT", 2, 0, 0)])
+        await self.DB.record_prices(self.DB.stocks, table, now - 1200)
+        await self.DB.publish_prices(self.DB.stocks, table)
+
+        # Only prices that changed are added
+        table = PriceTable([("AAPL", 1.25, 0, 0), ("MSFT", 2, 0, 0)])
+        await self.DB.record_prices(self.DB.stocks, table, now - 600, chunk=1)
+
+        self.assertEqual(
+            await self.DB.get_price_history(self.DB.stocks, "AAPL", 3600),
+            [(now - 1200, 1.5), (now - 600, 1.25)],
+        )
+        self.assertEqual(
+            await self.DB.get_price_history(self.DB.stocks, "MSFT", 300),
+            [(now - 1200, 2)],
+        )
+
+        # The hourly tier isn't rewritten for a change in the same hour
+        hour = now // 3600 * 3600
+        table = PriceTable([("TSLA", 1, 0, 0)])
+        await self.DB.record_prices(self.DB.stocks, table, hour)
+        await self.DB.publish_prices(self.DB.stocks, table)
+        await self.DB.record_prices(
+            self.DB.stocks, PriceTable([("TSLA", 2, 0, 0)]), hour + 600
+        )
+        history = PriceHistory(
+            data=await self.DB.price_history.get(b"stocks-1h-TSLA")
+        ).points()
+        self.assertEqual(history, [(hour, 1)])
+        history = PriceHistory(
+            data=await self.DB.price_history.get(b"stocks-10m-TSLA")
+        ).points()
+        self.assertEqual(history, [(hour, 1), (hour + 600, 2)])
+        self.assertEqual(await self.DB.get_price_history(self.DB.crypto, "BTC", 60), [])
+
+    async def test_net_worths(self):
+        await self.DB.put_bal(b"1", 100)
+        await self.DB.put_bal(b"2", 50)
+        await self.DB.put_stockbal(b"2", {"AAPL": {"total": 2, "history": []}})
+        await self.DB.publish_prices(
+            self.DB.stocks, PriceTable([("AAPL", 10, 0, 0), ("MSFT", 5, 0, 0)])
+        )
+
+        self.assertEqual(await self.DB.get_net_worth(b"2"), (50, 20, 0))
+        self.assertEqual(await self.DB.get_net_top(1), [(b"1", 100)])
+
+        # Trades update the member without waiting for new prices
+        async with self.DB.transaction(b"2") as txn:
+            txn.put_bal(b"2", 30)
+            txn.put_stockbal(
+                b"2",
+                {
+                    "AAPL": {"total": 2, "history": []},
+                    "MSFT": {"total": 4, "history": []},
+                },
+            )
+        self.assertEqual(await self.DB.get_net_worth(b"2"), (30, 40, 0))
+        self.assertEqual(await self.DB.get_net_top(5), [(b"1", 100), (b"2", 70)])
+
+        await self.DB.publish_prices(self.DB.stocks, PriceTable([("AAPL", 50, 0, 0)]))
+        self.assertEqual(await self.DB.get_net_top(5), [(b"2", 130), (b"1", 100)])
+
+        # An empty refresh keeps the last prices
+        await self.DB.publish_prices(self.DB.stocks, PriceTable([]))
+        self.assertEqual(await self.DB.get_stock_price("AAPL"), 50)
+        self.assertEqual(await self.DB.get_net_worth(b"2"), (30, 100, 0))
+
+        await self.DB.bal.delete(b"1")
+        self.assertEqual(await self.DB.get_net_top(5), [(b"2", 130)])
+        self.assertEqual(await self.DB.get_net_top(0), [])
+
+        # A batch that isn't written doesn't change net worths
+        with self.assertRaises(ValueError):
+            with self.DB.lock, self.DB.db.write_batch(transaction=True) as wb:
+                self.DB.bal.stage(wb, b"3", self.DB.bal.encode(500))
+                raise ValueError
+        self.assertEqual(await self.DB.get_net_top(5), [(b"2", 130)])
+
+    async def test_write_market(self):
+        await self.DB.stocks.write([(b"AAPL", b"1"), (b"MSFT", b"2"), (b"OLD", b"3")])
+
+        # The first refresh compares to the db
+        update = await self.DB.write_market(
+            self.DB.stocks, [(b"AAPL", b"1"), (b"MSFT", b"3"), (b"TSLA", b"4")]
+        )
+        self.assertEqual(
+            (update["changed"], update["unchanged"], update["removed"]), (2, 1, 1)
+        )
+        self.assertEqual(
+            await self.DB.stocks.items(),
+            [(b"AAPL", b"1"), (b"MSFT", b"3"), (b"TSLA", b"4")],
+        )
+
+        update = await self.DB.write_market(
+            self.DB.stocks, [(b"AAPL", b"1"), (b"MSFT", b"3"), (b"TSLA", b"5")]
+        )
+        self.assertEqual(
+            (update["changed"], update["unchanged"], update["removed"]), (1, 2, 0)
+        )
+        self.assertEqual(self.DB.market_updates["stocks"], update)
+        self.assertEqual(await self.DB.stocks.get(b"TSLA"), b"5")
+
+        # An empty refresh doesn't delist everything
+        self.assertIsNone(await self.DB.write_market(self.DB.stocks, []))
+        self.assertEqual(len(await self.DB.stocks.keys()), 3)
+
+    async def test_history_migration(self):
+        await self.DB.deleted.put(b"1-2", b'{"20": "old", "30": "new"}')
+        self.assertEqual(await self.DB.run_migration(1), 1)
+
+        self.assertEqual(
+            await self.DB.get_history(self.DB.deleted, 1, 2), [(30, "new"), (20, "old")]
+        )
+
+    async def test_schema_version(self):
+        self.assertEqual(self.DB.schema_version, max(MIGRATIONS))
+        self.assertEqual(await self.DB.migrate(), {})
+
+        # Databases from before the migrations are at version 1 or 0
+        self.DB.schema_version = 1
+        await self.DB.bal.put(b"1", b"20.5")
+        await self.DB.main.put(b"history_migrated", b"1")
+        await self.DB.main.delete(b"schema_version")
+
+        self.assertEqual(await self.DB.migrate(), {2: 1, 3: 0})
+        self.assertEqual(self.DB.schema_version, 3)
+        self.assertEqual(await self.DB.main.get(b"schema_version"), b"3")
+        self.assertIsNone(await self.DB.main.get(b"history_migrated"))
+
+    async def test_resumed_migration(self):
+        await self.DB.bal.write([(str(i).encode(), b"1.0") for i in range(5)])
+        await self.DB.main.put(
+            b"schema_progress",
+            orjson.dumps({"version": 2, "name": "bal", "start": b"3".hex()}),
+        )
+
+        # Keys before the progress were migrated before it stopped
+        self.assertEqual(await self.DB.run_migration(2, chunk=1), 2)
+        self.assertEqual(await self.DB.bal.get(b"2"), b"1.0")
+        self.assertEqual(await self.DB.bal.get(b"3"), FLOAT.encode(1.0))
+        self.assertIsNone(await self.DB.main.get(b"schema_progress"))
+
+    async def test_codecs(self):
+        for value in (0, 1, -1, 127, 128, -129, 2**40, -(2**63)):
+            self.assertEqual(INT.decode(INT.encode(value)), value)
+        for value in (0.0, -5.5, 1e300):
+            self.assertEqual(FLOAT.decode(FLOAT.encode(value)), value)
+
+        self.assertEqual(INT.encode(-12), b"-12")
+        self.assertEqual(INT.score(b"\x01\xfc"), (-4,))
+        self.assertEqual(FLOAT.decode(b"20.5"), 20.5)
+        self.assertEqual(
+            FLOAT.decode_packed([FLOAT.encode(1.5), FLOAT.encode(-2.0)]), [1.5, -2.0]
+        )
+
+    async def test_value_migration(self):
+        await self.DB.bal.write([(b"1", b"20.5"), (b"2", FLOAT.encode(30.0))])
+        await self.DB.karma.put(b"1", b"-4")
+
+        self.assertEqual(await self.DB.get_bal(b"1"), 20.5)
+        # Counters are left as text
+        self.assertEqual(await self.DB.run_migration(2, chunk=1), 1)
+        self.assertEqual(await self.DB.run_migration(2), 0)
+
+        self.assertEqual(await self.DB.bal.get(b"1"), FLOAT.encode(20.5))
+        self.assertEqual(await self.DB.get_baltop(2), [(30.0, 2), (20.5, 1)])
+        self.assertEqual(await self.DB.karmatop.top(1), [(b"1", -4)])
+        self.assertEqual(len(await self.DB.baltop.index.keys()), 2)
+        self.assertEqual(self.DB.dump_value(b"karma-1", INT.encode(-4)), -4)
+
+    async def test_counter_migration(self):
+        # Counters packed by version 2 as a version byte and a signed int
+        await self.DB.karma.write([(b"1", b"\x01\xfc"), (b"2", b"7")])
+        await self.DB.message_count.put(b"1-1", b"\x01\x01\x00")
+
+        self.assertEqual(await self.DB.run_migration(3, chunk=1), 2)
+        self.assertEqual(await self.DB.karma.get(b"1"), b"-4")
+        self.assertEqual(await self.DB.message_count.get(b"1-1"), b"256")
+        self.assertEqual(await self.DB.karmatop.top(5), [(b"2", 7), (b"1", -4)])
+        self.assertEqual(len(await self.DB.karmatop.index.keys()), 2)
+
+    async def test_backup(self):
+        await self.DB.put_bal(b"1", 20.5)
+        await self.DB.karma.put(b"1", INT.encode(3))
+        await self.DB.crypto.put(b"BTC", b'{"price": 1}')
+        await self.DB.main.put(b"cryptobal-1", b"{}")
+
+        stats = await self.DB.backup(self.backups, (b"crypto-",))
+
+        with gzip.open(stats["path"]) as file:
+            lines = [orjson.loads(line) for line in file]
+
+        self.assertEqual(lines[0]["type"], "full")
+        self.assertEqual(
+            lines[1:-1],
+            [
+                ["bal-1", 20.5],
+                ["cryptobal-1", "{}"],
+                ["karma-1", 3],
+                ["schema_version", "3"],
+            ],
+        )
+        self.assertEqual(lines[-1]["keys"], 4)
+        self.assertEqual(self.DB.verify_backup(stats["path"])[1], 4)
+        self.assertEqual(stats["keys"], 4)
+        self.assertIsNone(self.DB.backup_progress)
+        self.assertEqual(orjson.loads(await self.DB.main.get(b"last_backup")), stats)
+        self.assertEqual(prefix_end(b"crypto-"), b"crypto.")
+
+    async def test_incremental_backup(self):
+        # Changes before a full backup aren't known after a restart
+        stats = await self.DB.backup(self.backups, full=False)
+        self.assertEqual(stats["type"], "full")
+
+        await self.DB.put_bal(b"1", 20.5)
+        await self.DB.main.delete(b"schema_version")
+        await self.DB.add_history(self.DB.deleted, 1, 2, "a")
+
+        stats = await self.DB.backup(self.backups, full=False)
+
+        with gzip.open(stats["path"]) as file:
+            changes = dict(orjson.loads(line) for line in file.readlines()[1:-1])
+
+        history = await self.DB.deleted.keys()
+
+        self.assertEqual(stats["type"], "incremental")
+        self.assertEqual(changes["bal-1"], 20.5)
+        self.assertEqual(changes[f"deleted-{history[0].decode()}"], '"a"')
+        self.assertIsNone(changes["schema_version"])
+        # Written after the full backup
+        self.assertIn("last_backup", changes)
+        self.assertEqual(len(changes), 4)
+
+    async def test_restore(self):
+        await self.DB.put_bal(b"1", 20.5)
+        await self.DB.add_karma(1, 3)
+        await self.DB.set_blacklist(5, b"1")
+        await self.DB.stocks.put(b"AAPL", b'{"price": 1}')
+        await self.DB.backup(self.backups, (b"stocks-",))
+
+        await self.DB.put_bal(b"2", 30.0)
+        await self.DB.karma.delete(b"1")
+        await self.DB.backup(self.backups, (b"stocks-",), full=False)
+
+        await self.DB.put_bal(b"1", 1.0)
+        await self.DB.put_bal(b"3", 1.0)
+        await self.DB.set_blacklist(5, None)
+        await self.DB.stocks.put(b"MSFT", b'{"price": 2}')
+        await self.DB.add_poll(12, 1, {"🇦": "Yes"})
+
+        self.DB.schema_version = 0
+
+        chain = backup_chain(self.backups)
+        restore = asyncio.create_task(self.DB.restore(chain))
+
+        # Writes made once the restore started are to keys it replaces
+        while not self.DB.flush_lock.locked():
+            await asyncio.sleep(0)
+        self.DB.count(self.DB.karma, b"1", 5)
+        self.DB.nicks.queue_put(b"1", b"a")
+        stats = await restore
+
+        # The caches are reloaded on the executor
+        self.assertEqual(self.DB.executor.stats["restore.load"][0], 1)
+        self.assertNotIn(12, self.DB.active_polls)
+        self.assertNotIn(12, self.DB.reaction_messages)
+        self.assertEqual(self.DB.schema_version, max(MIGRATIONS))
+        self.assertEqual(await self.DB.get_count(self.DB.karma, b"1"), 0)
+        self.assertIsNone(await self.DB.nicks.get(b"1"))
+
+        self.assertEqual(len(chain), 2)
+        self.assertEqual(stats["backups"], 2)
+        self.assertEqual(await self.DB.get_baltop(5), [(30.0, 2), (20.5, 1)])
+        self.assertEqual(await self.DB.karmatop.top(5), [])
+        self.assertEqual(self.DB.get_blacklist(5), b"1")
+        self.assertEqual(len(await self.DB.stocks.keys()), 2)
+
+        # The next backup has to be full as the journal doesn't cover the restore
+        stats = await self.DB.backup(self.backups, full=False)
+        self.assertEqual(stats["type"], "full")
+
+    async def test_restore_price_history(self):
+        table = PriceTable([("AAPL", 1.5, 0, 0)])
+        await self.DB.record_prices(self.DB.stocks, table, 1000)
+        history = await self.DB.price_history.get(b"stocks-10m-AAPL")
+
+        # Packed histories aren't utf-8
+        value = self.DB.dump_value(b"price_history-stocks-10m-AAPL", history)
+        self.assertIsInstance(value, dict)
+
+        await self.DB.backup(self.backups)
+        await self.DB.price_history.delete(b"stocks-10m-AAPL")
+        await self.DB.restore(backup_chain(self.backups))
+
+        self.assertEqual(await self.DB.price_history.get(b"stocks-10m-AAPL"), history)
+        self.assertEqual(
+            await self.DB.get_price_history(self.DB.stocks, "AAPL", 600), [(1000, 1.5)]
+        )
+
+    async def test_restore_prices(self):
+        stock = b'{"price": "1", "change": "0", "cap": "0"}'
+        await self.DB.write_market(self.DB.stocks, [(b"AAPL", stock)])
+        await self.DB.backup(self.backups)
+
+        await self.DB.write_market(self.DB.stocks, [(b"AAPL", stock), (b"MSFT", stock)])
+        await self.DB.publish_prices(
+            self.DB.stocks, PriceTable([("AAPL", 1, 0, 0), ("MSFT", 1, 0, 0)])
+        )
+        await self.DB.restore(backup_chain(self.backups))
+
+        # The cached prices and hashes were from after the backup
+        self.assertIsNone(await self.DB.get_stock_price("MSFT"))
+        update = await self.DB.write_market(
+            self.DB.stocks, [(b"AAPL", stock), (b"MSFT", stock)]
+        )
+        self.assertEqual(update["changed"], 1)
+
+    async def test_restore_corrupted(self):
+        await self.DB.put_bal(b"1", 20.5)
+        stats = await self.DB.backup(self.backups)
+        await self.DB.put_bal(b"1", 30.0)
+
+        with gzip.open(stats["path"]) as file:
+            data = file.read()
+        with gzip.open(stats["path"], "wb") as file:
+            file.write(data.replace(b"20.5", b"25.5"))
+
+        with self.assertRaises(ValueError):
+            await self.DB.restore([stats["path"]])
+
+        with gzip.open(stats["path"], "wb") as file:
+            file.write(data[:-10])
+
+        with self.assertRaises(ValueError):
+            await self.DB.restore([stats["path"]])
+
+        self.assertEqual(await self.DB.get_bal(b"1"), 30.0)
+
+    async def test_prune_backups(self):
+        for name in ("1-full", "2-incremental", "3-full", "4-full", "5-incremental"):
+            open(f"{self.backups}/{name}.ndjson.gz", "w").close()
+
+        self.assertEqual(
+            backup_chain(self.backups),
+            [
+                f"{self.backups}/4-full.ndjson.gz",
+                f"{self.backups}/5-incremental.ndjson.gz",
+            ],
+        )
+
+        prune_backups(self.backups, 2)
+
+        self.assertEqual(
+            backup_files(self.backups),
+            ["3-full.ndjson.gz", "4-full.ndjson.gz", "5-incremental.ndjson.gz"],
+        )
+        self.assertEqual(backup_files(f"{self.backups}/missing"), [])
+
+    async def test_compact(self):
+        for price in range(5):
+            await self.DB.stocks.write(
+                [(str(i).encode(), orjson.dumps({"price": price})) for i in range(500)]
+            )
+
+        stats = await self.DB.compact([b"stocks-"])
+
+        # Small writes are still in the memtable so only the after size is known
+        self.assertGreater(stats["prefixes"]["stocks-"]["size"][1], 0)
+        self.assertEqual(len(stats["disk"]), 2)
+        self.assertEqual(len(await self.DB.stocks.keys()), 500)
+        self.assertEqual(
+            orjson.loads(await self.DB.main.get(b"last_compaction")), stats
+        )
+
+
+class MemoryDatabaseTests(DatabaseTests):
+    backend = "memory"
+
+    @unittest.skip("The memory backend isn't kept after closing")
+    async def test_baltop_rebuild(self):
+        pass
+
+    @unittest.skip("The memory backend isn't kept after closing")
+    async def test_leaderboard_rebuild(self):
+        pass
+
+    @unittest.skip("The memory backend isn't kept after closing")
+    async def test_polls_resume(self):
+        pass